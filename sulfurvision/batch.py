@@ -0,0 +1,523 @@
+"""
+Headless rendering of GUI projects, for render nodes and scheduled jobs
+"""
+
+import argparse
+import dataclasses
+import json
+import os
+from os import path
+import sys
+import time
+import typing
+
+import numpy as np
+
+from sulfurvision import checkpoint, prng, sinks
+from sulfurvision.project import Project
+
+if typing.TYPE_CHECKING:
+    from sulfurvision import estimate, export
+
+
+# Frames plotting less than this fraction of their samples are flagged as wasteful
+WASTEFUL_EFFICIENCY = 0.5
+
+
+@dataclasses.dataclass
+class RenderSettings:
+    """Everything about how frames are rendered that is not part of the frames themselves."""
+
+    width: int
+    height: int
+    supersample: int
+    particles: int
+    iters: int
+    skip: int
+    # Motion blur: frames sampled across a shutter open for this fraction of the frame interval
+    subframes: int = 1
+    shutter: float = 0.0
+    # One of prng.GENERATORS; with Philox, each frame is reproducible from its index alone
+    generator: str = prng.LCG32
+    # Keys every random number of a Philox render; LCG renders are seeded through numpy
+    seed: int = prng.DEFAULT_SEED
+
+    @staticmethod
+    def from_project(project: Project, **overrides) -> "RenderSettings":
+        settings = RenderSettings(
+            project.width,
+            project.height,
+            project.supersample,
+            project.seeds,
+            project.iters,
+            project.skip,
+        )
+        for key, value in overrides.items():
+            if value is not None:
+                setattr(settings, key, value)
+        return settings
+
+
+@dataclasses.dataclass
+class FrameTiming:
+    """When frames overlap, render_seconds runs from enqueueing a frame until its pixels are read back."""
+
+    index: int
+    time: float
+    render_seconds: float
+    save_seconds: float = 0.0
+    # render.RenderStats.to_dict(), when rendering collects stats
+    stats: typing.Optional[dict[str, typing.Any]] = None
+
+
+def schedule(
+    project: Project,
+    time: typing.Optional[float] = None,
+    start: typing.Optional[float] = None,
+    end: typing.Optional[float] = None,
+    rate: typing.Optional[float] = None,
+) -> list[tuple[int, float]]:
+    """Return (frame index, time) pairs to render.
+    A single time yields index -1. Otherwise, frames are taken from the GUI's animation
+    schedule and filtered to start <= t <= end, keeping their indices in the full animation.
+    """
+    if time is not None:
+        return [(-1, time)]
+    times = project.frame_times(rate)
+    return [
+        (i, float(t))
+        for i, t in enumerate(times)
+        if (start is None or t >= start) and (end is None or t <= end)
+    ]
+
+
+def frame_filename(index: int, t: float, ext: str = "png") -> str:
+    if index < 0:
+        return f"still_{t:.4f}.{ext}"
+    return f"frame_{index:06}.{ext}"
+
+
+def shutter_frames(
+    project: Project,
+    settings: RenderSettings,
+    t: float,
+    rate: float,
+    subframes: typing.Optional[int] = None,
+) -> list:
+    """The frames to motion blur the frame at t across, or none if motion blur is off."""
+    subframes = settings.subframes if subframes is None else subframes
+    if subframes <= 1 or settings.shutter <= 0:
+        return []
+    return project.shutter_frames(t, settings.shutter / rate, subframes)
+
+
+def auto_frame(project: Project, aspect: float) -> Project:
+    """A copy of project with every keyframe's camera fitted to its flame by framing.auto_camera,
+    for images of aspect ratio width / height.
+    """
+    from sulfurvision import framing
+
+    return dataclasses.replace(
+        project,
+        frames=[
+            dataclasses.replace(frame, camera=framing.auto_camera(frame, aspect))
+            for frame in project.frames
+        ],
+    )
+
+
+def estimate_project(
+    project: Project, settings: RenderSettings, jobs: typing.Sequence[tuple[int, float]]
+) -> "estimate.Estimate":
+    """Predict what rendering the jobs of a project with render_project takes,
+    calibrated with the first job's frame.
+    """
+    from sulfurvision import estimate
+
+    return estimate.estimate(
+        project.frame_at(jobs[0][1]),
+        settings.width,
+        settings.height,
+        settings.supersample,
+        settings.particles,
+        settings.iters,
+        frames=len(jobs),
+        # The exporter resolves each frame into one of two pixel buffers
+        pixel_buffers=2,
+    )
+
+
+def render_project(
+    project: Project,
+    settings: RenderSettings,
+    jobs: typing.Sequence[tuple[int, float]],
+    output: str,
+    ext: str = "png",
+    verbose: bool = True,
+    rate: typing.Optional[float] = None,
+    encoders: typing.Optional[int] = None,
+    profile: bool = False,
+    stats: bool = False,
+) -> "export.ExportStats":
+    """Render each (index, time) pair of a project with one persistent Renderer.
+    The output is either a directory of images, or a single animation file whose
+    extension is one of sinks.STREAM_EXTENSIONS.
+    Each frame's chaos game overlaps the readback and encoding of the frame before it.
+    With profile, the stats include how long each stage of rendering took on the device,
+    and with stats, each frame's timing includes where its samples went.
+    """
+    from sulfurvision import export
+    from sulfurvision.cl import krnl, render
+
+    renderer = render.Renderer(
+        settings.width,
+        settings.height,
+        settings.supersample,
+        settings.particles,
+        project.n_colors,
+        project.n_transforms,
+        seed=settings.seed,
+        generator=settings.generator,
+        profile=profile,
+        stats=stats,
+    )
+    rate = rate or project.rate
+    times = dict(jobs)
+    sink = sinks.open_sink(
+        output, rate, ext, lambda index: frame_filename(index, times[index], ext)
+    )
+    # Interpolated frames only use variations that some keyframe does
+    envelope = np.abs(project.timeline.values).max(axis=0)
+    n_symmetry = max(len(frame.cameras()) for frame in project.frames)
+    subframes = min(
+        settings.subframes,
+        renderer.max_subframes(
+            krnl.pack_transforms_from(project.timeline.layout, envelope), n_symmetry
+        ),
+    )
+    exporter = export.AnimationExporter(renderer, sink, encoders, verbose=verbose)
+    with sink:
+        return exporter.export(
+            (
+                (
+                    index,
+                    t,
+                    project.frame_at(t),
+                    shutter_frames(project, settings, t, rate, subframes),
+                )
+                for index, t in jobs
+            ),
+            settings.iters,
+            settings.skip,
+        )
+
+
+def render_checkpointed(
+    project: Project,
+    settings: RenderSettings,
+    t: float,
+    dpath: str,
+    every: typing.Optional[int] = None,
+    resume: bool = False,
+    verbose: bool = True,
+    rate: typing.Optional[float] = None,
+):
+    """Render one frame, saving the raw histogram to a checkpoint directory after every
+    `every` iterations and once at the end. With resume, continue from an existing checkpoint.
+    Returns the final image.
+    """
+    from sulfurvision.cl import render
+
+    frame = project.frame_at(t)
+    renderer = render.Renderer(
+        settings.width,
+        settings.height,
+        settings.supersample,
+        settings.particles,
+        len(frame.palette),
+        len(frame.transforms),
+        seed=settings.seed,
+        generator=settings.generator,
+    )
+    done = 0
+    if resume and checkpoint.exists(dpath):
+        ckpt = renderer.load_checkpoint(dpath)
+        done = ckpt.meta["iters_done"]
+        # Carry on with the random numbers the checkpoint was rendered with
+        renderer.generator = ckpt.meta.get("generator", renderer.generator)
+        renderer.seed = ckpt.meta.get("seed", renderer.seed)
+        if verbose:
+            print(f"Resuming from {dpath} after {done} iterations")
+    else:
+        renderer.reset()
+        renderer.randomize_particles()
+    camera = renderer.frame_cameras(frame)
+    subframes = renderer.shutter_subframes(
+        shutter_frames(project, settings, t, rate or project.rate)
+    )
+    every = every or settings.iters
+    while True:
+        iters = min(every, settings.iters - done)
+        if iters > 0:
+            renderer.chaos_game_from(
+                camera, frame.transforms, frame.palette, done, iters, settings.skip, subframes
+            )
+            done += iters
+        renderer.save_checkpoint(
+            dpath,
+            iters_done=done,
+            iters=settings.iters,
+            skip=settings.skip,
+            generator=renderer.generator,
+            seed=renderer.seed,
+            time=t,
+            frame=frame.to_dict(),
+        )
+        if verbose:
+            print(f"Checkpointed {done}/{settings.iters} iterations to {dpath}")
+        if done >= settings.iters:
+            break
+    return renderer.image(frame.vibrancy, frame.gamma, frame.brightness)
+
+
+def summarize(
+    timings: typing.Sequence[FrameTiming],
+    wall_seconds: float,
+    settings: RenderSettings,
+    device_seconds: typing.Optional[float] = None,
+    stages: typing.Optional[dict[str, typing.Any]] = None,
+) -> dict[str, typing.Any]:
+    render_total = sum(map(lambda x: x.render_seconds, timings))
+    save_total = sum(map(lambda x: x.save_seconds, timings))
+    summary = {
+        "settings": dataclasses.asdict(settings),
+        "frames": len(timings),
+        "wall_seconds": wall_seconds,
+        "render_seconds": render_total,
+        "save_seconds": save_total,
+        "mean_render_seconds": render_total / len(timings) if timings else 0.0,
+        "frames_per_second": len(timings) / wall_seconds if wall_seconds > 0 else 0.0,
+        "timings": [dataclasses.asdict(timing) for timing in timings],
+    }
+    if device_seconds is not None:
+        summary["device_seconds"] = device_seconds
+        summary["device_utilisation"] = device_seconds / wall_seconds if wall_seconds > 0 else 0.0
+    if stages is not None:
+        summary["stages"] = {stage: dataclasses.asdict(stats) for stage, stats in stages.items()}
+    counted = [timing for timing in timings if timing.stats is not None]
+    if counted:
+        totals = {
+            key: sum(timing.stats[key] for timing in counted)
+            for key in ("plotted", "off_canvas", "nonfinite", "warmup")
+        }
+        samples = sum(totals.values())
+        totals["reseeded"] = sum(timing.stats["reseeded"] for timing in counted)
+        totals["efficiency"] = totals["plotted"] / samples if samples else 0.0
+        summary["stats"] = totals
+        summary["wasteful_frames"] = [
+            timing.index for timing in counted if timing.stats["efficiency"] < WASTEFUL_EFFICIENCY
+        ]
+    return summary
+
+
+def add_settings_arguments(parser: argparse.ArgumentParser):
+    """Options that override the render settings stored in a project."""
+    parser.add_argument("--rate", type=float, help="Frames per unit of time")
+    parser.add_argument("-W", "--width", type=int)
+    parser.add_argument("-H", "--height", type=int)
+    parser.add_argument("-s", "--supersample", type=int)
+    parser.add_argument("-p", "--particles", type=int)
+    parser.add_argument("-i", "--iters", type=int)
+    parser.add_argument("--skip", type=int)
+    parser.add_argument("--format", default="png", help="Image file extension")
+    parser.add_argument(
+        "--subframes", type=int, help="Sub-frames to motion blur each frame across"
+    )
+    parser.add_argument(
+        "--shutter",
+        type=float,
+        help="Fraction of the frame interval the shutter is open for, e.g. 0.5 for 180 degrees",
+    )
+    parser.add_argument(
+        "--generator",
+        choices=prng.GENERATORS,
+        help="Random number generator for the chaos game",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="Seed for the chaos game's random numbers, for reproducible renders",
+    )
+
+
+def settings_from_args(project: Project, args: argparse.Namespace) -> RenderSettings:
+    return RenderSettings.from_project(
+        project,
+        width=args.width,
+        height=args.height,
+        supersample=args.supersample,
+        particles=args.particles,
+        iters=args.iters,
+        skip=args.skip,
+        subframes=args.subframes,
+        shutter=args.shutter,
+        generator=args.generator,
+        seed=args.seed,
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="sulfurvision-render",
+        description="Render a project exported from the GUI without a display.",
+    )
+    parser.add_argument("project", help="Project JSON file exported from the GUI")
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=".",
+        help="Directory to write images to, or an animation file "
+        f"({', '.join(sinks.STREAM_EXTENSIONS)}) to stream every frame into",
+    )
+    when = parser.add_mutually_exclusive_group()
+    when.add_argument("-t", "--time", type=float, help="Render a single frame at this time")
+    when.add_argument(
+        "--start", type=float, help="Only render animation frames at or after this time"
+    )
+    parser.add_argument(
+        "--end", type=float, help="Only render animation frames at or before this time"
+    )
+    add_settings_arguments(parser)
+    parser.add_argument(
+        "--encoders", type=int, help="Threads encoding frames while the device renders"
+    )
+    parser.add_argument(
+        "--summary",
+        help="Where to write the JSON timing summary (default: OUTPUT/summary.json)",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        help="With --time, save the raw histogram to this directory as the render progresses",
+    )
+    parser.add_argument(
+        "--checkpoint-every", type=int, help="Iterations between checkpoints"
+    )
+    parser.add_argument(
+        "--resume", action="store_true", help="Continue from an existing --checkpoint"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Time each stage of rendering on the device and add it to the summary",
+    )
+    parser.add_argument(
+        "--auto-camera",
+        action="store_true",
+        help="Fit every keyframe's camera to its flame with a short pilot run before rendering",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Count where each frame's samples go, and flag frames that waste most of them",
+    )
+    parser.add_argument(
+        "--estimate",
+        action="store_true",
+        help="Print the memory and time the render would take, and what to change "
+        "if the device cannot hold it, without rendering; exits with 1 if it cannot",
+    )
+    parser.add_argument("-q", "--quiet", action="store_true")
+    return parser
+
+
+def main(argv: typing.Optional[typing.Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.end is not None and args.time is not None:
+        print("--end cannot be combined with --time", file=sys.stderr)
+        return 2
+    if args.checkpoint is not None and args.time is None:
+        print("--checkpoint requires --time", file=sys.stderr)
+        return 2
+    project = Project.load(args.project)
+    settings = settings_from_args(project, args)
+    if args.auto_camera:
+        project = auto_frame(project, settings.width / settings.height)
+    jobs = schedule(project, args.time, args.start, args.end, args.rate)
+    if not jobs:
+        print("Nothing to render", file=sys.stderr)
+        return 1
+    if args.estimate:
+        prediction = estimate_project(project, settings, jobs)
+        print(json.dumps(prediction.to_dict(), indent=2))
+        if prediction.error is not None:
+            print(prediction.error, file=sys.stderr)
+        return 0 if prediction.fits else 1
+    if args.seed is not None:
+        # LCG renders place their particles with numpy
+        np.random.seed(args.seed)
+    streaming = path.splitext(args.output)[1].lower() in sinks.STREAM_EXTENSIONS
+    if streaming and args.checkpoint is not None:
+        print("--checkpoint writes a single image, so --output must be a directory", file=sys.stderr)
+        return 2
+    if not streaming:
+        os.makedirs(args.output, exist_ok=True)
+
+    start = time.perf_counter()
+    if args.checkpoint is not None:
+        img = render_checkpointed(
+            project,
+            settings,
+            args.time,
+            args.checkpoint,
+            args.checkpoint_every,
+            args.resume,
+            not args.quiet,
+            args.rate,
+        )
+        img.save(path.join(args.output, frame_filename(-1, args.time, args.format)))
+        timings = [FrameTiming(-1, args.time, time.perf_counter() - start)]
+        device_seconds = stages = None
+    else:
+        stats = render_project(
+            project,
+            settings,
+            jobs,
+            args.output,
+            args.format,
+            not args.quiet,
+            args.rate,
+            args.encoders,
+            args.profile,
+            args.stats,
+        )
+        timings, device_seconds, stages = stats.timings, stats.device_seconds, stats.stages
+    summary = summarize(timings, time.perf_counter() - start, settings, device_seconds, stages)
+
+    if args.summary is not None:
+        summary_path = args.summary
+    elif streaming:
+        summary_path = path.splitext(args.output)[0] + ".summary.json"
+    else:
+        summary_path = path.join(args.output, "summary.json")
+    with open(summary_path, "w") as file:
+        json.dump(summary, file, indent=2)
+    print(
+        f"Rendered {summary['frames']} frames in {summary['wall_seconds']:.3f}s "
+        f"({summary['frames_per_second']:.3f} frames/s"
+        + (
+            f", device {summary['device_utilisation']:.0%} busy)"
+            if "device_utilisation" in summary
+            else ")"
+        )
+    )
+    if summary.get("wasteful_frames"):
+        print(
+            f"{len(summary['wasteful_frames'])} frames plotted less than "
+            f"{WASTEFUL_EFFICIENCY:.0%} of their samples; see {summary_path}",
+            file=sys.stderr,
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,419 @@
+"""
+Throughput benchmarks of the CPU and OpenCL render paths, for catching performance regressions
+
+Every benchmark renders canned reference flames and reports one or more named metrics.
+Results are written as JSON and may be compared against a baseline written the same way:
+    sulfurvision-bench -o baseline.json
+    sulfurvision-bench --baseline baseline.json
+"""
+
+import argparse
+import dataclasses
+import json
+import platform
+import sys
+import time
+import typing
+
+import numpy as np
+
+from sulfurvision import pysulfur, sinks, variations
+from sulfurvision.frames import RenderFrame
+from sulfurvision.project import Project
+
+# Fractional slowdown beyond which compare reports a metric as a regression
+DEFAULT_TOLERANCE = 0.1
+
+
+def _transform(
+    weights: dict[str, float],
+    affine: typing.Sequence[float],
+    color: float,
+    params: typing.Optional[dict[str, list[float]]] = None,
+) -> pysulfur.Transform:
+    return pysulfur.Transform(
+        variations.Variation.as_weights(weights),
+        variations.Variation.as_params(params or {}),
+        np.array(affine, dtype=np.float64),
+        1,
+        color,
+    )
+
+
+def sierpinski() -> list[pysulfur.Transform]:
+    linear = {variations.variation_linear.name: 1}
+    return [
+        _transform(linear, (0.5, 0, 0, 0, 0.5, 0), 0),
+        _transform(linear, (0.5, 0, 0.5, 0, 0.5, 0), 1),
+        _transform(linear, (0.5, 0, 0, 0, 0.5, 0.5), 2),
+    ]
+
+
+def julia_pdj() -> list[pysulfur.Transform]:
+    """The flame of tests/test_render.py."""
+    pdj = {variations.variation_pdj.name: [1, -0.5, 1.5, 0.7]}
+    pdj_fisheye = {variations.variation_pdj.name: 1, variations.variation_fisheye.name: 2}
+    return [
+        _transform(
+            {variations.variation_julia.name: 1, variations.variation_polar.name: 2},
+            (1, 0, 0, 0, 1, 0),
+            0,
+        ),
+        _transform(pdj_fisheye, (0.5, 0, 0.45, 0, 0.5, 0), 1, pdj),
+        _transform(pdj_fisheye, (0.5, 0, -0.05, 0, 0.5, 0.55), 2, pdj),
+    ]
+
+
+def heavy() -> list[pysulfur.Transform]:
+    """Eight transforms of six variations each, together using every variation."""
+    names = [variation.name for variation in variations.Variation.variations]
+    rng = np.random.default_rng(2024)
+    transforms = []
+    for i in range(8):
+        chosen = [names[(i * 6 + j) % len(names)] for j in range(6)]
+        affine = rng.uniform(-0.8, 0.8, 6)
+        transforms.append(
+            _transform({name: 1 + j for j, name in enumerate(chosen)}, affine, i % 3)
+        )
+    return transforms
+
+
+REFERENCE_FLAMES: dict[str, typing.Callable[[], list[pysulfur.Transform]]] = {
+    "sierpinski": sierpinski,
+    "julia_pdj": julia_pdj,
+    "heavy": heavy,
+}
+# Many variations have no pure Python implementation, so pysulfur cannot plot the heavy flame
+CPU_FLAMES = ("sierpinski", "julia_pdj")
+
+_PALETTE = [
+    np.array([0, 255, 255, 1.0]),
+    np.array([255, 0, 255, 1.0]),
+    np.array([255, 255, 0, 1.0]),
+]
+_CAMERA = np.array([0.5, 0, 0.5, 0, 0.5, 0.5])
+
+
+def reference_frame(name: str, time: float = 0) -> RenderFrame:
+    frame = RenderFrame(REFERENCE_FLAMES[name](), list(_PALETTE), _CAMERA.copy(), time)
+    frame.normalize()
+    return frame
+
+
+@dataclasses.dataclass
+class Metric:
+    value: float
+    unit: str
+    higher_is_better: bool = True
+
+
+@dataclasses.dataclass
+class BenchConfig:
+    """Sizes of every benchmark. QUICK is small enough for a smoke test."""
+
+    cpu_particles: int = 16
+    cpu_iters: int = 200
+    particle_counts: tuple[int, ...] = (1024, 16384, 131072)
+    chaos_iters: int = 1000
+    resolutions: tuple[tuple[int, int], ...] = ((640, 480), (1920, 1080), (3840, 2160))
+    frames: int = 8
+    frame_size: tuple[int, int] = (320, 240)
+    frame_particles: int = 16384
+    frame_iters: int = 500
+    repeat: int = 3
+
+
+QUICK = BenchConfig(
+    cpu_particles=4,
+    cpu_iters=50,
+    particle_counts=(256,),
+    chaos_iters=50,
+    resolutions=((64, 48),),
+    frames=2,
+    frame_size=(32, 24),
+    frame_particles=256,
+    frame_iters=50,
+    repeat=1,
+)
+
+
+def _best_of(repeat: int, func: typing.Callable[[], typing.Any]) -> float:
+    """The shortest wall time of repeat calls, which is the least disturbed by other load."""
+    best = float("inf")
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_cpu(config: BenchConfig) -> dict[str, Metric]:
+    """Samples per second of the pure Python Flame.plot."""
+    results = {}
+    for name in CPU_FLAMES:
+        flame = pysulfur.Flame(
+            REFERENCE_FLAMES[name](), lambda color: _PALETTE[int(color) % 3], _CAMERA
+        )
+        seconds = _best_of(
+            config.repeat,
+            lambda: flame.plot((64, 64, 4), (config.cpu_particles, 1), config.cpu_iters, 0),
+        )
+        results[f"cpu.{name}.samples_per_second"] = Metric(
+            config.cpu_particles * config.cpu_iters / seconds, "samples/s"
+        )
+    return results
+
+
+def bench_build(config: BenchConfig) -> dict[str, Metric]:
+    """Seconds to build the kernels from source, cold and from pyopencl's cache.
+    Drivers that compile lazily, such as pocl, defer part of a cold build to the first launch.
+    """
+    import pyopencl as cl
+
+    from sulfurvision.cl import krnl, render
+
+    render.Renderer._init_cl()
+    ctx, device = render.Renderer._ctx, render.Renderer._device
+    src = krnl.combine_source(device)
+
+    def cold():
+        # A unique comment defeats both pyopencl's and the driver's program caches
+        cl.Program(ctx, f"{src}\n// {time.time_ns()}").build()
+
+    results = {
+        "build.combine_source.seconds": Metric(
+            _best_of(config.repeat, lambda: krnl.combine_source(device)), "s", False
+        ),
+        "build.cold.seconds": Metric(_best_of(config.repeat, cold), "s", False),
+    }
+    cl.Program(ctx, src).build()
+    results["build.cached.seconds"] = Metric(
+        _best_of(config.repeat, lambda: cl.Program(ctx, src).build()), "s", False
+    )
+    return results
+
+
+def bench_chaos_game(config: BenchConfig) -> dict[str, Metric]:
+    """Samples per second of Renderer.chaos_game for each flame and particle count."""
+    from sulfurvision.cl import render
+
+    results = {}
+    for name in REFERENCE_FLAMES:
+        frame = reference_frame(name)
+        for particles in config.particle_counts:
+            renderer = render.Renderer(
+                256, 256, 1, particles, len(frame.palette), len(frame.transforms)
+            )
+            camera = renderer.histogram_camera(frame.camera)
+
+            def run():
+                renderer.reset()
+                renderer.randomize_particles()
+                renderer.chaos_game(
+                    camera, frame.transforms, frame.palette, config.chaos_iters, 0
+                )
+
+            # Warm up, so the first launch's setup is not counted
+            run()
+            seconds = _best_of(config.repeat, run)
+            results[f"chaos_game.{name}.p{particles}.samples_per_second"] = Metric(
+                particles * config.chaos_iters / seconds, "samples/s"
+            )
+    return results
+
+
+def bench_postprocess(config: BenchConfig) -> dict[str, Metric]:
+    """Seconds to resolve, tonemap and read back one image at each resolution."""
+    from sulfurvision.cl import render
+
+    frame = reference_frame("sierpinski")
+    results = {}
+    for w, h in config.resolutions:
+        for supersample in (1, 2):
+            renderer = render.Renderer(
+                w, h, supersample, 1024, len(frame.palette), len(frame.transforms)
+            )
+            renderer.randomize_particles()
+            renderer.chaos_game(
+                renderer.histogram_camera(frame.camera), frame.transforms, frame.palette, 100, 10
+            )
+            renderer.image()
+            seconds = _best_of(config.repeat, renderer.image)
+            results[f"postprocess.{w}x{h}.s{supersample}.seconds"] = Metric(seconds, "s", False)
+    return results
+
+
+class _NullSink(sinks.FrameSink):
+    def write_encoded(self, index: int, data: typing.Any):
+        pass
+
+
+def bench_frames(config: BenchConfig) -> dict[str, Metric]:
+    """Frames per second of rendering an animation end to end, encoding included."""
+    from sulfurvision import export
+    from sulfurvision.cl import render
+
+    w, h = config.frame_size
+    project = Project(
+        [reference_frame("sierpinski", 0), reference_frame("julia_pdj", 1)],
+        3,
+        len(_PALETTE),
+        w,
+        h,
+        config.frame_particles,
+        config.frame_iters,
+        10,
+        1,
+        max(1, config.frames - 1),
+    )
+    renderer = render.Renderer(
+        w, h, 1, config.frame_particles, project.n_colors, project.n_transforms
+    )
+    times = np.linspace(0, project.duration, config.frames)
+
+    def run():
+        exporter = export.AnimationExporter(renderer, _NullSink())
+        exporter.export(
+            ((i, t, project.frame_at(t)) for i, t in enumerate(times)),
+            project.iters,
+            project.skip,
+        )
+
+    run()
+    seconds = _best_of(config.repeat, run)
+    return {"frames.frames_per_second": Metric(config.frames / seconds, "frames/s")}
+
+
+BENCHMARKS: dict[str, typing.Callable[[BenchConfig], dict[str, Metric]]] = {
+    "cpu": bench_cpu,
+    "build": bench_build,
+    "chaos_game": bench_chaos_game,
+    "postprocess": bench_postprocess,
+    "frames": bench_frames,
+}
+
+
+def environment() -> dict[str, typing.Any]:
+    """What the results were measured on, as best can be told without failing."""
+    env = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    try:
+        from sulfurvision.cl import render
+
+        render.Renderer._init_cl()
+        env["device"] = render.Renderer._device.name.strip()
+        env["platform"] = render.Renderer._device.platform.name.strip()
+    except Exception as e:
+        env["device"] = f"unavailable: {e}"
+    return env
+
+
+def run(
+    config: BenchConfig = BenchConfig(),
+    only: typing.Optional[typing.Sequence[str]] = None,
+    verbose: bool = False,
+) -> dict[str, typing.Any]:
+    """Run the named benchmarks, or all of them, and return the JSON-serializable results."""
+    metrics: dict[str, Metric] = {}
+    for name in only or BENCHMARKS:
+        if name not in BENCHMARKS:
+            raise ValueError(f"Unknown benchmark {name!r}")
+        for metric, value in BENCHMARKS[name](config).items():
+            metrics[metric] = value
+            if verbose:
+                print(f"{metric}: {value.value:.6g} {value.unit}")
+    return {
+        "environment": environment(),
+        "config": dataclasses.asdict(config),
+        "metrics": {name: dataclasses.asdict(metric) for name, metric in metrics.items()},
+    }
+
+
+@dataclasses.dataclass
+class Comparison:
+    metric: str
+    baseline: float
+    current: float
+    higher_is_better: bool
+
+    @property
+    def change(self) -> float:
+        """Fractional improvement over the baseline, negative for a slowdown."""
+        if self.baseline == 0 or self.current == 0:
+            return 0.0
+        ratio = self.current / self.baseline
+        return ratio - 1 if self.higher_is_better else 1 / ratio - 1
+
+
+def compare(
+    results: dict[str, typing.Any], baseline: dict[str, typing.Any]
+) -> list[Comparison]:
+    """Every metric present in both results, in the order of results."""
+    return [
+        Comparison(
+            name,
+            baseline["metrics"][name]["value"],
+            metric["value"],
+            metric["higher_is_better"],
+        )
+        for name, metric in results["metrics"].items()
+        if name in baseline["metrics"]
+    ]
+
+
+def regressions(
+    comparisons: typing.Sequence[Comparison], tolerance: float = DEFAULT_TOLERANCE
+) -> list[Comparison]:
+    return [comparison for comparison in comparisons if comparison.change < -tolerance]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="sulfurvision-bench",
+        description="Measure render throughput and compare it against a baseline.",
+    )
+    parser.add_argument("-o", "--output", help="JSON file to write the results to")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="Fractional slowdown tolerated before a metric counts as a regression",
+    )
+    parser.add_argument(
+        "--only", nargs="+", choices=list(BENCHMARKS), help="Benchmarks to run, default all"
+    )
+    parser.add_argument("--quick", action="store_true", help="Tiny sizes, for a smoke test")
+    parser.add_argument("-q", "--quiet", action="store_true")
+    return parser
+
+
+def main(argv: typing.Optional[typing.Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    results = run(QUICK if args.quick else BenchConfig(), args.only, not args.quiet)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if not args.baseline:
+        return 0
+    with open(args.baseline, "r") as file:
+        baseline = json.load(file)
+    comparisons = compare(results, baseline)
+    for comparison in comparisons:
+        print(
+            f"{comparison.metric}: {comparison.baseline:.6g} -> {comparison.current:.6g} "
+            f"({comparison.change:+.1%})"
+        )
+    slower = regressions(comparisons, args.tolerance)
+    if slower:
+        print(f"{len(slower)} metrics regressed by more than {args.tolerance:.0%}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""
+On-disk raw histograms, so long renders can be resumed and independent renders merged
+
+A checkpoint is a directory containing:
+    histogram.npy  uint32 RGBA sample counts, shaped (height, width, 4) at supersampled size
+    particles.npy  particle states as uploaded to the device (absent for merged histograms)
+    meta.json      render settings, progress and the frame being rendered
+Both arrays are plain .npy files, so they can be memory-mapped instead of read into memory.
+"""
+
+import argparse
+import dataclasses
+import json
+import os
+from os import path
+import shutil
+import sys
+import typing
+
+import numpy as np
+
+HISTOGRAM_FILE = "histogram.npy"
+PARTICLES_FILE = "particles.npy"
+META_FILE = "meta.json"
+FORMAT_VERSION = 1
+
+# Rows summed at once while merging, to bound memory use
+_MERGE_ROWS = 256
+_UINT32_MAX = np.iinfo(np.uint32).max
+
+
+@dataclasses.dataclass
+class Checkpoint:
+    """A raw histogram plus whatever is needed to continue or finish rendering it."""
+
+    histogram: np.ndarray
+    particles: typing.Optional[np.ndarray]
+    meta: dict[str, typing.Any]
+
+    @property
+    def width(self) -> int:
+        return self.meta["width"]
+
+    @property
+    def height(self) -> int:
+        return self.meta["height"]
+
+    @property
+    def supersample(self) -> int:
+        return self.meta["supersample"]
+
+    @property
+    def samples(self) -> int:
+        """Number of particle iterations accumulated, including unplotted warmup."""
+        return self.meta.get("samples", self.meta["iters_done"] * self.meta["n_particles"])
+
+
+def histogram_shape(width: int, height: int, supersample: int) -> tuple[int, int, int]:
+    return (height * supersample, width * supersample, 4)
+
+
+def save(dpath: str, histogram: np.ndarray, particles: typing.Optional[np.ndarray], meta: dict):
+    """Write a checkpoint, replacing any previous one at dpath.
+    The new files are written beside it first, so an interrupted save never
+    leaves a directory holding a mixture of old and new state.
+    """
+    meta = dict(meta, version=FORMAT_VERSION)
+    shape = histogram_shape(meta["width"], meta["height"], meta["supersample"])
+    partial = dpath + ".partial"
+    old = dpath + ".old"
+    shutil.rmtree(partial, ignore_errors=True)
+    os.makedirs(partial)
+    np.save(path.join(partial, HISTOGRAM_FILE), np.asarray(histogram, np.uint32).reshape(shape))
+    if particles is not None:
+        np.save(path.join(partial, PARTICLES_FILE), particles)
+    with open(path.join(partial, META_FILE), "w") as file:
+        json.dump(meta, file)
+    shutil.rmtree(old, ignore_errors=True)
+    if path.exists(dpath):
+        os.rename(dpath, old)
+    os.rename(partial, dpath)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def load(dpath: str, mmap: bool = True) -> Checkpoint:
+    """Read a checkpoint. With mmap, the arrays are mapped read-only rather than read."""
+    if not path.exists(dpath) and path.exists(dpath + ".old"):
+        dpath = dpath + ".old"  # Interrupted between the two renames in save
+    with open(path.join(dpath, META_FILE), "r") as file:
+        meta = json.load(file)
+    if meta.get("version", FORMAT_VERSION) > FORMAT_VERSION:
+        raise ValueError(f"Checkpoint version {meta['version']} is newer than supported")
+    mode = "r" if mmap else None
+    histogram = np.load(path.join(dpath, HISTOGRAM_FILE), mmap_mode=mode)
+    particles_path = path.join(dpath, PARTICLES_FILE)
+    particles = np.load(particles_path, mmap_mode=mode) if path.exists(particles_path) else None
+    return Checkpoint(histogram, particles, meta)
+
+
+def exists(dpath: str) -> bool:
+    return path.exists(path.join(dpath, META_FILE)) or path.exists(
+        path.join(dpath + ".old", META_FILE)
+    )
+
+
+def merge(dpaths: typing.Sequence[str], out_path: str) -> Checkpoint:
+    """Sum the histograms of several checkpoints of the same frame into a new checkpoint.
+    Counts saturate rather than wrap. The result has no particles, so it can be
+    tonemapped or merged further, but not resumed.
+    """
+    if not dpaths:
+        raise ValueError("Nothing to merge")
+    checkpoints = [load(dpath) for dpath in dpaths]
+    first = checkpoints[0]
+    for other in checkpoints[1:]:
+        if other.histogram.shape != first.histogram.shape:
+            raise ValueError(
+                f"Cannot merge histograms of shapes {first.histogram.shape} and {other.histogram.shape}"
+            )
+    merged = np.zeros(first.histogram.shape, np.uint32)
+    for row in range(0, merged.shape[0], _MERGE_ROWS):
+        rows = slice(row, row + _MERGE_ROWS)
+        total = np.zeros(merged[rows].shape, np.uint64)
+        for ckpt in checkpoints:
+            total += ckpt.histogram[rows]
+        merged[rows] = np.minimum(total, _UINT32_MAX)
+    meta = {
+        key: value
+        for key, value in first.meta.items()
+        if key not in ("iters_done", "n_particles", "samples", "seed")
+    }
+    meta["samples"] = sum(map(lambda ckpt: ckpt.samples, checkpoints))
+    meta["merged_from"] = len(checkpoints)
+    meta["iters_done"] = meta["iters"] = max(ckpt.meta["iters_done"] for ckpt in checkpoints)
+    meta["n_particles"] = 0
+    save(out_path, merged, None, meta)
+    return load(out_path)
+
+
+def tonemap(
+    ckpt: Checkpoint,
+    vibrancy: typing.Optional[float] = None,
+    gamma: typing.Optional[float] = None,
+    brightness: typing.Optional[float] = None,
+):
+    """Produce the final image from a checkpoint without running the chaos game.
+    Tonemap settings default to those of the checkpoint's frame.
+    """
+    from sulfurvision.cl import render
+
+    frame = ckpt.meta.get("frame", {})
+    renderer = render.Renderer(ckpt.width, ckpt.height, ckpt.supersample, 1, 1, 1)
+    renderer.histogram.set(np.ascontiguousarray(ckpt.histogram, np.uint32).reshape(-1))
+    return renderer.image(
+        frame.get("vibrancy", 1) if vibrancy is None else vibrancy,
+        frame.get("gamma", 0.8) if gamma is None else gamma,
+        frame.get("brightness", 20) if brightness is None else brightness,
+    )
+
+
+def main(argv: typing.Optional[typing.Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="sulfurvision-histogram",
+        description="Merge raw histogram checkpoints and turn them into images.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    merge_cmd = commands.add_parser("merge", help="Sum checkpoints of the same frame")
+    merge_cmd.add_argument("output", help="Checkpoint directory to write")
+    merge_cmd.add_argument("inputs", nargs="+", help="Checkpoint directories to sum")
+    tonemap_cmd = commands.add_parser("tonemap", help="Write the image for a checkpoint")
+    tonemap_cmd.add_argument("checkpoint")
+    tonemap_cmd.add_argument("-o", "--output", required=True, help="Image file to write")
+    tonemap_cmd.add_argument("--vibrancy", type=float)
+    tonemap_cmd.add_argument("--gamma", type=float)
+    tonemap_cmd.add_argument("--brightness", type=float)
+    args = parser.parse_args(argv)
+
+    if args.command == "merge":
+        merged = merge(args.inputs, args.output)
+        print(f"Merged {len(args.inputs)} checkpoints ({merged.samples} samples) into {args.output}")
+    elif args.command == "tonemap":
+        img = tonemap(load(args.checkpoint), args.vibrancy, args.gamma, args.brightness)
+        img.save(args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,203 @@
+"""
+Choosing the OpenCL device renders run on
+
+Every device of every platform is benchmarked with a short run of flame_kernel the first
+time a machine renders, and the fastest is remembered in a cache file kept per host name,
+so that render nodes sharing a home directory each keep their own choice. The cache is
+redone whenever the devices present change. SULFURVISION_DEVICE picks a device instead,
+either by "platform:device" indices, as PYOPENCL_CTX does, or by part of its name;
+without it, PYOPENCL_CTX is honoured too.
+"""
+
+import dataclasses
+import json
+import os
+from os import path
+import platform
+import sys
+import time
+import typing
+
 import pyopencl as cl
 
+DEVICE_ENV = "SULFURVISION_DEVICE"
+# Directory of the device cache, by default under XDG_CACHE_HOME or ~/.cache
+CACHE_ENV = "SULFURVISION_CACHE"
+CACHE_FILE = "devices.json"
+
+BENCHMARK_PARTICLES = 1 << 14
+BENCHMARK_ITERS = 64
+BENCHMARK_REPEAT = 3
+
+
+@dataclasses.dataclass(frozen=True)
+class DeviceLimits:
+    """The limits of a device that decide how large a render it can take, in bytes."""
+
+    name: str
+    global_mem_size: int
+    max_mem_alloc_size: int
+    max_constant_buffer_size: int
+    max_compute_units: int
+
+
 def create_ctx() -> cl.Context:
-    return cl.create_some_context(interactive=False)
+    return cl.Context([select_device()])
+
 
 def pick_device(ctx: cl.Context) -> cl.Device:
-    # Currently just returns the first GPU if there is one, else the first device
+    # Contexts from create_ctx hold only the selected device; otherwise prefer the first GPU
     devices = ctx.devices
     gpus = list(filter(lambda d: d.type == cl.device_type.GPU, devices))
     if not gpus:
         return devices[0]
     return gpus[0]
+
+
+def device_limits(device: cl.Device) -> DeviceLimits:
+    return DeviceLimits(
+        device.name.strip(),
+        device.global_mem_size,
+        device.max_mem_alloc_size,
+        device.max_constant_buffer_size,
+        device.max_compute_units,
+    )
+
+
+def all_devices() -> list[cl.Device]:
+    """Every device of every platform, skipping platforms whose drivers fail to list theirs."""
+    devices = []
+    try:
+        platforms = cl.get_platforms()
+    except cl.Error:
+        return []
+    for plat in platforms:
+        try:
+            devices.extend(plat.get_devices())
+        except cl.Error:
+            continue
+    return devices
+
+
+def device_id(device: cl.Device) -> str:
+    return f"{device.platform.name.strip()} / {device.name.strip()}"
+
+
+def find_device(devices: typing.Sequence[cl.Device], spec: str) -> cl.Device:
+    """The device that spec names, by "platform:device" indices into the platforms
+    in order, or by case-insensitive part of device_id.
+    """
+    platforms: list[typing.Any] = []
+    for device in devices:
+        if device.platform not in platforms:
+            platforms.append(device.platform)
+    indices = spec.split(":")
+    if all(index.strip().isdigit() for index in indices) and len(indices) <= 2:
+        numbers = [int(index) for index in indices]
+        if numbers[0] < len(platforms):
+            on_platform = [d for d in devices if d.platform == platforms[numbers[0]]]
+            number = numbers[1] if len(numbers) > 1 else 0
+            if number < len(on_platform):
+                return on_platform[number]
+    matches = [d for d in devices if spec.strip().lower() in device_id(d).lower()]
+    if not matches:
+        raise ValueError(
+            f"No OpenCL device matches {spec!r}, the devices are: "
+            + "; ".join(device_id(d) for d in devices)
+        )
+    return matches[0]
+
+
+def benchmark_device(device: cl.Device) -> float:
+    """Samples per second of flame_kernel on device, running a reference flame."""
+    from sulfurvision import bench, prng
+    from sulfurvision.cl import render
+
+    frame = bench.reference_frame("julia_pdj")
+    renderer = render.Renderer.on_device(device)(
+        64,
+        64,
+        1,
+        BENCHMARK_PARTICLES,
+        len(frame.palette),
+        len(frame.transforms),
+        generator=prng.PHILOX,
+    )
+    camera = renderer.histogram_camera(frame.camera)
+    renderer.reset()
+    renderer.randomize_particles()
+    # The first launch pays for setting up the kernel, which drivers such as pocl compile lazily
+    renderer.chaos_game(camera, frame.transforms, frame.palette, 1, 0)
+    best = float("inf")
+    for _ in range(BENCHMARK_REPEAT):
+        start = time.perf_counter()
+        renderer.chaos_game(camera, frame.transforms, frame.palette, BENCHMARK_ITERS, 0)
+        best = min(best, time.perf_counter() - start)
+    return BENCHMARK_PARTICLES * BENCHMARK_ITERS / best
+
+
+def cache_path() -> str:
+    folder = os.environ.get(CACHE_ENV) or path.join(
+        os.environ.get("XDG_CACHE_HOME") or path.expanduser(path.join("~", ".cache")),
+        "sulfurvision",
+    )
+    return path.join(folder, CACHE_FILE)
+
+
+def _read_cache(fpath: str) -> dict[str, typing.Any]:
+    try:
+        with open(fpath, "r") as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def select_device(
+    devices: typing.Optional[typing.Sequence[cl.Device]] = None,
+    fpath: typing.Optional[str] = None,
+    refresh: bool = False,
+) -> cl.Device:
+    """The device named by SULFURVISION_DEVICE or PYOPENCL_CTX if either is set, else the fastest of devices,
+    all of them by default, by benchmark_device. Benchmarks are cached in fpath,
+    cache_path() by default, and rerun with refresh or when the devices change.
+    A device that fails its benchmark is only chosen if every device does.
+    """
+    if devices is None:
+        devices = all_devices()
+    if not devices:
+        raise RuntimeError("No OpenCL devices found")
+    spec = os.environ.get(DEVICE_ENV) or os.environ.get("PYOPENCL_CTX")
+    if spec:
+        return find_device(devices, spec)
+    if len(devices) == 1:
+        return devices[0]
+
+    fpath = fpath or cache_path()
+    ids = [device_id(device) for device in devices]
+    cache = _read_cache(fpath)
+    host = platform.node()
+    entry = cache.get(host)
+    if refresh or not isinstance(entry, dict) or sorted(entry.get("devices", [])) != sorted(ids):
+        speeds = {}
+        for device, key in zip(devices, ids):
+            try:
+                speeds[key] = benchmark_device(device)
+            except Exception as e:
+                print(f"Benchmarking {key} failed: {e}", file=sys.stderr)
+                speeds[key] = 0.0
+        entry = {"devices": ids, "samples_per_second": speeds}
+        cache[host] = entry
+        try:
+            os.makedirs(path.dirname(fpath), exist_ok=True)
+            with open(fpath, "w") as file:
+                json.dump(cache, file, indent=2)
+        except OSError as e:
+            print(f"Could not cache the choice of device in {fpath}: {e}", file=sys.stderr)
+    speeds = entry["samples_per_second"]
+    # Ties, such as every benchmark failing, go to the order pick_device prefers
+    ranked = sorted(
+        range(len(devices)),
+        key=lambda i: (-speeds.get(ids[i], 0.0), devices[i].type != cl.device_type.GPU, i),
+    )
+    return devices[ranked[0]]
@@ -3,6 +3,31 @@
 #define MASK32 0xFFFFFFFF
 #define EPSILON 1e-9
 
+// Particles this far out, or non-finite, are reseeded, then not plotted for RESEED_WARMUP iterations
+#define ESCAPE_RADIUS 1e10f
+#define RESEED_WARMUP 20
+
 #define LCG32_UNIFORM(seed, p) seed = lcg32(seed); float p = (float)seed / MASK32;
 
+// Chaos game generators, in the order of prng.GENERATORS
+#define PRNG_LCG32 0
+#define PRNG_PHILOX 1
+
+#define PHILOX_M0 0xD2511F53u
+#define PHILOX_M1 0xCD9E8D57u
+#define PHILOX_W0 0x9E3779B9u
+#define PHILOX_W1 0xBB67AE85u
+
 #define TONEMAP_MODE_LOG 0x1
+
+// Sample counters, in the order of render.RenderStats; each is a (low, high) pair of words
+#define STATS_PLOTTED 0
+#define STATS_OFF_CANVAS 1
+#define STATS_NONFINITE 2
+#define STATS_WARMUP 3
+#define STATS_RESEEDED 4
+// Followed by how often each transform was chosen
+#define STATS_TRANSFORMS 5
+
+// Floats per sample recorded by flame_kernel, as render.SAMPLE_FLOATS: x, y and palette coordinate
+#define SAMPLE_FLOATS 3
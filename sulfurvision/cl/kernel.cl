@@ -1,5 +1,7 @@
 particle_t apply_transform(
     __constant transform_t* transform,
+    __constant variation_entry_t* entries,
+    __constant float* params,
     const particle_t particle
 ) {
     // Lerp color
@@ -14,15 +16,39 @@ particle_t apply_transform(
     float4 xyrt = (float4)(xy, r, theta);
     float2 new_xy = 0;
 
+    // Only the transform's active variations have entries
+    __constant variation_entry_t* end = entries + transform->entries + transform->n_entries;
+    for (__constant variation_entry_t* entry = entries + transform->entries; entry < end; entry++) {
+        switch (entry->id) {
 @@VARIATIONS@@
+        }
+    }
 
-    return (particle_t){new_xy, seed, color};
+    return (particle_t){new_xy, seed, color, particle.warmup};
 }
 
+// Each transform's variations are a run of entries, whose params are in the params pool.
+// transforms and camera hold n_subframes consecutive sets of n_transforms transforms and of
+// n_symmetry cameras of 6 floats, sampled across the frame's shutter interval. Each point is
+// plotted through every one of its sub-frame's cameras, one per symmetric copy; the sample
+// counters follow the first copy only. Every blur_batch iterations, each particle
+// switches to a random sub-frame, so the histogram accumulates the motion blurred frame.
+// With PRNG_PHILOX, each iteration's random numbers come from the counter
+// (first_itr + iteration, particle id) under key, so no state carries between launches.
+// Particles that escape start over from a fresh point drawn from their own stream,
+// with the Philox counter (first_itr + iteration, particle id, 2), and are not plotted
+// until they have warmed up again.
+// With collect_stats, the STATS_* counters are reduced per work-group in local_stats,
+// which holds STATS_TRANSFORMS + n_transforms words, and then added to stats.
+// With a sample_capacity, every point that would be plotted is also recorded in samples as
+// SAMPLE_FLOATS floats: its position before any camera and its palette coordinate.
+// sample_count counts them all, including those past the capacity, which are dropped.
 __kernel void flame_kernel(
     __global particle_t* particles,
     __global uint* histogram,
     __constant transform_t* transforms,
+    __constant variation_entry_t* entries,
+    __constant float* params,
     __constant float4* palette,
     __constant float* camera,
     const uint n_itrs,
@@ -30,40 +56,146 @@ __kernel void flame_kernel(
     const uint2 image_size,
     const uint n_transforms,
     const uint n_colors,
-    const uint supersampling) {
+    const uint supersampling,
+    const uint n_subframes,
+    const uint n_symmetry,
+    const uint blur_batch,
+    const uint prng,
+    const uint2 key,
+    const uint first_itr,
+    __global uint* stats,
+    __local uint* local_stats,
+    const uint collect_stats,
+    __global float* samples,
+    volatile __global uint* sample_count,
+    const uint sample_capacity) {
         size_t id = get_global_id(0);
         size_t n_seeds = get_global_size(0);
         uint2 histogram_size = image_size * supersampling;
+        size_t local_id = get_local_id(0);
+        size_t local_size = get_local_size(0);
+        uint n_stats = STATS_TRANSFORMS + n_transforms;
+        uint plotted = 0;
+        uint off_canvas = 0;
+        uint nonfinite = 0;
+        uint warmup = 0;
+        uint reseeded = 0;
+        if (collect_stats) {
+            for (uint k = local_id; k < n_stats; k += local_size) {
+                local_stats[k] = 0;
+            }
+            barrier(CLK_LOCAL_MEM_FENCE);
+        }
 
         __private particle_t particle = particles[id];
+        __constant transform_t* subframe_transforms = transforms;
+        __constant float* subframe_camera = camera;
 
         for (uint i = 0; i < n_itrs; i++) {
-            LCG32_UNIFORM(particle.seed, p);
+            uint4 counter_rand = 0;
+            if (prng == PRNG_PHILOX) {
+                counter_rand = philox4x32_10((uint4)(first_itr + i, (uint)id, 0, 0), key);
+                // Seeds whatever randomness the variations use this iteration
+                particle.seed = counter_rand.z;
+            }
+            if (n_subframes > 1 && i % blur_batch == 0) {
+                float s = next_uniform(prng, &particle.seed, counter_rand.y);
+                uint subframe = min((uint)(s * n_subframes), n_subframes - 1);
+                subframe_transforms = transforms + subframe * n_transforms;
+                subframe_camera = camera + subframe * 6 * n_symmetry;
+            }
+            float p = next_uniform(prng, &particle.seed, counter_rand.x);
             uint t_choice;
-            for (t_choice = 0; p > 0 && t_choice < n_transforms; p -= transforms[t_choice++].probability);
+            for (t_choice = 0; p > 0 && t_choice < n_transforms; p -= subframe_transforms[t_choice++].probability);
             t_choice = min(t_choice, n_transforms);
-            __constant transform_t* transform = transforms + t_choice - 1;
+            __constant transform_t* transform = subframe_transforms + t_choice - 1;
+            if (collect_stats) {
+                atomic_inc(local_stats + STATS_TRANSFORMS + max(t_choice, 1u) - 1);
+            }
 
-            particle = apply_transform(transform, particle);
+            particle = apply_transform(transform, entries, params, particle);
+
+            bool escape = escaped(particle.xy);
+            if (escape) {
+                uint4 fresh = 0;
+                if (prng == PRNG_PHILOX) {
+                    fresh = philox4x32_10((uint4)(first_itr + i, (uint)id, 2, 0), key);
+                }
+                particle.xy.x = next_uniform(prng, &particle.seed, fresh.x);
+                particle.xy.y = next_uniform(prng, &particle.seed, fresh.y);
+                particle.warmup = RESEED_WARMUP;
+                reseeded++;
+            }
 
             if (i >= skip_itrs) {
-                // TODO: Final transform
-                float2 pixel = affine_transform(camera, particle.xy);
-                uint ux = (uint)pixel.x;
-                uint uy = (uint)pixel.y;
-                if (ux >= 0 && uy >= 0 && ux < histogram_size.x && uy < histogram_size.y) {
-                    uint pixel_id = ux + uy * histogram_size.x;
-                    __global uint* pixptr = histogram + pixel_id * 4;
+                if (escape) {
+                    nonfinite++;
+                } else if (particle.warmup > 0) {
+                    warmup++;
+                } else {
+                    // TODO: Final transform
                     uchar4 rgba = sample_palette(palette, particle.color, n_colors);
-                    atomic_add(pixptr + 0, rgba.x);
-                    atomic_add(pixptr + 1, rgba.y);
-                    atomic_add(pixptr + 2, rgba.z);
-                    atomic_add(pixptr + 3, 1);
+                    for (uint s = 0; s < n_symmetry; s++) {
+                        if (plot_point(histogram, histogram_size, subframe_camera + 6 * s, particle.xy, rgba)) {
+                            plotted += s == 0;
+                        } else {
+                            off_canvas += s == 0;
+                        }
+                    }
+                    if (sample_capacity) {
+                        uint slot = atomic_inc(sample_count);
+                        if (slot < sample_capacity) {
+                            __global float* sample = samples + slot * SAMPLE_FLOATS;
+                            sample[0] = particle.xy.x;
+                            sample[1] = particle.xy.y;
+                            sample[2] = particle.color;
+                        }
+                    }
                 }
             }
+            if (!escape && particle.warmup > 0) {
+                particle.warmup--;
+            }
         }
 
         particles[id] = particle;
+
+        if (collect_stats) {
+            atomic_add(local_stats + STATS_PLOTTED, plotted);
+            atomic_add(local_stats + STATS_OFF_CANVAS, off_canvas);
+            atomic_add(local_stats + STATS_NONFINITE, nonfinite);
+            atomic_add(local_stats + STATS_WARMUP, warmup);
+            atomic_add(local_stats + STATS_RESEEDED, reseeded);
+            barrier(CLK_LOCAL_MEM_FENCE);
+            for (uint k = local_id; k < n_stats; k += local_size) {
+                atomic_add_wide(stats + 2 * k, local_stats[k]);
+            }
+        }
+}
+
+// Plot n_samples recorded by flame_kernel into the histogram through n_symmetry cameras
+// and palette, as flame_kernel would have plotted them
+__kernel void rebin_kernel(
+    __global const float* samples,
+    const uint n_samples,
+    __global uint* histogram,
+    __constant float4* palette,
+    __constant float* camera,
+    const uint2 image_size,
+    const uint n_colors,
+    const uint supersampling,
+    const uint n_symmetry) {
+        size_t id = get_global_id(0);
+        size_t n_threads = get_global_size(0);
+        uint2 histogram_size = image_size * supersampling;
+        for (uint i = id; i < n_samples; i += n_threads) {
+            __global const float* sample = samples + i * SAMPLE_FLOATS;
+            float2 xy = (float2)(sample[0], sample[1]);
+            uchar4 rgba = sample_palette(palette, sample[2], n_colors);
+            for (uint s = 0; s < n_symmetry; s++) {
+                plot_point(histogram, histogram_size, camera + 6 * s, xy, rgba);
+            }
+        }
 }
 
 __kernel void downsample_kernel(
@@ -6,39 +6,141 @@ import pyopencl as cl
 import pyopencl.array as clarray
 import pyopencl.tools as cltools
 
-from sulfurvision import pysulfur, variations
+from sulfurvision import frames, pysulfur, variations
 
 cl_types = {}
 transform_type_key = 'transform_t'
+variation_entry_type_key = 'variation_entry_t'
 particle_type_key = 'particle_t'
 
-def transform_to_cl(transforms: typing.Sequence[pysulfur.Transform], q: cl.CommandQueue) -> clarray.Array:
-    if transform_type_key not in cl_types:
-        raise Exception('Types have not yet been defined')
-    host_transform_type = cl_types[transform_type_key]
-    host_transforms = np.empty(len(transforms), host_transform_type)
-    for i, transform in enumerate(transforms):
-        host_transforms[i]['weights'] = transform.weights
-        host_transforms[i]['params'] = transform.params
-        host_transforms[i]['affine'] = transform.affine
-        host_transforms[i]['probability'] = transform.probability
-        host_transforms[i]['color'] = transform.color
-        host_transforms[i]['color_speed'] = transform.color_speed
-    return clarray.to_device(q, host_transforms)
-
-def transform_into_cl(transforms: typing.Sequence[pysulfur.Transform], array: clarray.Array):
+# Weights at or below this magnitude are inactive, as in the kernel
+EPSILON = 1e-9
+
+
+class PackedTransforms(typing.NamedTuple):
+    """Host copies of the device's sparse representation of transforms.
+    Each transform_t refers to a run of variation_entry_t, one per active variation,
+    and each entry refers to its variation's params within a shared pool.
+    """
+    transforms: np.ndarray
+    entries: np.ndarray
+    params: np.ndarray
+
+    @property
+    def nbytes(self) -> int:
+        return self.transforms.nbytes + self.entries.nbytes + self.params.nbytes
+
+    @staticmethod
+    def concatenate(parts: typing.Sequence['PackedTransforms']) -> 'PackedTransforms':
+        transforms = np.concatenate([part.transforms for part in parts])
+        entries = np.concatenate([part.entries for part in parts])
+        entry_offsets = np.cumsum([0] + [len(part.entries) for part in parts[:-1]])
+        param_offsets = np.cumsum([0] + [len(part.params) for part in parts[:-1]])
+        transforms['entries'] += np.repeat(entry_offsets, [len(part.transforms) for part in parts]).astype(np.uint32)
+        entries['params'] += np.repeat(param_offsets, [len(part.entries) for part in parts]).astype(np.uint32)
+        return PackedTransforms(transforms, entries, np.concatenate([part.params for part in parts]))
+
+
+def _pack_sparse(weights, params, affine, probability, color, color_speed) -> PackedTransforms:
+    """Pack transforms given as the columns of their fields, one row per transform."""
     if transform_type_key not in cl_types:
         raise Exception('Types have not yet been defined')
-    host_transform_type = cl_types[transform_type_key]
-    host_transforms = np.empty(len(transforms), host_transform_type)
-    for i, transform in enumerate(transforms):
-        host_transforms[i]['weights'] = transform.weights
-        host_transforms[i]['params'] = transform.params
-        host_transforms[i]['affine'] = transform.affine
-        host_transforms[i]['probability'] = transform.probability
-        host_transforms[i]['color'] = transform.color
-        host_transforms[i]['color_speed'] = transform.color_speed
-    array.set(host_transforms)
+    rows, ids = np.nonzero(np.abs(np.asarray(weights, np.float32)) > EPSILON)
+    counts = np.bincount(rows, minlength=len(weights))
+    host_transforms = np.empty(len(weights), cl_types[transform_type_key])
+    host_transforms['affine'] = affine
+    host_transforms['probability'] = probability
+    host_transforms['color'] = color
+    host_transforms['color_speed'] = color_speed
+    host_transforms['entries'] = np.cumsum(counts) - counts
+    host_transforms['n_entries'] = counts
+
+    bases = np.array([variation.params_base for variation in variations.Variation.variations])
+    sizes = np.array([variation.num_params for variation in variations.Variation.variations])
+    entry_sizes = sizes[ids]
+    entry_offsets = np.cumsum(entry_sizes) - entry_sizes
+    host_entries = np.empty(len(ids), cl_types[variation_entry_type_key])
+    host_entries['id'] = ids
+    host_entries['weight'] = np.asarray(weights)[rows, ids]
+    host_entries['params'] = entry_offsets
+    # Gather each entry's params, in entry order, into one pool
+    within = np.arange(entry_sizes.sum()) - np.repeat(entry_offsets, entry_sizes)
+    pool = np.asarray(params)[np.repeat(rows, entry_sizes), np.repeat(bases[ids], entry_sizes) + within]
+    return PackedTransforms(host_transforms, host_entries, pool.astype(np.float32))
+
+
+def pack_transforms(transforms: typing.Sequence[pysulfur.Transform]) -> PackedTransforms:
+    return _pack_sparse(
+        np.array([transform.weights for transform in transforms]).reshape(len(transforms), -1),
+        np.array([transform.params for transform in transforms]).reshape(len(transforms), -1),
+        np.array([transform.affine for transform in transforms]).reshape(len(transforms), 6),
+        [transform.probability for transform in transforms],
+        [transform.color for transform in transforms],
+        [transform.color_speed for transform in transforms])
+
+def pack_transforms_from(layout: frames.FrameLayout, packed: np.ndarray) -> PackedTransforms:
+    """Transforms of one or more packed frames, copied a field at a time"""
+    rows = layout.transform_rows(np.asarray(packed)).reshape(-1, layout.transform_size)
+    return _pack_sparse(
+        rows[:, layout.weights],
+        rows[:, layout.params],
+        rows[:, layout.affine],
+        rows[:, layout.probability],
+        rows[:, layout.color],
+        rows[:, layout.color_speed])
+
+
+class DeviceTransforms:
+    """Device buffers for PackedTransforms, grown as needed and never shrunk."""
+
+    def __init__(self, q: cl.CommandQueue):
+        self.q = q
+        self.transforms = None
+        self.entries = None
+        self.params = None
+
+    def _fit(
+        self, array: typing.Optional[clarray.Array], host: np.ndarray, async_: bool
+    ) -> tuple[clarray.Array, typing.Optional[cl.Event]]:
+        if array is None or array.size < max(1, host.size):
+            # Leave room to grow, since the number of active variations changes between frames
+            array = clarray.empty(self.q, max(1, 2 * host.size), host.dtype)
+        if not host.size:
+            return array, None
+        return array, cl.enqueue_copy(self.q, array.data, host, is_blocking=not async_)
+
+    def set(self, packed: PackedTransforms, async_: bool = False) -> list[cl.Event]:
+        """Upload packed, returning the events of the copies."""
+        self.transforms, transforms_event = self._fit(self.transforms, packed.transforms, async_)
+        self.entries, entries_event = self._fit(self.entries, packed.entries, async_)
+        self.params, params_event = self._fit(self.params, packed.params, async_)
+        return [
+            event
+            for event in (transforms_event, entries_event, params_event)
+            if event is not None
+        ]
+
+    @property
+    def args(self) -> tuple[cl.Buffer, cl.Buffer, cl.Buffer]:
+        """The buffers to pass to flame_kernel, in order."""
+        return self.transforms.data, self.entries.data, self.params.data
+
+
+def transform_to_cl(transforms: typing.Sequence[pysulfur.Transform], q: cl.CommandQueue) -> DeviceTransforms:
+    device_transforms = DeviceTransforms(q)
+    device_transforms.set(pack_transforms(transforms))
+    return device_transforms
+
+def transform_into_cl(
+        transforms: typing.Union[typing.Sequence[pysulfur.Transform], PackedTransforms],
+        device_transforms: DeviceTransforms,
+        async_: bool = False) -> list[cl.Event]:
+    """Upload transforms, which may already be packed by pack_transforms or pack_transforms_from.
+    Returns the events of the copies.
+    """
+    if not isinstance(transforms, PackedTransforms):
+        transforms = pack_transforms(transforms)
+    return device_transforms.set(transforms, async_=async_)
 
 def register_type(device: cl.Device, name: str, nptype: np.dtype) -> str:
     host_type, dev_type = cltools.match_dtype_to_c_struct(device, name, nptype)
@@ -48,24 +150,34 @@ def register_type(device: cl.Device, name: str, nptype: np.dtype) -> str:
 
 def define_types(device: cl.Device) -> str:
     np_transform = np.dtype([
-        ('weights', f'{len(variations.Variation.variations)}f4'),
-        ('params', f'{variations.Variation.param_counter}f4'),
         ('affine', '6f4'),
         ('probability', 'f4'),
         ('color', 'f4'),
-        ('color_speed', 'f4')
+        ('color_speed', 'f4'),
+        ('entries', 'u4'),
+        ('n_entries', 'u4')
         ])
     dev_transform = register_type(device, transform_type_key, np_transform)
 
+    np_entry = np.dtype([
+        ('id', 'u4'),
+        ('weight', 'f4'),
+        ('params', 'u4')
+        ])
+    dev_entry = register_type(device, variation_entry_type_key, np_entry)
+
     np_particle = np.dtype([
         ('xy', clarray.vec.float2),
         ('seed', 'u4'),
-        ('color', 'f4')
+        ('color', 'f4'),
+        # Iterations left before a reseeded particle is plotted again
+        ('warmup', 'u4')
     ])
     dev_particle = register_type(device, particle_type_key, np_particle)
 
     srcs = [
         dev_transform,
+        dev_entry,
         dev_particle
     ]
     return '\n'.join(srcs)
@@ -97,7 +209,7 @@ def combine_source(device: cl.Device) -> str:
     for i, variation in enumerate(variations.Variation.variations):
         if f'VARIATION({variation.name[len("variation_"):]})' not in srcs[-1]:
             continue
-        variations_srcs.append(f'''            if (fabs(transform->weights[{i}]) > EPSILON) {{ new_xy += transform->weights[{i}] * {variation.name}(xyrt, &seed, &(transform->params[{variation.params_base}]), transform->affine, transform->weights[{i}]); }}''')
+        variations_srcs.append(f'''            case {i}: new_xy += entry->weight * {variation.name}(xyrt, &seed, params + entry->params, transform->affine, entry->weight); break;''')
     kernel_src = kernel_src.replace('@@VARIATIONS@@', '\n'.join(variations_srcs))
     srcs.append(kernel_src)
     src = '\n'.join(srcs)
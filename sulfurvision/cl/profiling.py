@@ -0,0 +1,98 @@
+"""
+Per-stage device timings of renders, from the events of profiling-enabled command queues
+"""
+
+import collections
+import dataclasses
+import typing
+
+import numpy as np
+import pyopencl as cl
+
+# Stages in the order a render passes through them
+UPLOAD = "upload"
+CLEAR = "clear"
+CHAOS_GAME = "chaos_game"
+RESOLVE = "resolve"
+ROWMAX = "rowmax"
+MAXIMA = "maxima"
+TONEMAP = "tonemap"
+READBACK = "readback"
+STAGES = (UPLOAD, CLEAR, CHAOS_GAME, RESOLVE, ROWMAX, MAXIMA, TONEMAP, READBACK)
+
+# Renders kept for rolling aggregates
+DEFAULT_WINDOW = 64
+
+
+@dataclasses.dataclass
+class StageStats:
+    """Seconds a stage took over the renders in a Profiler's window."""
+
+    count: int
+    mean: float
+    minimum: float
+    maximum: float
+    p95: float
+
+
+class Profiler:
+    """Collects (stage, event) pairs per render and turns them into seconds of device time.
+    A render is complete once its readback has been recorded. Events are read only when
+    timings are asked for, so recording costs nothing but an append.
+    """
+
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self.window = window
+        self._pending: collections.OrderedDict[int, list[tuple[str, cl.Event]]] = (
+            collections.OrderedDict()
+        )
+        # Only the last window renders can reach the history, so older events are let go
+        self._complete: collections.deque[tuple[int, list[tuple[str, cl.Event]]]] = (
+            collections.deque(maxlen=window)
+        )
+        self.history: collections.deque[dict[str, float]] = collections.deque(maxlen=window)
+
+    def record(self, render: int, stage: str, event: cl.Event):
+        events = self._pending.setdefault(render, [])
+        events.append((stage, event))
+        if stage == READBACK:
+            self._complete.append((render, self._pending.pop(render)))
+        # Renders that never read back, such as abandoned previews, are dropped
+        while len(self._pending) > self.window:
+            self._pending.popitem(last=False)
+
+    def _collect(self):
+        while self._complete:
+            _, events = self._complete.popleft()
+            cl.wait_for_events([event for _, event in events])
+            timings = dict.fromkeys(STAGES, 0.0)
+            for stage, event in events:
+                timings[stage] += (event.profile.end - event.profile.start) * 1e-9
+            # Device time from the first command starting to the last one ending, gaps included
+            timings["total"] = (
+                max(event.profile.end for _, event in events)
+                - min(event.profile.start for _, event in events)
+            ) * 1e-9
+            self.history.append(timings)
+
+    def last(self) -> typing.Optional[dict[str, float]]:
+        """Seconds spent in each stage, and in total, by the most recently completed render."""
+        self._collect()
+        return dict(self.history[-1]) if self.history else None
+
+    def aggregates(self) -> dict[str, StageStats]:
+        """Statistics of each stage, and the total, over the completed renders in the window."""
+        self._collect()
+        if not self.history:
+            return {}
+        stats = {}
+        for stage in self.history[0]:
+            seconds = np.array([timings[stage] for timings in self.history])
+            stats[stage] = StageStats(
+                len(seconds),
+                float(seconds.mean()),
+                float(seconds.min()),
+                float(seconds.max()),
+                float(np.percentile(seconds, 95)),
+            )
+        return stats
@@ -1,5 +1,7 @@
 import dataclasses
-import json
+import hashlib
+import itertools
+import threading
 import typing
 
 import numpy as np
@@ -8,102 +10,113 @@ import pyopencl.array as clarray
 from PIL import Image
 from pyopencl import cltypes
 
-from sulfurvision import prng, pysulfur, types
-from sulfurvision.cl import bootstrap, krnl
+from sulfurvision import checkpoint, prng, pysulfur, types, variations
+from sulfurvision.cl import bootstrap, krnl, profiling
+# Re-exported for backwards compatibility
+from sulfurvision.frames import RenderFrame
 
+# Iterations a particle spends in one sub-frame of a motion blurred frame before picking another
+DEFAULT_BLUR_BATCH = 16
 
-def rand_particle(seed: int) -> tuple[cltypes.float2, int, float]:
+# Counters that flame_kernel collects before its per-transform ones, as in defines.cl
+STATS_TRANSFORMS = 5
+
+# Floats per recorded sample, as in defines.cl: x and y before any camera, and palette coordinate
+SAMPLE_FLOATS = 3
+# Work-items rebin_kernel spreads recorded samples over
+REBIN_THREADS = 1 << 16
+
+
+def rand_particle(seed: int) -> tuple[cltypes.float2, int, float, int]:
     seed, x = prng.rand_uniform(seed)
     seed, y = prng.rand_uniform(seed)
     seed, color = prng.rand_uniform(seed)
-    return (cltypes.make_float2(x, y), seed, color)
+    return (cltypes.make_float2(x, y), seed, color, 0)
+
+
+def rand_particles(seeds: np.ndarray) -> np.ndarray:
+    """rand_particle for a whole array of seeds at once, as a particle_t array."""
+    seeds = np.asarray(seeds, np.uint64)
+    seeds, x = prng.rand_uniform(seeds)
+    seeds, y = prng.rand_uniform(seeds)
+    seeds, color = prng.rand_uniform(seeds)
+    particles = np.empty(len(seeds), krnl.cl_types[krnl.particle_type_key])
+    particles["xy"]["x"] = x
+    particles["xy"]["y"] = y
+    particles["seed"] = seeds
+    particles["color"] = color
+    particles["warmup"] = 0
+    return particles
+
+
+def philox_particles(n_particles: int, key: tuple[int, int]) -> np.ndarray:
+    """Starting particles that depend only on each particle's index and the key,
+    drawn from the Philox counter (0, index, 1, 0) so as not to collide with any iteration's.
+    """
+    x, y, color, seeds = prng.philox4x32((0, np.arange(n_particles), 1, 0), key)
+    particles = np.empty(n_particles, krnl.cl_types[krnl.particle_type_key])
+    particles["xy"]["x"] = x / 0x100000000
+    particles["xy"]["y"] = y / 0x100000000
+    particles["seed"] = seeds
+    particles["color"] = color / 0x100000000
+    particles["warmup"] = 0
+    return particles
 
 
 @dataclasses.dataclass
-class RenderFrame:
-    """Similar to pysulfur.Flame.
-    Holds information for rendering one frame.
+class RenderState:
+    """Host-side copy of everything the chaos game accumulates,
+    so that a render can be suspended and later resumed.
     """
 
-    transforms: typing.Sequence[pysulfur.Transform]
-    palette: typing.Sequence[types.Color]
-    camera: types.AffineTransform
-    time: float
-    brightness: float = 10.0
-    gamma: float = 1.0
-    vibrancy: float = 1.0
-
-    def __mul__(self, other) -> "RenderFrame":
-        return RenderFrame(
-            [tf * other for tf in self.transforms],
-            list(np.asarray(self.palette, dtype=np.float64) * other),
-            np.asarray(self.camera, dtype=np.float64) * other,
-            self.time * other,
-            self.brightness * other,
-            self.gamma * other,
-            self.vibrancy * other
-        )
+    histogram: np.ndarray
+    particles: np.ndarray
 
-    def __rmul__(self, other): return self * other
-
-    def __add__(self, other) -> "RenderFrame":
-        assert len(self.transforms) == len(other.transforms)
-        assert len(self.palette) == len(other.palette)
-        return RenderFrame(
-            [stf + otf for stf, otf in zip(self.transforms, other.transforms)],
-            list(np.asarray(self.palette, dtype=np.float64)
-            + np.asarray(other.palette, dtype=np.float64)),
-            np.asarray(self.camera, dtype=np.float64)
-            + np.asarray(other.camera, dtype=np.float64),
-            self.time + other.time,
-            self.brightness + other.brightness,
-            self.gamma + other.gamma,
-            self.vibrancy + other.vibrancy
-        )
-    
-    def __radd__(self, other): return self + other
-
-    def __truediv__(self, other): return self * (1. / other)
-
-    def normalize(self):
-        total_prob = sum([x.probability for x in self.transforms])
-        for tf in self.transforms:
-            total_weight = sum(tf.weights)
-            if abs(total_weight) >= 1e-9:
-                tf.weights /= total_weight
-            if abs(total_prob) >= 1e-9:
-                tf.probability /= total_prob
-
-    def dump_json(self) -> str:
-        tf_list = [json.loads(tf.dump_json()) for tf in self.transforms]
-        pal_list = [list(color) for color in self.palette]
-        return json.dumps(
-            {
-                "transforms": tf_list,
-                "palette": pal_list,
-                "camera": list(self.camera),
-                "time": self.time,
-                "brightness": self.brightness,
-                "gamma": self.gamma,
-                "vibrancy": self.vibrancy
-            }
-        )
+
+@dataclasses.dataclass
+class RenderStats:
+    """Where the chaos game's samples went since the last reset. Samples are the iterations
+    after skip: nonfinite ones are where a particle went non-finite or escaped and was reseeded,
+    and warmup ones are those of reseeded particles not yet plotted again.
+    reseeded counts reseeds over every iteration, and selections every iteration's choice
+    of transform, per transform.
+    """
+
+    plotted: int
+    off_canvas: int
+    nonfinite: int
+    warmup: int
+    reseeded: int
+    selections: np.ndarray
 
     @staticmethod
-    def read_json(s: str) -> "RenderFrame":
-        d = json.loads(s)
-        return RenderFrame.from_dict(d)
-    
-    @staticmethod
-    def from_dict(d: dict[str, any]) -> 'RenderFrame':
-        transforms = list(map(pysulfur.Transform.from_dict, d["transforms"]))
-        palette = list(np.asarray(d["palette"], dtype=np.float64))
-        camera = np.asarray(d["camera"], dtype=np.float64)
-        time = d["time"]
-        brightness = d["brightness"]
-        gamma = d["gamma"]
-        vibrancy = d["vibrancy"]
-        return RenderFrame(transforms, palette, camera, time, brightness, gamma, vibrancy)
+    def from_counts(counts: np.ndarray) -> "RenderStats":
+        """Decode flame_kernel's counters, each a (low, high) pair of 32-bit words."""
+        counts = counts[0::2].astype(np.uint64) | (counts[1::2].astype(np.uint64) << 32)
+        return RenderStats(
+            *(int(count) for count in counts[:STATS_TRANSFORMS]),
+            counts[STATS_TRANSFORMS:].astype(np.int64),
+        )
+
+    @property
+    def samples(self) -> int:
+        return self.plotted + self.off_canvas + self.nonfinite + self.warmup
+
+    @property
+    def efficiency(self) -> float:
+        """Fraction of samples that landed in the histogram."""
+        return self.plotted / self.samples if self.samples else 0.0
+
+    def to_dict(self) -> dict[str, typing.Any]:
+        return {
+            "plotted": self.plotted,
+            "off_canvas": self.off_canvas,
+            "nonfinite": self.nonfinite,
+            "warmup": self.warmup,
+            "reseeded": self.reseeded,
+            "selections": self.selections.tolist(),
+            "efficiency": self.efficiency,
+        }
 
 
 class Renderer:
@@ -112,27 +125,54 @@ class Renderer:
     _ctx = None
     _device = None
     _queue = None
+    # Second in-order queue, so that finishing one frame can overlap the next one's chaos game
+    _readback_queue = None
     _program = None
     _kernels = None
+    _init_lock = threading.Lock()
 
     @classmethod
     def _init_cl(cls):
         """Helper class method to initialize global CL objects."""
-        if cls._ctx is None:
-            cls._ctx = bootstrap.create_ctx()
-        if cls._device is None:
-            cls._device = bootstrap.pick_device(cls._ctx)
-        if cls._queue is None:
-            cls._queue = cl.CommandQueue(cls._ctx, cls._device)
-        if cls._program is None:
-            cls._program = krnl.build_kernel(cls._ctx, cls._device)
-        if cls._kernels is None:
-            cls._kernels = [
-                cls._program.flame_kernel,
-                cls._program.downsample_kernel,
-                cls._program.rowmax_kernel,
-                cls._program.tonemap_kernel,
-            ]
+        with cls._init_lock:
+            if cls._ctx is None:
+                cls._ctx = bootstrap.create_ctx()
+            if cls._device is None:
+                cls._device = bootstrap.pick_device(cls._ctx)
+            if cls._queue is None:
+                cls._queue = cl.CommandQueue(cls._ctx, cls._device)
+            if cls._readback_queue is None:
+                cls._readback_queue = cl.CommandQueue(cls._ctx, cls._device)
+            if cls._program is None:
+                cls._program = krnl.build_kernel(cls._ctx, cls._device)
+            if cls._kernels is None:
+                cls._kernels = [
+                    cls._program.flame_kernel,
+                    cls._program.downsample_kernel,
+                    cls._program.rowmax_kernel,
+                    cls._program.tonemap_kernel,
+                    cls._program.rebin_kernel,
+                ]
+
+    @classmethod
+    def on_device(cls, device: cl.Device) -> type["Renderer"]:
+        """A Renderer class of its own for device, with its own context, queues and kernels,
+        for using a device other than the one that renderers share.
+        """
+        return type(
+            f"{cls.__name__}OnDevice",
+            (cls,),
+            {
+                "_ctx": cl.Context([device]),
+                "_device": device,
+                "_queue": None,
+                "_readback_queue": None,
+                "_program": None,
+                "_kernels": None,
+                # Its own, as the device may be benchmarked while the shared one is held
+                "_init_lock": threading.Lock(),
+            },
+        )
 
     def __init__(
         self,
@@ -142,9 +182,18 @@ class Renderer:
         n_particles: int,
         n_colors: int,
         n_variations: int,
-        seed: int = 12345,
+        seed: int = prng.DEFAULT_SEED,
+        generator: str = prng.LCG32,
+        profile: bool = False,
+        stats: bool = False,
     ):
-        Renderer._init_cl()
+        """With profile, this renderer gets its own pair of profiling-enabled queues,
+        and profiler collects the device time of every stage of its renders.
+        With stats, the chaos game counts where its samples go, for read_stats.
+        """
+        self._init_cl()
+        if generator not in prng.GENERATORS:
+            raise ValueError(f"Unknown generator {generator!r}")
         self.w = w
         self.h = h
         self.img_size = cltypes.make_uint2(w, h)
@@ -152,20 +201,50 @@ class Renderer:
         self.n_particles = n_particles
         self.n_colors = n_colors
         self.n_variations = n_variations
+        self.n_subframes = 1
+        self.n_symmetry = 1
         self.seed = seed
-        self.pixel_array = clarray.zeros(Renderer._queue, w * h * 4, np.uint32)
+        # With the Philox generator, every random number of a render is keyed by (seed, stream),
+        # so callers set stream to, say, the frame index to render frames reproducibly in any order
+        self.generator = generator
+        self.stream = 0
+        if profile:
+            properties = cl.command_queue_properties.PROFILING_ENABLE
+            self.queue = cl.CommandQueue(self._ctx, self._device, properties)
+            self.readback_queue = cl.CommandQueue(self._ctx, self._device, properties)
+            self.profiler = profiling.Profiler()
+        else:
+            self.queue = self._queue
+            self.readback_queue = self._readback_queue
+            self.profiler = None
+        # Renders are numbered by reset, and resolved pixels remember which render they hold,
+        # so that a tonemap overlapping the next render's chaos game is attributed correctly
+        self._render = 0
+        self._pixels_render: dict[int, int] = {}
+        self.collect_stats = stats
+        self.last_stats: typing.Optional[RenderStats] = None
+        # fingerprint() of the render the histogram holds, while it holds a finished one
+        self.histogram_fingerprint: typing.Optional[str] = None
+        # Recording is off until record is called; the kernel still needs buffers to point at
+        self.sample_capacity = 0
+        self.samples = clarray.zeros(self.queue, SAMPLE_FLOATS, np.float32)
+        self.sample_count = clarray.zeros(self.queue, 1, np.uint32)
+        # fingerprint() without camera or palette of the render whose samples are all recorded
+        self.samples_fingerprint: typing.Optional[str] = None
+        self.stats_counts = clarray.zeros(
+            self.queue, 2 * (STATS_TRANSFORMS + n_variations), np.uint32
+        )
+        self.pixel_array = clarray.zeros(self.queue, w * h * 4, np.uint32)
         self.histogram = clarray.zeros(
-            Renderer._queue, w * h * 4 * supersample * supersample, np.uint32
+            self.queue, w * h * 4 * supersample * supersample, np.uint32
         )
-        self.row_ctr = clarray.zeros(Renderer._queue, h, np.uint32)
+        self.row_ctr = clarray.zeros(self.queue, h, np.uint32)
         self.particles = clarray.empty(
-            Renderer._queue, (n_particles,), krnl.cl_types[krnl.particle_type_key]
-        )
-        self.palette = clarray.empty(Renderer._queue, n_colors, cltypes.float4)
-        self.camera = clarray.zeros(Renderer._queue, 6, np.float32)
-        self.variations = clarray.empty(
-            Renderer._queue, (n_variations,), krnl.cl_types[krnl.transform_type_key]
+            self.queue, (n_particles,), krnl.cl_types[krnl.particle_type_key]
         )
+        self.palette = clarray.empty(self.queue, n_colors, cltypes.float4)
+        self.camera = clarray.zeros(self.queue, 6, np.float32)
+        self.variations = krnl.DeviceTransforms(self.queue)
 
     def update_to_match(
         self,
@@ -192,19 +271,60 @@ class Renderer:
         self.n_colors = n_colors
         self.n_variations = n_variations
         self.img_size = cltypes.make_uint2(w, h)
-        self.pixel_array = clarray.zeros(Renderer._queue, w * h * 4, np.uint32)
+        self.histogram_fingerprint = None
+        self.pixel_array = clarray.zeros(self.queue, w * h * 4, np.uint32)
         self.histogram = clarray.zeros(
-            Renderer._queue, w * h * 4 * supersample * supersample, np.uint32
+            self.queue, w * h * 4 * supersample * supersample, np.uint32
         )
-        self.row_ctr = clarray.zeros(Renderer._queue, h, np.uint32)
+        self.row_ctr = clarray.zeros(self.queue, h, np.uint32)
         self.particles = clarray.empty(
-            Renderer._queue, (n_particles,), krnl.cl_types[krnl.particle_type_key]
+            self.queue, (n_particles,), krnl.cl_types[krnl.particle_type_key]
         )
-        self.palette = clarray.empty(Renderer._queue, n_colors, cltypes.float4)
-        self.variations = clarray.empty(
-            Renderer._queue, (n_variations,), krnl.cl_types[krnl.transform_type_key]
+        self.palette = clarray.empty(self.queue, n_colors, cltypes.float4)
+        self.n_subframes = 1
+        self.n_symmetry = 1
+        self.camera = clarray.zeros(self.queue, 6, np.float32)
+        self.variations = krnl.DeviceTransforms(self.queue)
+        self.stats_counts = clarray.zeros(
+            self.queue, 2 * (STATS_TRANSFORMS + n_variations), np.uint32
         )
 
+    def max_subframes(
+        self, transforms: typing.Optional[krnl.PackedTransforms] = None, n_symmetry: int = 1
+    ) -> int:
+        """The most sub-frames of the given transforms whose transforms and cameras fit in the
+        device's constant memory, with n_symmetry cameras each.
+        If no transforms are given, assumes every variation is active.
+        """
+        available = self._device.max_constant_buffer_size - self.n_colors * 16
+        if transforms is None:
+            per_subframe = self.n_variations * (
+                krnl.cl_types[krnl.transform_type_key].itemsize
+                + len(variations.Variation.variations)
+                * krnl.cl_types[krnl.variation_entry_type_key].itemsize
+                + variations.Variation.param_counter * 4
+            )
+        else:
+            per_subframe = transforms.nbytes
+        return max(1, available // (per_subframe + 24 * n_symmetry))
+
+    def _use_subframes(
+        self, n_subframes: int, transforms: krnl.PackedTransforms, n_symmetry: int = 1
+    ):
+        available = self._device.max_constant_buffer_size - self.n_colors * 16
+        n_cameras = n_subframes * n_symmetry
+        if n_cameras > 1 and transforms.nbytes + 24 * n_cameras > available:
+            per_subframe = transforms.nbytes // n_subframes + 24 * n_symmetry
+            raise ValueError(
+                f"{n_subframes} sub-frames do not fit in constant memory, "
+                f"the most that do is {max(1, available // per_subframe)}"
+            )
+        if n_subframes == self.n_subframes and n_symmetry == self.n_symmetry:
+            return
+        self.n_subframes = n_subframes
+        self.n_symmetry = n_symmetry
+        self.camera = clarray.zeros(self.queue, 6 * n_cameras, np.float32)
+
     def chaos_game(
         self,
         camera: types.AffineTransform,
@@ -212,22 +332,78 @@ class Renderer:
         palette: types.Palette,
         iters: int,
         skip: int,
+        subframes: typing.Sequence[
+            tuple[types.AffineTransform, typing.Sequence[pysulfur.Transform]]
+        ] = (),
+        blur_batch: int = DEFAULT_BLUR_BATCH,
+        start: int = 0,
     ):
-        """Run the chaos game, and do nothing else that is not necessary for it."""
-        self.palette.set(
-            np.asarray(
-                [cltypes.make_float4(*color) for color in palette], cltypes.float4
+        """Run the chaos game, and do nothing else that is not necessary for it.
+        If subframes are given, they are (camera, transforms) pairs sampled across the shutter
+        interval and used instead of camera and transforms, producing motion blur.
+        start is the number of iterations already run, which the Philox generator counts from.
+        """
+        self.enqueue_chaos_game(
+            camera, transforms, palette, iters, skip, subframes, blur_batch, start
+        ).wait()
+
+    def enqueue_chaos_game(
+        self,
+        camera: types.AffineTransform,
+        transforms: typing.Sequence[pysulfur.Transform],
+        palette: types.Palette,
+        iters: int,
+        skip: int,
+        subframes: typing.Sequence[
+            tuple[types.AffineTransform, typing.Sequence[pysulfur.Transform]]
+        ] = (),
+        blur_batch: int = DEFAULT_BLUR_BATCH,
+        start: int = 0,
+    ) -> cl.Event:
+        """Upload the frame's parameters and enqueue the chaos game without waiting for either.
+        Transforms may be given already packed, as by krnl.pack_transforms_from.
+        Each camera may also be several, shaped (copies, 6) as by frame_cameras, to plot every
+        point once through each; all sub-frames must have the same number.
+        Returns the kernel's event.
+        """
+        self.histogram_fingerprint = None
+        self.samples_fingerprint = None
+        if not subframes:
+            subframes = [(camera, transforms)]
+        if all(isinstance(transforms, krnl.PackedTransforms) for _, transforms in subframes):
+            host_transforms = krnl.PackedTransforms.concatenate(
+                [transforms for _, transforms in subframes]
             )
-        )
-        self.camera.set(np.asarray(camera, np.float32))
-        krnl.transform_into_cl(transforms, self.variations)
-        Renderer._kernels[0](
-            Renderer._queue,
+        else:
+            host_transforms = krnl.pack_transforms(
+                list(itertools.chain.from_iterable(transforms for _, transforms in subframes))
+            )
+        cameras = [np.asarray(camera, np.float32).reshape(-1, 6) for camera, _ in subframes]
+        if any(len(copies) != len(cameras[0]) for copies in cameras):
+            raise ValueError("Every sub-frame must have the same number of symmetric cameras")
+        self._use_subframes(len(subframes), host_transforms, len(cameras[0]))
+        uploads = [
+            cl.enqueue_copy(
+                self.queue,
+                self.palette.data,
+                np.asarray([cltypes.make_float4(*color) for color in palette], cltypes.float4),
+                is_blocking=False,
+            ),
+            cl.enqueue_copy(
+                self.queue,
+                self.camera.data,
+                np.concatenate(cameras).reshape(-1),
+                is_blocking=False,
+            ),
+        ]
+        uploads += krnl.transform_into_cl(host_transforms, self.variations, async_=True)
+        event = self._kernels[0](
+            self.queue,
             (self.n_particles,),
             None,
             self.particles.data,
             self.histogram.data,
-            self.variations.data,
+            *self.variations.args,
             self.palette.data,
             self.camera.data,
             np.uint32(iters),
@@ -236,7 +412,51 @@ class Renderer:
             np.uint32(self.n_variations),
             np.uint32(self.n_colors),
             np.uint32(self.supersample),
-        ).wait()
+            np.uint32(self.n_subframes),
+            np.uint32(self.n_symmetry),
+            np.uint32(max(1, blur_batch)),
+            np.uint32(prng.GENERATORS.index(self.generator)),
+            cltypes.make_uint2(self.seed & 0xFFFFFFFF, self.stream & 0xFFFFFFFF),
+            np.uint32(start),
+            self.stats_counts.data,
+            cl.LocalMemory(4 * (STATS_TRANSFORMS + self.n_variations)),
+            np.uint32(self.collect_stats),
+            self.samples.data,
+            self.sample_count.data,
+            np.uint32(self.sample_capacity),
+        )
+        if self.profiler is not None:
+            for upload in uploads:
+                self.profiler.record(self._render, profiling.UPLOAD, upload)
+            self.profiler.record(self._render, profiling.CHAOS_GAME, event)
+        return event
+
+    def chaos_game_from(
+        self,
+        camera: types.AffineTransform,
+        transforms: typing.Sequence[pysulfur.Transform],
+        palette: types.Palette,
+        start: int,
+        iters: int,
+        skip: int,
+        subframes: typing.Sequence[
+            tuple[types.AffineTransform, typing.Sequence[pysulfur.Transform]]
+        ] = (),
+        blur_batch: int = DEFAULT_BLUR_BATCH,
+    ):
+        """Continue a chaos game that has already run start iterations for another iters,
+        where the first skip iterations of the whole game are not plotted.
+        """
+        self.chaos_game(
+            camera,
+            transforms,
+            palette,
+            iters,
+            min(max(skip - start, 0), iters),
+            subframes,
+            blur_batch,
+            start,
+        )
 
     def image(
         self, vibrancy: float = 1, gamma: float = 0.8, brightness: float = 20
@@ -247,61 +467,186 @@ class Renderer:
         - Perform tonemapping,
         - Return a PIL Image RGB object
         """
-        self.pixel_array.fill(0)
+        resolved = self.enqueue_resolve(self.pixel_array)
+        imgdata, done = self.enqueue_tonemap(
+            self.pixel_array, vibrancy, gamma, brightness, [resolved]
+        )
+        done.wait()
+        return self.to_image(imgdata)
+
+    def enqueue_resolve(
+        self,
+        pixels: clarray.Array,
+        wait_for: typing.Optional[typing.Sequence[cl.Event]] = None,
+    ) -> cl.Event:
+        """Enqueue reducing the histogram to image resolution in pixels, after the chaos game.
+        Once this completes, the histogram is free to be reset for the next frame.
+        """
         if self.supersample > 1:
-            Renderer._kernels[1](
-                Renderer._queue,
+            event = self._kernels[1](
+                self.queue,
                 (self.w * self.h,),
                 None,
                 self.histogram.data,
-                self.pixel_array.data,
+                pixels.data,
                 self.img_size,
                 np.uint32(self.supersample),
-            ).wait()
+                wait_for=wait_for,
+            )
         else:
-            self.pixel_array.set(self.histogram.get())
-        Renderer._kernels[2](
-            Renderer._queue,
+            event = cl.enqueue_copy(
+                self.queue, pixels.data, self.histogram.data, wait_for=wait_for
+            )
+        if self.profiler is not None:
+            self._pixels_render[pixels.data.int_ptr] = self._render
+            self.profiler.record(self._render, profiling.RESOLVE, event)
+        return event
+
+    def enqueue_tonemap(
+        self,
+        pixels: clarray.Array,
+        vibrancy: float,
+        gamma: float,
+        brightness: float,
+        wait_for: typing.Optional[typing.Sequence[cl.Event]] = None,
+    ) -> tuple[np.ndarray, cl.Event]:
+        """Tonemap resolved pixels in place on the readback queue and start copying them back.
+        Blocks only until the maximum alpha is known. Returns the host array being filled,
+        and the event to wait on before reading it.
+        """
+        queue = self.readback_queue
+        rowmax = self._kernels[2](
+            queue,
             (self.w,),
             None,
-            self.pixel_array.data,
+            pixels.data,
             self.row_ctr.data,
             self.img_size,
-        ).wait()
-        maximum = self.row_ctr.get().max()
-        Renderer._kernels[3](
-            Renderer._queue,
+            wait_for=wait_for,
+        )
+        maxima = np.empty(self.h, np.uint32)
+        maxima_event = cl.enqueue_copy(queue, maxima, self.row_ctr.data)
+        tonemap = self._kernels[3](
+            queue,
             (self.w * self.h,),
             None,
-            self.pixel_array.data,
+            pixels.data,
             self.img_size,
             np.float32(brightness),
             np.float32(gamma),
             np.float32(vibrancy),
-            np.uint32(maximum),
+            np.uint32(maxima.max()),
             np.uint32(1),
-        ).wait()
-        imgdata = self.pixel_array.get()
+        )
+        imgdata = np.empty(self.w * self.h * 4, np.uint32)
+        readback = cl.enqueue_copy(queue, imgdata, pixels.data, is_blocking=False)
+        if self.profiler is not None:
+            render = self._pixels_render.get(pixels.data.int_ptr, self._render)
+            self.profiler.record(render, profiling.ROWMAX, rowmax)
+            self.profiler.record(render, profiling.MAXIMA, maxima_event)
+            self.profiler.record(render, profiling.TONEMAP, tonemap)
+            self.profiler.record(render, profiling.READBACK, readback)
+        return imgdata, readback
+
+    def to_image(self, imgdata: np.ndarray) -> Image.Image:
+        """Turn tonemapped pixels copied back by enqueue_tonemap into a PIL RGB Image."""
         return Image.fromarray(
             imgdata.reshape(self.h, self.w, 4)[:, :, :3].astype(np.uint8)
         )
 
     def reset(self):
-        """Fill the histogram with 0s"""
-        self.histogram.fill(0)
+        """Fill the histogram with 0s, starting a new render"""
+        self._render += 1
+        self.histogram_fingerprint = None
+        self.samples_fingerprint = None
+        if self.collect_stats:
+            self.stats_counts.fill(0)
+        if self.sample_capacity:
+            self.sample_count.fill(0)
+        if self.profiler is None:
+            self.histogram.fill(0)
+            return
+        event = cl.enqueue_fill_buffer(
+            self.queue, self.histogram.data, np.uint32(0), 0, self.histogram.nbytes
+        )
+        self.profiler.record(self._render, profiling.CLEAR, event)
+
+    def enqueue_read_stats(self) -> tuple[np.ndarray, cl.Event]:
+        """Start copying back the counters of the chaos game enqueued so far.
+        Returns the host array being filled, for RenderStats.from_counts once the event completes.
+        """
+        counts = np.empty(self.stats_counts.shape, np.uint32)
+        return counts, cl.enqueue_copy(
+            self.queue, counts, self.stats_counts.data, is_blocking=False
+        )
+
+    def read_stats(self) -> RenderStats:
+        """Where the samples of the chaos game since the last reset went.
+        Only counted if this renderer was created with stats=True.
+        """
+        counts, event = self.enqueue_read_stats()
+        event.wait()
+        return RenderStats.from_counts(counts)
+
+    def save_state(self) -> RenderState:
+        """Copy the histogram and particles back to the host."""
+        return RenderState(self.histogram.get(), self.particles.get())
+
+    def load_state(self, state: RenderState):
+        """Restore a state returned by save_state. The renderer must have the same dimensions."""
+        histogram = np.ascontiguousarray(state.histogram).reshape(-1)
+        particles = np.ascontiguousarray(state.particles)
+        if histogram.shape != self.histogram.shape or particles.shape != self.particles.shape:
+            raise ValueError("Saved state does not match this renderer's dimensions")
+        if particles.dtype != self.particles.dtype:
+            # Saved before particles had all their current fields, which start at 0
+            upgraded = np.zeros(particles.shape, self.particles.dtype)
+            for name in particles.dtype.names:
+                upgraded[name] = particles[name]
+            particles = upgraded
+        self.histogram.set(histogram)
+        self.particles.set(particles)
+        self.histogram_fingerprint = None
+
+    def save_checkpoint(self, dpath: str, **meta):
+        """Write the histogram and particles to a checkpoint directory, along with
+        this renderer's dimensions and any extra metadata given.
+        """
+        state = self.save_state()
+        meta.update(
+            width=self.w,
+            height=self.h,
+            supersample=self.supersample,
+            n_particles=self.n_particles,
+        )
+        checkpoint.save(dpath, state.histogram, state.particles, meta)
+
+    def load_checkpoint(self, dpath: str) -> checkpoint.Checkpoint:
+        """Resize to match a checkpoint and resume from its state. Returns the checkpoint."""
+        ckpt = checkpoint.load(dpath)
+        if ckpt.particles is None:
+            raise ValueError("Checkpoint has no particles to resume from")
+        self.update_to_match(
+            ckpt.width,
+            ckpt.height,
+            ckpt.supersample,
+            ckpt.meta["n_particles"],
+            self.n_colors,
+            self.n_variations,
+        )
+        self.load_state(RenderState(ckpt.histogram, ckpt.particles))
+        return ckpt
 
     def randomize_particles(self):
         """Reset all particles to pseudo-random starting points"""
-        self.particles.set(
-            np.array(
-                [
-                    rand_particle(np.random.randint((1 << 31) - 1))
-                    for i in range(self.n_particles)
-                ],
-                dtype=krnl.cl_types[krnl.particle_type_key],
-            )
-        )
-        self.seed = prng.lcg32_skip(self.seed, (self.n_particles << 8) + 1)
+        if self.generator == prng.PHILOX:
+            particles = philox_particles(self.n_particles, (self.seed, self.stream))
+        else:
+            particles = rand_particles(np.random.randint((1 << 31) - 1, size=self.n_particles))
+            self.seed = prng.lcg32_skip(self.seed, (self.n_particles << 8) + 1)
+        event = cl.enqueue_copy(self.queue, self.particles.data, particles, is_blocking=False)
+        if self.profiler is not None:
+            self.profiler.record(self._render, profiling.UPLOAD, event)
 
     def render(
         self,
@@ -313,9 +658,219 @@ class Renderer:
         vibrancy: float = 1,
         gamma: float = 0.8,
         brightness: float = 20,
+        subframes: typing.Sequence[
+            tuple[types.AffineTransform, typing.Sequence[pysulfur.Transform]]
+        ] = (),
+        blur_batch: int = DEFAULT_BLUR_BATCH,
+        reuse: bool = False,
     ) -> Image.Image:
-        """Perform a start-to-finish rendering job, returning a PIL RGB Image object."""
-        self.reset()
-        self.randomize_particles()
-        self.chaos_game(camera, transforms, palette, iters, skip)
+        """Perform a start-to-finish rendering job, returning a PIL RGB Image object.
+        With stats on, last_stats holds the render's counters afterwards.
+        With reuse, if the histogram already holds a render of the same inputs, only the
+        tonemapping is redone, so changing just vibrancy, gamma or brightness is quick.
+        While recording, if every sample of a render of the same inputs but for camera
+        and palette was recorded, they are rebinned instead of running the chaos game.
+        With the LCG generator that also means repeating a render repeats its noise.
+        """
+        fingerprint = self.fingerprint(
+            camera, transforms, palette, iters, skip, subframes, blur_batch
+        )
+        if reuse and fingerprint == self.histogram_fingerprint:
+            pass
+        elif reuse and self.samples_fingerprint is not None and (
+            self.samples_fingerprint
+            == self.fingerprint(None, transforms, None, iters, skip, subframes, blur_batch)
+        ):
+            self.rebin(camera, palette)
+            self.histogram_fingerprint = fingerprint
+        else:
+            self.reset()
+            self.randomize_particles()
+            self.chaos_game(camera, transforms, palette, iters, skip, subframes, blur_batch)
+            if self.collect_stats:
+                self.last_stats = self.read_stats()
+            self.histogram_fingerprint = fingerprint
+            # Samples of motion blurred renders came through many cameras, so cannot be rebinned
+            if len(subframes) <= 1 and self.recorded_all():
+                self.samples_fingerprint = self.fingerprint(
+                    None, transforms, None, iters, skip, subframes, blur_batch
+                )
         return self.image(vibrancy, gamma, brightness)
+
+    def fingerprint(
+        self,
+        camera: typing.Optional[types.AffineTransform],
+        transforms: typing.Sequence[pysulfur.Transform],
+        palette: typing.Optional[types.Palette],
+        iters: int,
+        skip: int,
+        subframes: typing.Sequence[
+            tuple[types.AffineTransform, typing.Sequence[pysulfur.Transform]]
+        ] = (),
+        blur_batch: int = DEFAULT_BLUR_BATCH,
+    ) -> str:
+        """A digest of everything that decides the histogram a render of these inputs
+        leaves at this renderer's size: not vibrancy, gamma or brightness.
+        Without camera and palette, of everything that decides the samples it records.
+        With Philox that includes the seed and stream; LCG renders are not told apart.
+        """
+        digest = hashlib.sha1()
+        digest.update(
+            repr(
+                (
+                    (self.w, self.h, self.supersample) if camera is not None else None,
+                    self.n_particles,
+                    self.generator,
+                    (self.seed, self.stream) if self.generator == prng.PHILOX else None,
+                    iters,
+                    skip,
+                    blur_batch if subframes else None,
+                )
+            ).encode()
+        )
+        if palette is not None:
+            digest.update(np.ascontiguousarray(palette, np.float64).tobytes())
+        for sub_camera, sub_transforms in subframes or [(camera, transforms)]:
+            if camera is not None:
+                digest.update(np.ascontiguousarray(sub_camera, np.float64).tobytes())
+            if not isinstance(sub_transforms, krnl.PackedTransforms):
+                sub_transforms = krnl.pack_transforms(sub_transforms)
+            for array in sub_transforms:
+                digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()
+
+    def record(self, budget: int):
+        """Record up to budget bytes of samples of every chaos game from the next reset,
+        for rebin. A budget too small for one sample stops recording.
+        """
+        capacity = min(budget, self._device.max_mem_alloc_size) // (SAMPLE_FLOATS * 4)
+        self.samples_fingerprint = None
+        self.sample_capacity = capacity
+        self.samples = clarray.zeros(self.queue, max(capacity, 1) * SAMPLE_FLOATS, np.float32)
+        self.sample_count.fill(0)
+
+    def read_sample_count(self) -> int:
+        """Samples the chaos game has come across since the last reset, recorded or not."""
+        return int(self.sample_count.get()[0])
+
+    def recorded_all(self) -> bool:
+        """Whether recording is on, and has kept every sample since the last reset."""
+        return bool(self.sample_capacity) and self.read_sample_count() <= self.sample_capacity
+
+    def get_samples(self) -> np.ndarray:
+        """The recorded samples, shaped (n, SAMPLE_FLOATS)."""
+        n = min(self.read_sample_count(), self.sample_capacity)
+        return self.samples[: n * SAMPLE_FLOATS].get().reshape(n, SAMPLE_FLOATS)
+
+    def save_samples(self, fpath: str):
+        """Write the recorded samples to an .npy file, for load_samples."""
+        np.save(fpath, self.get_samples())
+
+    def load_samples(self, samples: typing.Union[str, np.ndarray]):
+        """Replace the recorded samples with those of an .npy file, which is memory-mapped
+        rather than read whole, or an array shaped as by get_samples. Recording grows
+        to hold them if it must; they have no fingerprint, so only rebin uses them.
+        """
+        if isinstance(samples, str):
+            samples = np.load(samples, mmap_mode="r")
+        samples = np.asarray(samples, np.float32).reshape(-1, SAMPLE_FLOATS)
+        if len(samples) > self.sample_capacity:
+            self.record(samples.nbytes)
+        self.samples_fingerprint = None
+        if len(samples):
+            self.samples[: samples.size].set(np.ascontiguousarray(samples).reshape(-1))
+        self.sample_count.set(np.array([len(samples)], np.uint32))
+
+    def rebin(self, camera: types.AffineTransform, palette: types.Palette):
+        """Replace the histogram with the recorded samples plotted through camera, or cameras
+        shaped (copies, 6) as by frame_cameras, and palette, without running the chaos game.
+        When every sample of a render was recorded, this gives the histogram that render
+        would have given with this camera and palette.
+        """
+        cameras = np.asarray(camera, np.float32).reshape(-1, 6)
+        self.histogram_fingerprint = None
+        self.histogram.fill(0)
+        if cameras.size > self.camera.size:
+            self.camera = clarray.zeros(self.queue, cameras.size, np.float32)
+        cl.enqueue_copy(
+            self.queue,
+            self.palette.data,
+            np.asarray([cltypes.make_float4(*color) for color in palette], cltypes.float4),
+            is_blocking=False,
+        )
+        cl.enqueue_copy(self.queue, self.camera.data, cameras.reshape(-1), is_blocking=False)
+        n_samples = min(self.read_sample_count(), self.sample_capacity)
+        if not n_samples:
+            return
+        self._kernels[4](
+            self.queue,
+            (min(n_samples, REBIN_THREADS),),
+            None,
+            self.samples.data,
+            np.uint32(n_samples),
+            self.histogram.data,
+            self.palette.data,
+            self.camera.data,
+            self.img_size,
+            np.uint32(self.n_colors),
+            np.uint32(self.supersample),
+            np.uint32(len(cameras)),
+        ).wait()
+
+    def rebin_frame(self, frame: RenderFrame) -> Image.Image:
+        """Rebin the recorded samples through a normalized frame's cameras and palette,
+        and tonemap the result as the frame asks. The frame's transforms are not used.
+        """
+        self.rebin(self.frame_cameras(frame), frame.palette)
+        return self.image(frame.vibrancy, frame.gamma, frame.brightness)
+
+    def histogram_camera(self, camera: types.AffineTransform) -> types.AffineTransform:
+        """Scale a camera mapping onto the unit square so that it maps onto the histogram."""
+        return pysulfur.affine_compose(
+            camera,
+            np.array(
+                [self.w * self.supersample, 0, 0, 0, self.h * self.supersample, 0]
+            ),
+        )
+
+    def frame_cameras(self, frame: RenderFrame) -> np.ndarray:
+        """The frame's histogram camera composed with each of its symmetric copies,
+        shaped (copies, 6), for the camera argument of chaos_game.
+        """
+        return pysulfur.symmetric_cameras(
+            self.histogram_camera(frame.camera), frame.symmetry, frame.mirror
+        )
+
+    def shutter_subframes(
+        self, shutter: typing.Sequence[RenderFrame]
+    ) -> list[tuple[types.AffineTransform, typing.Sequence[pysulfur.Transform]]]:
+        """The (histogram cameras, transforms) pairs of normalized frames across a shutter."""
+        return [(self.frame_cameras(frame), frame.transforms) for frame in shutter]
+
+    def render_frame(
+        self,
+        frame: RenderFrame,
+        iters: int,
+        skip: int,
+        shutter: typing.Sequence[RenderFrame] = (),
+        blur_batch: int = DEFAULT_BLUR_BATCH,
+        reuse: bool = False,
+    ) -> Image.Image:
+        """Render a normalized RenderFrame at this renderer's current size and settings.
+        If normalized frames across its shutter interval are given, such as from
+        Project.shutter_frames, the render is motion blurred across them.
+        The palette and tonemapping still come from frame. reuse is as for render.
+        """
+        return self.render(
+            self.frame_cameras(frame),
+            frame.transforms,
+            frame.palette,
+            iters,
+            skip,
+            frame.vibrancy,
+            frame.gamma,
+            frame.brightness,
+            self.shutter_subframes(shutter),
+            blur_batch,
+            reuse,
+        )
@@ -25,6 +25,42 @@ uint lcg32_skip(uint seed, uint skip) {
     return new_seed & MASK32;
 }
 
+// Philox4x32-10 of Salmon et al., matching prng.philox4x32
+uint4 philox4x32_10(uint4 ctr, uint2 key) {
+    for (uint round = 0; round < 10; round++) {
+        if (round) {
+            key += (uint2)(PHILOX_W0, PHILOX_W1);
+        }
+        uint hi0 = mul_hi(PHILOX_M0, ctr.x);
+        uint hi1 = mul_hi(PHILOX_M1, ctr.z);
+        ctr = (uint4)(hi1 ^ ctr.y ^ key.x, PHILOX_M1 * ctr.z, hi0 ^ ctr.w ^ key.y, PHILOX_M0 * ctr.x);
+    }
+    return ctr;
+}
+
+// The next uniform value from a particle's LCG seed, or from a word of its Philox output
+float next_uniform(const uint prng, uint* seed, const uint philox_word) {
+    if (prng == PRNG_PHILOX) {
+        return (float)philox_word / MASK32;
+    }
+    *seed = lcg32(*seed);
+    return (float)*seed / MASK32;
+}
+
+// Add to a 64-bit counter stored as (low, high) words, without needing 64-bit atomics.
+// The counter is only consistent once every addition has completed.
+void atomic_add_wide(volatile __global uint* counter, const uint value) {
+    uint old = atomic_add(counter, value);
+    if (old + value < old) {
+        atomic_inc(counter + 1);
+    }
+}
+
+// Whether a point is non-finite, or so far out that its particle is not coming back
+bool escaped(const float2 xy) {
+    return !(fabs(xy.x) < ESCAPE_RADIUS && fabs(xy.y) < ESCAPE_RADIUS);
+}
+
 float2 affine_transform(__constant float* affine, float2 xy) {
     return (float2)(xy.x * affine[0] + xy.y * affine[1] + affine[2], xy.x * affine[3] + xy.y * affine[4] + affine[5]);
 }
@@ -39,3 +75,26 @@ uchar4 sample_palette(__constant float4* palette, const float color, const uint
     }
     return (uchar4)(color0.x, color0.y, color0.z, color0.w);
 }
+
+// Add a coloured point to the histogram through a camera, returning whether it was on canvas
+bool plot_point(
+    __global uint* histogram,
+    const uint2 histogram_size,
+    __constant float* camera,
+    const float2 xy,
+    const uchar4 rgba
+) {
+    float2 pixel = affine_transform(camera, xy);
+    uint ux = (uint)pixel.x;
+    uint uy = (uint)pixel.y;
+    if (ux < histogram_size.x && uy < histogram_size.y) {
+        uint pixel_id = ux + uy * histogram_size.x;
+        __global uint* pixptr = histogram + pixel_id * 4;
+        atomic_add(pixptr + 0, rgba.x);
+        atomic_add(pixptr + 1, rgba.y);
+        atomic_add(pixptr + 2, rgba.z);
+        atomic_add(pixptr + 3, 1);
+        return true;
+    }
+    return false;
+}
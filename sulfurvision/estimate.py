@@ -0,0 +1,257 @@
+"""
+Predictions of the memory and time a render needs, from the device's limits and a short
+calibration run, with an error and advice for renders the device cannot hold
+"""
+
+import dataclasses
+import math
+import time
+import typing
+
+from sulfurvision import prng
+from sulfurvision.frames import RenderFrame
+
+if typing.TYPE_CHECKING:
+    from sulfurvision.cl import bootstrap
+
+# particle_t: float2 xy, uint seed, float color and uint warmup
+PARTICLE_BYTES = 24
+# Fraction of the device's global memory a render plans on using; drivers keep some back
+MEMORY_HEADROOM = 0.9
+
+CALIBRATION_PARTICLES = 1 << 14
+CALIBRATION_ITERS = 64
+# Side of the square calibration histogram
+CALIBRATION_SIZE = 256
+
+
+@dataclasses.dataclass
+class Footprint:
+    """Bytes a render holds, on the device and on the host."""
+
+    histogram: int
+    pixels: int
+    particles: int
+    # Palette, cameras, transforms, row maxima and counters
+    other: int
+    host: int
+
+    @property
+    def device(self) -> int:
+        return self.histogram + self.pixels + self.particles + self.other
+
+    @property
+    def largest(self) -> int:
+        """The largest single buffer, which must fit in one allocation."""
+        return max(self.histogram, self.pixels, self.particles)
+
+
+@dataclasses.dataclass
+class Calibration:
+    """Throughput measured on the device with a frame's own flame."""
+
+    samples_per_second: float
+    # Resolving and tonemapping, per cell of the supersampled histogram
+    seconds_per_cell: float
+
+
+@dataclasses.dataclass
+class Estimate:
+    limits: "bootstrap.DeviceLimits"
+    footprint: Footprint
+    fits: bool
+    # The largest supersampling at or below the requested one that fits, 0 if none does
+    max_supersample: int
+    recommendations: list[str]
+    # Why the render exceeds device memory, None if it fits
+    error: typing.Optional[str] = None
+    # Both NaN without a calibration
+    samples_per_second: float = math.nan
+    seconds_per_frame: float = math.nan
+    frames: int = 1
+
+    @property
+    def seconds(self) -> float:
+        return self.seconds_per_frame * self.frames
+
+    def to_dict(self) -> dict[str, typing.Any]:
+        return {
+            "device": self.limits.name,
+            "global_mem_size": self.limits.global_mem_size,
+            "max_mem_alloc_size": self.limits.max_mem_alloc_size,
+            "device_bytes": self.footprint.device,
+            "histogram_bytes": self.footprint.histogram,
+            "host_bytes": self.footprint.host,
+            "fits": self.fits,
+            "max_supersample": self.max_supersample,
+            "error": self.error,
+            "samples_per_second": self.samples_per_second,
+            "seconds_per_frame": self.seconds_per_frame,
+            "seconds": self.seconds,
+            "recommendations": list(self.recommendations),
+        }
+
+
+def footprint(
+    width: int,
+    height: int,
+    supersample: int,
+    particles: int,
+    n_colors: int,
+    n_cameras: int = 1,
+    transforms_bytes: int = 0,
+    pixel_buffers: int = 1,
+) -> Footprint:
+    """Bytes a Renderer of the given size holds. Exporters overlapping frames
+    resolve into two pixel buffers rather than one.
+    """
+    pixels = width * height * 4 * 4
+    return Footprint(
+        histogram=pixels * supersample * supersample,
+        pixels=pixels * pixel_buffers,
+        particles=particles * PARTICLE_BYTES,
+        other=n_colors * 16 + n_cameras * 24 + transforms_bytes + height * 4 + 256,
+        # Tonemapped pixels read back, and the RGB image made from them
+        host=pixels * pixel_buffers + width * height * 3,
+    )
+
+
+def fits(limits: "bootstrap.DeviceLimits", needs: Footprint) -> bool:
+    return (
+        needs.largest <= limits.max_mem_alloc_size
+        and needs.device <= limits.global_mem_size * MEMORY_HEADROOM
+    )
+
+
+def calibrate(
+    frame: RenderFrame, particles: int = CALIBRATION_PARTICLES, renderer=None
+) -> Calibration:
+    """Time a short chaos game and tonemap of a normalized frame on a small histogram.
+    The chaos game runs with up to CALIBRATION_PARTICLES particles, so larger renders
+    that fill the device better are predicted conservatively.
+    renderer, if given, is resized to suit and its histogram cleared.
+    """
+    from sulfurvision.cl import render
+
+    particles = min(particles, CALIBRATION_PARTICLES)
+    if renderer is None:
+        renderer = render.Renderer(
+            CALIBRATION_SIZE,
+            CALIBRATION_SIZE,
+            1,
+            particles,
+            len(frame.palette),
+            len(frame.transforms),
+            generator=prng.PHILOX,
+        )
+    else:
+        renderer.update_to_match(
+            CALIBRATION_SIZE,
+            CALIBRATION_SIZE,
+            1,
+            particles,
+            len(frame.palette),
+            len(frame.transforms),
+        )
+    cameras = renderer.frame_cameras(frame)
+    renderer.reset()
+    renderer.randomize_particles()
+    # The first launch pays for setting up the kernel and uploading the transforms
+    renderer.chaos_game(cameras, frame.transforms, frame.palette, 1, 0)
+    start = time.perf_counter()
+    renderer.chaos_game(
+        cameras, frame.transforms, frame.palette, CALIBRATION_ITERS, 0, start=1
+    )
+    chaos_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    renderer.image(frame.vibrancy, frame.gamma, frame.brightness)
+    image_seconds = time.perf_counter() - start
+    return Calibration(
+        particles * CALIBRATION_ITERS / max(chaos_seconds, 1e-9),
+        image_seconds / (CALIBRATION_SIZE * CALIBRATION_SIZE),
+    )
+
+
+def estimate(
+    frame: RenderFrame,
+    width: int,
+    height: int,
+    supersample: int,
+    particles: int,
+    iters: int,
+    frames: int = 1,
+    pixel_buffers: int = 1,
+    calibration: typing.Optional[Calibration] = None,
+    calibrate_device: bool = True,
+    limits: typing.Optional["bootstrap.DeviceLimits"] = None,
+) -> Estimate:
+    """Predict the memory and time rendering frames like a normalized frame takes.
+    Without a calibration, one is measured unless calibrate_device is false,
+    in which case the times are NaN. Renders the device cannot hold come with an
+    error saying why, and recommendations of a lower supersampling or fewer particles.
+    limits are those of the device renderers share unless given.
+    """
+    from sulfurvision.cl import bootstrap, krnl, render
+
+    if limits is None:
+        render.Renderer._init_cl()
+        limits = bootstrap.device_limits(render.Renderer._device)
+    n_cameras = len(frame.cameras())
+    transforms_bytes = krnl.pack_transforms(frame.transforms).nbytes
+
+    def needs(w: int, h: int, ss: int) -> Footprint:
+        return footprint(
+            w, h, ss, particles, len(frame.palette), n_cameras, transforms_bytes, pixel_buffers
+        )
+
+    requested = needs(width, height, supersample)
+    max_supersample = next(
+        (ss for ss in range(supersample, 0, -1) if fits(limits, needs(width, height, ss))), 0
+    )
+
+    error = None
+    recommendations = []
+    if not fits(limits, requested):
+        reasons = []
+        if requested.largest > limits.max_mem_alloc_size:
+            reasons.append(
+                f"its {_mib(requested.largest)} largest buffer is more than the "
+                f"{_mib(limits.max_mem_alloc_size)} the device allocates at once"
+            )
+        if requested.device > limits.global_mem_size * MEMORY_HEADROOM:
+            reasons.append(
+                f"it needs {_mib(requested.device)} of the device's "
+                f"{_mib(limits.global_mem_size)}"
+            )
+        error = f"Exceeds device memory: {' and '.join(reasons)}"
+        if max_supersample:
+            recommendations.append(f"Lower supersampling to {max_supersample}")
+        if requested.particles > limits.max_mem_alloc_size or not max_supersample:
+            most = int(
+                min(
+                    limits.max_mem_alloc_size,
+                    limits.global_mem_size * MEMORY_HEADROOM
+                    - needs(width, height, 1).device
+                    + requested.particles,
+                )
+                // PARTICLE_BYTES
+            )
+            recommendations.append(f"Use at most {max(most, 0)} particles")
+
+    result = Estimate(
+        limits, requested, fits(limits, requested), max_supersample, recommendations, error,
+        frames=frames,
+    )
+    if calibration is None and calibrate_device:
+        calibration = calibrate(frame, particles)
+    if calibration is not None:
+        result.samples_per_second = calibration.samples_per_second
+        result.seconds_per_frame = (
+            particles * iters / calibration.samples_per_second
+            + width * height * supersample * supersample * calibration.seconds_per_cell
+        )
+    return result
+
+
+def _mib(n_bytes: int) -> str:
+    return f"{n_bytes / (1 << 20):.0f} MiB"
@@ -0,0 +1,249 @@
+"""
+Animation export with the device, the host and the encoders all kept busy
+
+For each frame, the chaos game and the reduction of its histogram run on the renderer's
+main queue. Its tonemap and readback then run on the readback queue into one of two pixel
+buffers, while the next frame's chaos game is already queued behind it. Encoding
+happens on a thread pool, and frames are written to the sink in order.
+"""
+
+import collections
+import concurrent.futures
+import dataclasses
+import os
+import threading
+import time
+import typing
+
+import pyopencl as cl
+import pyopencl.array as clarray
+
+from sulfurvision import sinks
+from sulfurvision.batch import FrameTiming
+from sulfurvision.cl import profiling
+from sulfurvision.frames import RenderFrame
+
+# Frames allowed to be rendered but not yet written, beyond which rendering waits
+DEFAULT_MAX_PENDING = 4
+
+
+@dataclasses.dataclass
+class ExportStats:
+    timings: list[FrameTiming]
+    wall_seconds: float
+    device_seconds: float
+    # Per-stage device time, when the renderer was created with profile=True
+    stages: typing.Optional[dict[str, profiling.StageStats]] = None
+
+    @property
+    def device_utilisation(self) -> float:
+        """Fraction of the export's wall time during which the device had work it could run."""
+        return self.device_seconds / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+
+class _DeviceClock:
+    """Tracks when enqueued work is eligible to run and when it completes, via event callbacks,
+    and from those, how long the device was busy with at least one command.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.intervals: list[tuple[float, float]] = []
+
+    def track(self, event: cl.Event, ready: float, after: typing.Optional[list] = None) -> list:
+        """Record event as running from the later of ready and the end of after until it completes.
+        Returns a one-item list that will hold the completion time.
+        """
+        completed = [None]
+
+        def _callback(_):
+            now = time.perf_counter()
+            with self.lock:
+                start = ready if after is None or after[0] is None else max(ready, after[0])
+                completed[0] = now
+                self.intervals.append((min(start, now), now))
+
+        event.set_callback(cl.command_execution_status.COMPLETE, _callback)
+        return completed
+
+    def busy_seconds(self) -> float:
+        with self.lock:
+            intervals = sorted(self.intervals)
+        total = 0.0
+        end = None
+        for start, stop in intervals:
+            if end is None or start > end:
+                total += stop - start
+                end = stop
+            elif stop > end:
+                total += stop - end
+                end = stop
+        return total
+
+
+@dataclasses.dataclass
+class _InFlight:
+    """A frame whose chaos game has been enqueued but whose tonemap has not."""
+
+    index: int
+    time: float
+    frame: RenderFrame
+    pixels: clarray.Array
+    resolved: cl.Event
+    resolved_at: list
+    started: float
+    # Counters being read back, if the renderer collects stats
+    stats: typing.Optional[tuple] = None
+
+
+class AnimationExporter:
+    """Renders a sequence of frames into a sink with one Renderer, double-buffered.
+    Every frame must have the same numbers of transforms and colours.
+    """
+
+    def __init__(
+        self,
+        renderer,
+        sink: sinks.FrameSink,
+        encoders: typing.Optional[int] = None,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        verbose: bool = False,
+    ):
+        self.renderer = renderer
+        self.sink = sink
+        self.encoders = encoders or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.max_pending = max(2, max_pending)
+        self.verbose = verbose
+
+    def export(
+        self,
+        frames: typing.Iterable[tuple],
+        iters: int,
+        skip: int,
+        blur_batch: typing.Optional[int] = None,
+    ) -> ExportStats:
+        """Render and write every (index, time, normalized frame) given, in order.
+        An item may also carry a fourth element, the normalized frames across its shutter
+        interval, to render that frame with motion blur.
+        """
+        from sulfurvision.cl import render
+
+        renderer = self.renderer
+        clock = _DeviceClock()
+        buffers = [renderer.pixel_array, clarray.empty_like(renderer.pixel_array)]
+        # Readback events of the frames last tonemapped from each buffer
+        buffer_free: list[typing.Optional[cl.Event]] = [None, None]
+        timings: list[FrameTiming] = []
+        writes: collections.deque[concurrent.futures.Future] = collections.deque()
+        previous: typing.Optional[_InFlight] = None
+        wall_start = time.perf_counter()
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.encoders
+        ) as encode_pool, concurrent.futures.ThreadPoolExecutor(max_workers=1) as write_pool:
+
+            def _finish(job: _InFlight):
+                # Blocks until this frame's histogram is resolved; the next chaos game keeps running
+                ready = time.perf_counter()
+                imgdata, done = renderer.enqueue_tonemap(
+                    job.pixels,
+                    job.frame.vibrancy,
+                    job.frame.gamma,
+                    job.frame.brightness,
+                    [job.resolved],
+                )
+                clock.track(done, ready, job.resolved_at)
+                buffer_free[0 if job.pixels is buffers[0] else 1] = done
+                timing = FrameTiming(job.index, job.time, 0.0)
+                timings.append(timing)
+
+                def _encode():
+                    done.wait()
+                    timing.render_seconds = time.perf_counter() - job.started
+                    if job.stats is not None:
+                        counts, read = job.stats
+                        read.wait()
+                        timing.stats = render.RenderStats.from_counts(counts).to_dict()
+                    start = time.perf_counter()
+                    data = self.sink.encode(renderer.to_image(imgdata))
+                    return data, time.perf_counter() - start
+
+                encoded = encode_pool.submit(_encode)
+
+                def _write():
+                    data, seconds = encoded.result()
+                    start = time.perf_counter()
+                    self.sink.write_encoded(timing.index, data)
+                    timing.save_seconds = seconds + time.perf_counter() - start
+                    if self.verbose:
+                        print(
+                            f"Saved frame #{timing.index} at t={timing.time:.4f} "
+                            f"({timing.render_seconds:.3f}s render, {timing.save_seconds:.3f}s save)"
+                        )
+
+                writes.append(write_pool.submit(_write))
+                while len(writes) > self.max_pending:
+                    writes.popleft().result()
+
+            for index, t, frame, *shutter in frames:
+                if self._needs_resize(frame):
+                    if previous is not None:
+                        _finish(previous)
+                        previous = None
+                    for write in writes:
+                        write.result()
+                    self._resize(frame)
+                    buffers = [renderer.pixel_array, clarray.empty_like(renderer.pixel_array)]
+                    buffer_free = [None, None]
+                started = time.perf_counter()
+                # Resolve into whichever buffer the previous frame is not using
+                which = 1 if previous is not None and previous.pixels is buffers[0] else 0
+                renderer.reset()
+                renderer.stream = index
+                renderer.randomize_particles()
+                chaos = renderer.enqueue_chaos_game(
+                    renderer.frame_cameras(frame),
+                    frame.transforms,
+                    frame.palette,
+                    iters,
+                    skip,
+                    renderer.shutter_subframes(shutter[0] if shutter else ()),
+                    blur_batch or render.DEFAULT_BLUR_BATCH,
+                )
+                wait_for = [chaos] if buffer_free[which] is None else [chaos, buffer_free[which]]
+                resolved = renderer.enqueue_resolve(buffers[which], wait_for)
+                resolved_at = clock.track(
+                    resolved, started, previous.resolved_at if previous else None
+                )
+                stats = renderer.enqueue_read_stats() if renderer.collect_stats else None
+                job = _InFlight(
+                    index, t, frame, buffers[which], resolved, resolved_at, started, stats
+                )
+                if previous is not None:
+                    _finish(previous)
+                previous = job
+            if previous is not None:
+                _finish(previous)
+            for write in writes:
+                write.result()
+
+        wall = time.perf_counter() - wall_start
+        stages = renderer.profiler.aggregates() if renderer.profiler is not None else None
+        return ExportStats(timings, wall, clock.busy_seconds(), stages)
+
+    def _needs_resize(self, frame: RenderFrame) -> bool:
+        return (
+            len(frame.palette) != self.renderer.n_colors
+            or len(frame.transforms) != self.renderer.n_variations
+        )
+
+    def _resize(self, frame: RenderFrame):
+        renderer = self.renderer
+        renderer.update_to_match(
+            renderer.w,
+            renderer.h,
+            renderer.supersample,
+            renderer.n_particles,
+            len(frame.palette),
+            len(frame.transforms),
+        )
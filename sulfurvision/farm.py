@@ -0,0 +1,307 @@
+"""
+Distributed animation rendering through a shared directory
+
+A farm directory holds the project, its render settings, and one empty marker file per
+frame index in each of three queues:
+    todo/     frames nobody has claimed yet
+    claimed/  frames being rendered; the file's mtime is the claiming worker's heartbeat
+    done/     frames whose image has been written to frames/
+Workers move markers between queues with os.rename, which is atomic on a shared filesystem,
+so exactly one worker wins each claim. Claims whose heartbeat is older than the lease are
+moved back to todo/ by any worker or by the status command, so crashed workers lose nothing.
+"""
+
+import argparse
+import dataclasses
+import json
+import os
+from os import path
+import socket
+import sys
+import threading
+import time
+import typing
+import uuid
+
+from sulfurvision.batch import (
+    RenderSettings,
+    add_settings_arguments,
+    frame_filename,
+    schedule,
+    settings_from_args,
+    shutter_frames,
+)
+from sulfurvision.project import Project
+
+TODO = "todo"
+CLAIMED = "claimed"
+DONE = "done"
+FRAMES = "frames"
+
+DEFAULT_LEASE_SECONDS = 120.0
+_POLL_SECONDS = 1.0
+
+
+def _marker(index: int) -> str:
+    return f"{index:06}"
+
+
+@dataclasses.dataclass
+class FarmConfig:
+    """Everything a worker needs to know besides the project itself."""
+
+    settings: RenderSettings
+    rate: float
+    ext: str = "png"
+    lease_seconds: float = DEFAULT_LEASE_SECONDS
+
+    @staticmethod
+    def from_dict(d: dict) -> "FarmConfig":
+        return FarmConfig(
+            RenderSettings(**d["settings"]), d["rate"], d["ext"], d["lease_seconds"]
+        )
+
+
+class Farm:
+    """A work queue of frame indices living in a shared directory."""
+
+    def __init__(self, root: str):
+        self.root = root
+        with open(path.join(root, "farm.json"), "r") as file:
+            self.config = FarmConfig.from_dict(json.load(file))
+        self.project = Project.load(path.join(root, "project.json"))
+        self.times = self.project.frame_times(self.config.rate)
+
+    @staticmethod
+    def create(
+        root: str,
+        project: Project,
+        config: FarmConfig,
+        start: typing.Optional[float] = None,
+        end: typing.Optional[float] = None,
+    ) -> "Farm":
+        """Lay out a farm directory and queue every frame between start and end."""
+        for queue in (TODO, CLAIMED, DONE, FRAMES):
+            os.makedirs(path.join(root, queue), exist_ok=True)
+        with open(path.join(root, "project.json"), "w") as file:
+            file.write(project.dump_json())
+        with open(path.join(root, "farm.json"), "w") as file:
+            json.dump(dataclasses.asdict(config), file)
+        for index, _ in schedule(project, None, start, end, config.rate):
+            open(path.join(root, TODO, _marker(index)), "w").close()
+        return Farm(root)
+
+    def _path(self, queue: str, index: int) -> str:
+        return path.join(self.root, queue, _marker(index))
+
+    def _list(self, queue: str) -> list[int]:
+        names = os.listdir(path.join(self.root, queue))
+        return sorted(int(name) for name in names if name.isdigit())
+
+    def counts(self) -> dict[str, int]:
+        return {queue: len(self._list(queue)) for queue in (TODO, CLAIMED, DONE)}
+
+    def claim(self, worker: str) -> typing.Optional[int]:
+        """Claim the lowest unclaimed frame index, or return None if there is none left."""
+        for index in self._list(TODO):
+            try:
+                # Refresh the mtime first, so the claim is never mistaken for a stale one
+                os.utime(self._path(TODO, index))
+                os.rename(self._path(TODO, index), self._path(CLAIMED, index))
+            except FileNotFoundError:
+                continue  # Another worker won this one
+            try:
+                # Not "w", which would bring back a marker requeued since the rename
+                with open(self._path(CLAIMED, index), "r+") as file:
+                    file.write(worker)
+                    file.truncate()
+            except FileNotFoundError:
+                continue  # Requeued or completed between the rename and the write
+            return index
+        return None
+
+    def heartbeat(self, index: int) -> bool:
+        """Refresh a claim. Returns False if the claim has been lost."""
+        try:
+            os.utime(self._path(CLAIMED, index))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def complete(self, index: int):
+        try:
+            os.rename(self._path(CLAIMED, index), self._path(DONE, index))
+        except FileNotFoundError:
+            # Our claim went stale and was requeued; the frame is written regardless
+            open(self._path(DONE, index), "w").close()
+            try:
+                os.remove(self._path(TODO, index))
+            except FileNotFoundError:
+                pass
+
+    def requeue_stale(self, now: typing.Optional[float] = None) -> list[int]:
+        """Move claims whose heartbeat is older than the lease back to todo/."""
+        now = time.time() if now is None else now
+        requeued = []
+        for index in self._list(CLAIMED):
+            try:
+                age = now - path.getmtime(self._path(CLAIMED, index))
+                if age < self.config.lease_seconds:
+                    continue
+                os.rename(self._path(CLAIMED, index), self._path(TODO, index))
+                requeued.append(index)
+            except FileNotFoundError:
+                continue
+        return requeued
+
+    def output_path(self, index: int) -> str:
+        filename = frame_filename(index, self.times[index], self.config.ext)
+        return path.join(self.root, FRAMES, filename)
+
+
+class _Heartbeat:
+    """Touches a claim periodically while its frame renders."""
+
+    def __init__(self, farm: Farm, index: int):
+        self.farm = farm
+        self.index = index
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        interval = self.farm.config.lease_seconds / 4
+        while not self.stopped.wait(interval):
+            if not self.farm.heartbeat(self.index):
+                return
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stopped.set()
+        self.thread.join()
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+def work(
+    root: str,
+    worker: typing.Optional[str] = None,
+    max_frames: typing.Optional[int] = None,
+    verbose: bool = True,
+) -> list[int]:
+    """Claim and render frames until none remain. Returns the indices this worker rendered."""
+    from sulfurvision.cl import render
+
+    farm = Farm(root)
+    worker = worker or default_worker_id()
+    settings = farm.config.settings
+    renderer = render.Renderer(
+        settings.width,
+        settings.height,
+        settings.supersample,
+        settings.particles,
+        farm.project.n_colors,
+        farm.project.n_transforms,
+        seed=settings.seed,
+        generator=settings.generator,
+    )
+    rendered = []
+    while max_frames is None or len(rendered) < max_frames:
+        index = farm.claim(worker)
+        if index is None:
+            if farm.requeue_stale():
+                continue
+            if not farm.counts()[CLAIMED]:
+                break
+            time.sleep(_POLL_SECONDS)
+            continue
+        start = time.perf_counter()
+        with _Heartbeat(farm, index):
+            frame = farm.project.frame_at(farm.times[index])
+            renderer.update_to_match(
+                settings.width,
+                settings.height,
+                settings.supersample,
+                settings.particles,
+                len(frame.palette),
+                len(frame.transforms),
+            )
+            renderer.stream = index
+            img = renderer.render_frame(
+                frame,
+                settings.iters,
+                settings.skip,
+                shutter_frames(farm.project, settings, farm.times[index], farm.config.rate),
+            )
+            out_path = farm.output_path(index)
+            root_name, ext = path.splitext(out_path)
+            tmp_path = f"{root_name}.{worker}.tmp{ext}"
+            img.save(tmp_path)
+            os.replace(tmp_path, out_path)
+        farm.complete(index)
+        rendered.append(index)
+        if verbose:
+            print(f"[{worker}] Rendered frame #{index} in {time.perf_counter() - start:.3f}s")
+    return rendered
+
+
+def main(argv: typing.Optional[typing.Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="sulfurvision-farm",
+        description="Render an animation with any number of workers sharing a directory.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    init = commands.add_parser("init", help="Create a farm directory from a project")
+    init.add_argument("farm", help="Shared directory to create")
+    init.add_argument("project", help="Project JSON file exported from the GUI")
+    init.add_argument("--start", type=float)
+    init.add_argument("--end", type=float)
+    init.add_argument(
+        "--lease",
+        type=float,
+        default=DEFAULT_LEASE_SECONDS,
+        help="Seconds without a heartbeat before a claim is requeued",
+    )
+    add_settings_arguments(init)
+
+    worker = commands.add_parser("work", help="Render frames from a farm until none remain")
+    worker.add_argument("farm")
+    worker.add_argument("--worker-id")
+    worker.add_argument("--max-frames", type=int)
+    worker.add_argument("-q", "--quiet", action="store_true")
+
+    status = commands.add_parser("status", help="Requeue stale claims and report progress")
+    status.add_argument("farm")
+
+    args = parser.parse_args(argv)
+    if args.command == "init":
+        project = Project.load(args.project)
+        config = FarmConfig(
+            settings_from_args(project, args),
+            args.rate if args.rate is not None else project.rate,
+            args.format,
+            args.lease,
+        )
+        farm = Farm.create(args.farm, project, config, args.start, args.end)
+        print(f"Queued {farm.counts()[TODO]} frames in {args.farm}")
+    elif args.command == "work":
+        rendered = work(args.farm, args.worker_id, args.max_frames, not args.quiet)
+        print(f"Rendered {len(rendered)} frames")
+    elif args.command == "status":
+        farm = Farm(args.farm)
+        requeued = farm.requeue_stale()
+        counts = farm.counts()
+        print(
+            f"todo: {counts[TODO]}, claimed: {counts[CLAIMED]}, "
+            f"done: {counts[DONE]}, requeued: {len(requeued)}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
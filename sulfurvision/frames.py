@@ -0,0 +1,299 @@
+"""
+Host-side description of a single frame, free of any OpenCL dependency
+"""
+
+import dataclasses
+import json
+import typing
+
+import numpy as np
+
+from sulfurvision import pysulfur, types
+
+
+@dataclasses.dataclass
+class RenderFrame:
+    """Similar to pysulfur.Flame.
+    Holds information for rendering one frame.
+    """
+
+    transforms: typing.Sequence[pysulfur.Transform]
+    palette: typing.Sequence[types.Color]
+    camera: types.AffineTransform
+    time: float
+    brightness: float = 10.0
+    gamma: float = 1.0
+    vibrancy: float = 1.0
+    # Every point is plotted once per symmetry-fold rotation about the origin,
+    # and again mirrored if mirror is set; these are kept, not scaled or summed, by arithmetic
+    symmetry: int = 1
+    mirror: bool = False
+
+    def __mul__(self, other) -> "RenderFrame":
+        return RenderFrame(
+            [tf * other for tf in self.transforms],
+            list(np.asarray(self.palette, dtype=np.float64) * other),
+            np.asarray(self.camera, dtype=np.float64) * other,
+            self.time * other,
+            self.brightness * other,
+            self.gamma * other,
+            self.vibrancy * other,
+            self.symmetry,
+            self.mirror
+        )
+
+    def __rmul__(self, other): return self * other
+
+    def __add__(self, other) -> "RenderFrame":
+        assert len(self.transforms) == len(other.transforms)
+        assert len(self.palette) == len(other.palette)
+        return RenderFrame(
+            [stf + otf for stf, otf in zip(self.transforms, other.transforms)],
+            list(np.asarray(self.palette, dtype=np.float64)
+            + np.asarray(other.palette, dtype=np.float64)),
+            np.asarray(self.camera, dtype=np.float64)
+            + np.asarray(other.camera, dtype=np.float64),
+            self.time + other.time,
+            self.brightness + other.brightness,
+            self.gamma + other.gamma,
+            self.vibrancy + other.vibrancy,
+            self.symmetry,
+            self.mirror
+        )
+    
+    def __radd__(self, other): return self + other
+
+    def __truediv__(self, other): return self * (1. / other)
+
+    def normalize(self):
+        total_prob = sum([x.probability for x in self.transforms])
+        for tf in self.transforms:
+            total_weight = sum(tf.weights)
+            if abs(total_weight) >= 1e-9:
+                tf.weights /= total_weight
+            if abs(total_prob) >= 1e-9:
+                tf.probability /= total_prob
+
+    def to_dict(self) -> dict[str, typing.Any]:
+        return {
+            "transforms": [tf.to_dict() for tf in self.transforms],
+            "palette": [list(color) for color in self.palette],
+            "camera": list(self.camera),
+            "time": self.time,
+            "brightness": self.brightness,
+            "gamma": self.gamma,
+            "vibrancy": self.vibrancy,
+            "symmetry": self.symmetry,
+            "mirror": self.mirror
+        }
+
+    def dump_json(self) -> str:
+        return json.dumps(self.to_dict())
+
+    def cameras(self) -> np.ndarray:
+        """The camera composed with each symmetric copy, as by pysulfur.symmetric_cameras."""
+        return pysulfur.symmetric_cameras(self.camera, self.symmetry, self.mirror)
+
+    def pack(self) -> np.ndarray:
+        """This frame as a flat vector, laid out by FrameLayout.of(self)."""
+        return FrameLayout.of(self).pack(self)
+
+    @staticmethod
+    def read_json(s: str) -> "RenderFrame":
+        d = json.loads(s)
+        return RenderFrame.from_dict(d)
+    
+    @staticmethod
+    def from_dict(d: dict[str, any]) -> 'RenderFrame':
+        transforms = list(map(pysulfur.Transform.from_dict, d["transforms"]))
+        palette = list(np.asarray(d["palette"], dtype=np.float64))
+        camera = np.asarray(d["camera"], dtype=np.float64)
+        time = d["time"]
+        brightness = d["brightness"]
+        gamma = d["gamma"]
+        vibrancy = d["vibrancy"]
+        symmetry = d.get("symmetry", 1)
+        mirror = d.get("mirror", False)
+        return RenderFrame(
+            transforms, palette, camera, time, brightness, gamma, vibrancy, symmetry, mirror
+        )
+
+
+class FrameLayout:
+    """Offsets of every parameter of RenderFrames of one shape within a flat float64 vector,
+    so that many frames can be interpolated as rows of one array.
+    Transforms come first, each as weights, params, affine, probability, color and color_speed,
+    followed by the palette, the camera, the time, the tonemap settings and the symmetry.
+    Unpacking rounds symmetry down and mirror to the nearer of off and on.
+    """
+
+    def __init__(
+        self,
+        n_transforms: int,
+        n_colors: int,
+        n_weights: int,
+        n_params: int,
+        color_size: int = 4,
+    ):
+        self.n_transforms = n_transforms
+        self.n_colors = n_colors
+        self.n_weights = n_weights
+        self.n_params = n_params
+        self.color_size = color_size
+        # Fields within one transform's row
+        self.weights = slice(0, n_weights)
+        self.params = slice(n_weights, n_weights + n_params)
+        self.affine = slice(self.params.stop, self.params.stop + 6)
+        self.probability = self.affine.stop
+        self.color = self.probability + 1
+        self.color_speed = self.probability + 2
+        self.transform_size = self.probability + 3
+        # Fields within the whole vector
+        self.transforms = slice(0, n_transforms * self.transform_size)
+        self.palette = slice(
+            self.transforms.stop, self.transforms.stop + n_colors * color_size
+        )
+        self.camera = slice(self.palette.stop, self.palette.stop + 6)
+        self.time = self.camera.stop
+        self.brightness = self.time + 1
+        self.gamma = self.time + 2
+        self.vibrancy = self.time + 3
+        self.symmetry = self.time + 4
+        self.mirror = self.time + 5
+        self.size = self.time + 6
+
+    @staticmethod
+    def of(frame: RenderFrame) -> "FrameLayout":
+        tf = frame.transforms[0]
+        return FrameLayout(
+            len(frame.transforms),
+            len(frame.palette),
+            len(tf.weights),
+            len(tf.params),
+            len(frame.palette[0]),
+        )
+
+    def transform_rows(self, packed: np.ndarray) -> np.ndarray:
+        """View the transforms of one or more packed frames as rows,
+        shaped (..., n_transforms, transform_size).
+        """
+        return packed[..., self.transforms].reshape(
+            packed.shape[:-1] + (self.n_transforms, self.transform_size)
+        )
+
+    def pack(self, frame: RenderFrame, out: typing.Optional[np.ndarray] = None) -> np.ndarray:
+        packed = np.empty(self.size) if out is None else out
+        rows = self.transform_rows(packed)
+        for row, tf in zip(rows, frame.transforms):
+            row[self.weights] = tf.weights
+            row[self.params] = tf.params
+            row[self.affine] = tf.affine
+            row[self.probability] = tf.probability
+            row[self.color] = tf.color
+            row[self.color_speed] = tf.color_speed
+        packed[self.palette] = np.asarray(frame.palette, dtype=np.float64).reshape(-1)
+        packed[self.camera] = frame.camera
+        packed[self.time] = frame.time
+        packed[self.brightness] = frame.brightness
+        packed[self.gamma] = frame.gamma
+        packed[self.vibrancy] = frame.vibrancy
+        packed[self.symmetry] = frame.symmetry
+        packed[self.mirror] = frame.mirror
+        return packed
+
+    def unpack(self, packed: np.ndarray) -> RenderFrame:
+        """Build a RenderFrame that shares no arrays with packed."""
+        packed = np.array(packed, dtype=np.float64)
+        transforms = [
+            pysulfur.Transform(
+                row[self.weights],
+                row[self.params],
+                row[self.affine],
+                float(row[self.probability]),
+                float(row[self.color]),
+                float(row[self.color_speed]),
+            )
+            for row in self.transform_rows(packed)
+        ]
+        palette = list(packed[self.palette].reshape(self.n_colors, self.color_size))
+        return RenderFrame(
+            transforms,
+            palette,
+            packed[self.camera],
+            float(packed[self.time]),
+            float(packed[self.brightness]),
+            float(packed[self.gamma]),
+            float(packed[self.vibrancy]),
+            max(1, int(np.floor(packed[self.symmetry] + 1e-9))),
+            bool(packed[self.mirror] >= 0.5),
+        )
+
+    def lerp(self, a: np.ndarray, b: np.ndarray, z: typing.Union[float, np.ndarray]) -> np.ndarray:
+        """Interpolate packed frames, as util.lerp does for RenderFrames."""
+        z = np.asarray(z, dtype=np.float64)
+        return a + (b - a) * (z[..., None] if z.ndim else z)
+
+    def mutate(
+        self,
+        packed: np.ndarray,
+        speed: float,
+        rng: typing.Optional[np.random.Generator] = None,
+        max_variations: typing.Optional[int] = None,
+    ) -> np.ndarray:
+        """Move a packed frame's palette and transforms toward random values by speed in [0, 1],
+        returning the normalized result. Only variations already in use are changed, unless
+        max_variations is given, in which case each transform gets between 1 and that many
+        new variations with random weights.
+        """
+        rng = np.random.default_rng() if rng is None else rng
+        packed = np.array(packed, dtype=np.float64)
+
+        def toward(values, targets):
+            return values + (targets - values) * speed
+
+        palette = packed[self.palette].reshape(self.n_colors, self.color_size)
+        palette[:, :3] = np.floor(toward(palette[:, :3], rng.random((self.n_colors, 3)) * 255))
+        palette[:, 3:] = 1
+        packed[self.palette] = palette.reshape(-1)
+
+        rows = self.transform_rows(packed).copy()
+        n = self.n_transforms
+        rows[:, self.probability] = toward(rows[:, self.probability], rng.random(n))
+        rows[:, self.affine] = toward(rows[:, self.affine], rng.random((n, 6)) * 2 - 1)
+        rows[:, self.color] = toward(
+            rows[:, self.color], rng.random(n) * (self.n_colors - 1)
+        )
+        rows[:, self.color_speed] = toward(rows[:, self.color_speed], rng.random(n))
+        weights = rows[:, self.weights]
+        if max_variations is None:
+            weights = np.where(
+                weights != 0, toward(weights, rng.random(weights.shape)), weights
+            )
+        else:
+            n_active = rng.integers(1, max_variations + 1, n)
+            ranks = rng.random(weights.shape).argsort(axis=1).argsort(axis=1)
+            weights = np.where(ranks < n_active[:, None], rng.random(weights.shape), 0)
+        rows[:, self.weights] = weights
+        rows[:, self.params] = toward(
+            rows[:, self.params], rng.random((n, self.n_params)) * 2 - 1
+        )
+        packed[self.transforms] = rows.reshape(-1)
+        self.normalize(packed)
+        return packed
+
+    def normalize(self, packed: np.ndarray):
+        """RenderFrame.normalize, in place, for one or more packed frames."""
+        rows = self.transform_rows(packed)
+        weights = rows[..., self.weights]
+        total_weight = weights.sum(axis=-1, keepdims=True)
+        safe_weight = np.where(total_weight == 0, 1, total_weight)
+        rows[..., self.weights] = np.where(
+            np.abs(total_weight) >= 1e-9, weights / safe_weight, weights
+        )
+        probability = rows[..., self.probability]
+        total_prob = probability.sum(axis=-1, keepdims=True)
+        safe_prob = np.where(total_prob == 0, 1, total_prob)
+        rows[..., self.probability] = np.where(
+            np.abs(total_prob) >= 1e-9, probability / safe_prob, probability
+        )
+        packed[..., self.transforms] = rows.reshape(packed.shape[:-1] + (-1,))
@@ -0,0 +1,145 @@
+"""
+Cameras fitted to flames from a short pilot run of the chaos game
+"""
+
+import numpy as np
+
+from sulfurvision import prng, pysulfur
+from sulfurvision.frames import FrameLayout, RenderFrame
+
+# Fraction of the attractor's points, along each axis, that a fitted camera keeps in view
+DEFAULT_COVERAGE = 0.99
+# Extra room around the covered points, as a fraction of their extent on each side
+DEFAULT_MARGIN = 0.05
+
+PILOT_PARTICLES = 4096
+# The pilot records every particle's position this many times...
+PILOT_SNAPSHOTS = 16
+# ...this many iterations apart, after warming up for as many iterations as a render skips
+PILOT_STRIDE = 4
+PILOT_WARMUP = 20
+# The CPU engine iterates in Python, so its pilot runs far fewer particles
+CPU_PILOT_PARTICLES = 128
+
+
+def pilot_points(
+    frame: RenderFrame,
+    n_particles: int = PILOT_PARTICLES,
+    snapshots: int = PILOT_SNAPSHOTS,
+    stride: int = PILOT_STRIDE,
+    warmup: int = PILOT_WARMUP,
+    renderer=None,
+) -> np.ndarray:
+    """Points of a normalized frame's attractor, shaped (N, 2), from a chaos game on the device
+    that plots nothing. Particles still warming up after being reseeded are left out.
+    renderer, if given, is resized to suit and its histogram cleared.
+    """
+    from sulfurvision.cl import render
+
+    if renderer is None:
+        renderer = render.Renderer(
+            1,
+            1,
+            1,
+            n_particles,
+            len(frame.palette),
+            len(frame.transforms),
+            generator=prng.PHILOX,
+        )
+    else:
+        renderer.update_to_match(
+            1, 1, 1, n_particles, len(frame.palette), len(frame.transforms)
+        )
+    renderer.reset()
+    renderer.randomize_particles()
+    # Skipping every iteration keeps the histogram out of it
+    renderer.chaos_game_from(frame.camera, frame.transforms, frame.palette, 0, warmup, warmup)
+    done = warmup
+    points = []
+    for _ in range(snapshots):
+        renderer.chaos_game_from(
+            frame.camera, frame.transforms, frame.palette, done, stride, done + stride
+        )
+        done += stride
+        particles = renderer.particles.get()
+        settled = particles["warmup"] == 0
+        xy = particles["xy"][settled]
+        points.append(np.stack([xy["x"], xy["y"]], axis=1))
+    return np.concatenate(points).astype(np.float64)
+
+
+def pilot_points_cpu(
+    frame: RenderFrame,
+    n_particles: int = CPU_PILOT_PARTICLES,
+    snapshots: int = PILOT_SNAPSHOTS,
+    stride: int = PILOT_STRIDE,
+    warmup: int = PILOT_WARMUP,
+    seed: int = 12345,
+) -> np.ndarray:
+    """pilot_points with pysulfur.Flame, for when no device is available.
+    Only works for flames whose variations the CPU engine implements.
+    """
+    flame = pysulfur.Flame(frame.transforms, lambda color: color)
+    states = []
+    for i in range(n_particles):
+        particle_seed, x = prng.rand_uniform(seed + i)
+        particle_seed, y = prng.rand_uniform(particle_seed)
+        states.append(pysulfur.State(np.array((x, y)), particle_seed))
+    flame.iterate_steps(states, None, warmup)
+    points = []
+    for _ in range(snapshots):
+        flame.iterate_steps(states, None, stride)
+        points.extend(state.coord for state in states if state.warmup == 0)
+    return np.array(points, dtype=np.float64).reshape(-1, 2)
+
+
+def fit_camera(
+    points: np.ndarray,
+    aspect: float = 1.0,
+    coverage: float = DEFAULT_COVERAGE,
+    margin: float = DEFAULT_MARGIN,
+) -> np.ndarray:
+    """The axis-aligned camera that maps the central coverage of points along each axis,
+    plus margin, onto the unit square, widened or heightened to an aspect ratio of
+    width / height. Percentile bounds keep stray points from shrinking the flame.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    points = points[np.all(np.abs(points) < pysulfur.ESCAPE_RADIUS, axis=1)]
+    if not len(points):
+        raise ValueError("No finite points to fit a camera to")
+    tail = (1 - coverage) / 2 * 100
+    low = np.percentile(points, tail, axis=0)
+    high = np.percentile(points, 100 - tail, axis=0)
+    centre = (low + high) / 2
+    width, height = (high - low) * (1 + 2 * margin)
+    # A flame that collapses to a line or a point still gets a usable camera
+    floor = max(width, height, 1.0) * 1e-6
+    width, height = max(width, floor), max(height, floor)
+    width, height = max(width, height * aspect), max(height, width / aspect)
+    x0 = centre[0] - width / 2
+    y0 = centre[1] - height / 2
+    return np.array([1 / width, 0, -x0 / width, 0, 1 / height, -y0 / height])
+
+
+def auto_camera(
+    frame: RenderFrame,
+    aspect: float = 1.0,
+    coverage: float = DEFAULT_COVERAGE,
+    margin: float = DEFAULT_MARGIN,
+    device: bool = True,
+    renderer=None,
+) -> np.ndarray:
+    """A camera fitted to frame's attractor by fit_camera, from a pilot run on the device,
+    or with the CPU engine if device is false. The frame need not be normalized, and
+    is left unchanged. Symmetric copies are included, as the renderer plots them.
+    """
+    layout = FrameLayout.of(frame)
+    frame = layout.unpack(layout.pack(frame))
+    frame.normalize()
+    points = pilot_points(frame, renderer=renderer) if device else pilot_points_cpu(frame)
+    copies = [
+        points @ np.array([[affine[0], affine[3]], [affine[1], affine[4]]])
+        + np.array([affine[2], affine[5]])
+        for affine in pysulfur.symmetry_affines(frame.symmetry, frame.mirror)
+    ]
+    return fit_camera(np.concatenate(copies), aspect, coverage, margin)
@@ -1,5 +1,7 @@
+import concurrent.futures
 import json
 from os import path
+import queue
 import sys
 import threading
 import tkinter as tk
@@ -8,8 +10,11 @@ from tkinter import colorchooser, filedialog, messagebox, ttk
 import numpy as np
 from PIL import Image, ImageTk
 
-from sulfurvision import pysulfur, types, util, variations
-from sulfurvision.cl import render
+from sulfurvision import (
+    framing, frames, packfile, preview, pysulfur, sinks, timeline, types, variations
+)
+from sulfurvision.batch import RenderSettings
+from sulfurvision.project import Project
 
 
 def _pre_validate_type(val: str, t: type) -> bool:
@@ -45,7 +50,7 @@ def default_transform():
 
 
 def default_frame(n_transforms, n_colors):
-    return render.RenderFrame(
+    return frames.RenderFrame(
         [default_transform() for _ in range(n_transforms)],
         [[0, 0, 0, 1] for _ in range(n_colors)],
         types.IdentityAffine,
@@ -54,6 +59,27 @@ def default_frame(n_transforms, n_colors):
 
 
 _PREVIEW_SIZE = 200
+_READY_POLL_MS = 50
+_PREVIEW_POLL_MS = 15
+FILETYPES = (('JSON', '*.json'), ('Pack file', f'*{packfile.EXTENSION}'), ('Plaintext', '.txt'))
+
+
+def create_renderer_async(*args) -> concurrent.futures.Future:
+    """Import the OpenCL backend and construct a Renderer on a background thread,
+    so the window can be shown before the kernel has been compiled.
+    """
+    future = concurrent.futures.Future()
+
+    def _func():
+        try:
+            from sulfurvision.cl import render
+
+            future.set_result(render.Renderer(*args))
+        except Exception as e:
+            future.set_exception(e)
+
+    threading.Thread(target=_func, daemon=True).start()
+    return future
 
 
 class SulfurGui(tk.Frame):
@@ -64,7 +90,14 @@ class SulfurGui(tk.Frame):
         self.n_transforms = kwargs.pop("n_transforms", 1)
         self.n_colors = kwargs.pop("n_colors", 1)
         super().__init__(*args, **kwargs)
-        self.renderer = render.Renderer(_PREVIEW_SIZE, _PREVIEW_SIZE, 1, 50, 1, 3)
+        self.renderer = None
+        self.preview_worker = None
+        # Previews arrive from the worker's thread, and are shown from Tk's
+        self.previews = queue.Queue()
+        self.preview_generation = 0
+        self.renderer_future = create_renderer_async(
+            _PREVIEW_SIZE, _PREVIEW_SIZE, 1, 50, 1, 3
+        )
 
         self.anim_frame = tk.Frame(self)
         self.anim_frame.grid(row=0, column=0, sticky="ns")
@@ -243,12 +276,39 @@ class SulfurGui(tk.Frame):
         self.keyframe.grid(row=0, column=1)
         self.update_keyframe()
 
-        self.render_preview_now()
+        self.allow_rendering(False)
+        self.after(_READY_POLL_MS, self.check_renderer)
 
         self.clipboard = None
+
+    def check_renderer(self):
+        """Poll the background build, and enable rendering once it has finished."""
+        if not self.renderer_future.done():
+            self.after(_READY_POLL_MS, self.check_renderer)
+            return
+        try:
+            self.renderer = self.renderer_future.result()
+        except Exception as e:
+            print(e, file=sys.stderr)
+            messagebox.showerror(title='Failed to initialize OpenCL', message=str(e))
+            return
+        self.preview_worker = preview.PreviewWorker(
+            self.renderer,
+            self.previews.put,
+            cache=preview.PreviewCache(),
+            record_bytes=preview.DEFAULT_RECORD_BYTES,
+        )
+        self.allow_rendering(True)
+        # Committing any field with Return previews the current keyframe
+        self.bind_class("Entry", "<Return>", lambda _: self.render_preview_now(), add="+")
+        self.after(_PREVIEW_POLL_MS, self.show_previews)
+        self.render_preview_now()
     
     def dump_json(self) -> str:
-        d = {
+        return json.dumps(self.to_dict())
+
+    def to_dict(self) -> dict:
+        return {
             'n_transforms': self.n_transforms,
             'n_colors': self.n_colors,
             'width': int_from_var(self.width_var),
@@ -259,13 +319,14 @@ class SulfurGui(tk.Frame):
             'supersample': int_from_var(self.sample_var),
             'rate': float_from_var(self.rate_var),
             'frames': [
-                json.loads(frame.dump_json()) for frame in self.frames
+                frame.to_dict() for frame in self.frames
             ]
         }
-        return json.dumps(d)
 
     def load_json(self, s: str):
-        d = json.loads(s)
+        self.load_dict(json.loads(s))
+
+    def load_dict(self, d: dict):
         self.n_transforms = d['n_transforms']
         self.n_colors = d['n_colors']
         self.tf_var.set(self.n_transforms)
@@ -277,23 +338,30 @@ class SulfurGui(tk.Frame):
         self.skip_var.set(d['skip'])
         self.sample_var.set(d['supersample'])
         self.rate_var.set(d['rate'])
-        self.frames = list(map(render.RenderFrame.from_dict, d['frames']))
+        self.frames = list(map(frames.RenderFrame.from_dict, d['frames']))
 
     def imp_command(self):
-        fpath = filedialog.askopenfilename(title='Import JSON', defaultextension='.json', filetypes=(('JSON', '*.json'), ('Plaintext', '.txt')))
+        fpath = filedialog.askopenfilename(title='Import JSON', defaultextension='.json', filetypes=FILETYPES)
         if not fpath:
             return
-        with open(fpath, 'r') as file:
-            s = file.read()
-        self.load_json(s)
+        if packfile.is_packfile(fpath):
+            self.load_dict(Project.load(fpath).to_dict())
+        else:
+            with open(fpath, 'r') as file:
+                s = file.read()
+            self.load_json(s)
         self.update_keyframe()
         self.refresh_dropdown()
+        self.render_preview_now()
 
     def exp_command(self):
-        fpath = filedialog.asksaveasfilename(title='Export as JSON', defaultextension='.json', filetypes=(('JSON', '*.json'), ('Plaintext', '.txt')))
+        fpath = filedialog.asksaveasfilename(title='Export as JSON', defaultextension='.json', filetypes=FILETYPES)
         if not fpath:
             return
         self.keyframe.update()
+        if fpath.endswith(packfile.EXTENSION):
+            Project.from_dict(self.to_dict()).save(fpath)
+            return
         s = self.dump_json()
         with open(fpath, 'w') as file:
             file.write(s)
@@ -302,6 +370,7 @@ class SulfurGui(tk.Frame):
         self.keyframe.update()
         self.refresh_dropdown()
         self.update_keyframe()
+        self.render_preview_now()
 
     def update_keyframe(self):
         self.keyframe.load(self.frames[self.dropdown.current()])
@@ -331,6 +400,7 @@ class SulfurGui(tk.Frame):
             elif self.n_colors < len(frame.palette):
                 frame.palette = frame.palette[: self.n_colors]
         self.update_keyframe()
+        self.render_preview_now()
 
     def insert_frame(self, idx):
         self.keyframe.update()
@@ -339,6 +409,7 @@ class SulfurGui(tk.Frame):
         self.refresh_dropdown()
         self.dropdown.current(idx)
         self.update_keyframe()
+        self.render_preview_now()
 
     def delete_frame(self, idx):
         if len(self.frames) == 1:
@@ -348,6 +419,7 @@ class SulfurGui(tk.Frame):
         self.dropdown.current(0)
         self.refresh_dropdown()
         self.update_keyframe()
+        self.render_preview_now()
 
     def refresh_dropdown(self):
         self.dropdown.config(
@@ -372,28 +444,14 @@ class SulfurGui(tk.Frame):
         t: float,
     ) -> Image.Image:
         self.keyframe.update()
-        pairs = self.pairs_for_splines()
-        frame = util.spline_step(pairs, t)
-        frame.normalize()
+        frame = timeline.Timeline(self.frames).frame_at(t)
         seeds = int_from_var(self.seed_var)
         iters = int_from_var(self.iter_var)
         skip = int_from_var(self.skip_var)
-        vibrancy = frame.vibrancy
-        gamma = frame.gamma
-        brightness = frame.brightness
         self.renderer.update_to_match(
             w, h, supersampling, seeds, self.n_colors, self.n_transforms
         )
-        return self.renderer.render(
-            pysulfur.affine_compose(frame.camera, np.array([w * supersampling, 0, 0, 0, h * supersampling, 0])),
-            frame.transforms,
-            frame.palette,
-            iters,
-            skip,
-            vibrancy,
-            gamma,
-            brightness,
-        )
+        return self.renderer.render_frame(frame, iters, skip, reuse=True)
 
     def allow_rendering(self, allow: bool):
         state = 'normal' if allow else 'disabled'
@@ -401,12 +459,15 @@ class SulfurGui(tk.Frame):
         self.preview_then.config(state=state)
         self.now_button.config(state=state)
         self.then_button.config(state=state)
+        self.animate.config(state=state)
     
     def rendering_job(self, job):
         def wrapper():
             try:
                 self.allow_rendering(False)
-                job()
+                self.preview_worker.cancel()
+                with self.preview_worker.lock:
+                    job()
             except Exception as e:
                 print(e, file=sys.stderr)
                 messagebox.showerror(title='Rendering failed', message=str(e))
@@ -415,14 +476,34 @@ class SulfurGui(tk.Frame):
         threading.Thread(target=wrapper).start()
 
     def render_preview(self, time):
-        def _func():
-            img = self.render_to_image(
-                _PREVIEW_SIZE, _PREVIEW_SIZE, 1, time
-            )
-            photo = ImageTk.PhotoImage(image=img)
+        if self.preview_worker is None:
+            return
+        try:
+            self.keyframe.update()
+        except tk.TclError:
+            # A field is still being typed, such as an empty one
+            return
+        frame = timeline.Timeline(self.frames).frame_at(time)
+        settings = RenderSettings(
+            _PREVIEW_SIZE,
+            _PREVIEW_SIZE,
+            1,
+            max(1, int_from_var(self.seed_var)),
+            max(1, int_from_var(self.iter_var)),
+            int_from_var(self.skip_var),
+        )
+        self.preview_generation = self.preview_worker.request(frame, settings)
+
+    def show_previews(self):
+        """Show the latest refinement of the latest preview, then poll again."""
+        latest = None
+        while not self.previews.empty():
+            latest = self.previews.get_nowait()
+        if latest is not None and latest.generation == self.preview_generation:
+            photo = ImageTk.PhotoImage(image=latest.image)
             self.preview.config(image=photo)
             self.preview.image = photo
-        self.rendering_job(_func)
+        self.after(_PREVIEW_POLL_MS, self.show_previews)
 
     def render_preview_now(self):
         time = sum(map(lambda x: x.time, self.frames[: self.dropdown.current() + 1]))
@@ -445,9 +526,20 @@ class SulfurGui(tk.Frame):
         self.save(time)
 
     def animate_command(self):
-        fpath = filedialog.askdirectory(title='Choose a directory to save frames to...')
+        fpath = filedialog.asksaveasfilename(
+            title='Save animation',
+            filetypes=(
+                ('Animated PNG', '*.apng'),
+                ('Animated WebP', '*.webp'),
+                ('YUV4MPEG2 video', '*.y4m'),
+                ('Raw RGB24 video', '*.rgb'),
+                ('PNG per frame, in this directory', '*.png'),
+            ),
+        )
         if not fpath:
             return
+        if path.splitext(fpath)[1].lower() not in sinks.STREAM_EXTENSIONS:
+            fpath = path.dirname(fpath)
         width = int_from_var(self.width_var)
         height = int_from_var(self.height_var)
         supersampling = int_from_var(self.sample_var)
@@ -457,12 +549,25 @@ class SulfurGui(tk.Frame):
         start_t = self.t_var.get()
         max_t = sum(map(lambda frame: frame.time, self.frames))
         def _func():
-            for i, t in enumerate(np.arange(0, max_t, 1 / framerate)):
-                if t < start_t:
-                    continue
-                img = self.render_to_image(width, height, supersampling, t)
-                img.save(path.join(fpath, f'frame_{i:06}.png'))
-                print(f'Saved frame #{i} at {t=}')
+            from sulfurvision import export
+
+            self.keyframe.update()
+            frame_times = [
+                (i, t) for i, t in enumerate(np.arange(0, max_t, 1 / framerate)) if t >= start_t
+            ]
+            keyframes = timeline.Timeline(self.frames)
+            def _frames():
+                for i, t in frame_times:
+                    yield i, t, keyframes.frame_at(t)
+            self.renderer.update_to_match(
+                width, height, supersampling, int_from_var(self.seed_var), self.n_colors, self.n_transforms
+            )
+            with sinks.open_sink(fpath, framerate) as sink:
+                stats = export.AnimationExporter(self.renderer, sink, verbose=True).export(
+                    _frames(), int_from_var(self.iter_var), int_from_var(self.skip_var)
+                )
+            print(f'Exported {len(stats.timings)} frames in {stats.wall_seconds:.3f}s, '
+                  f'device {stats.device_utilisation:.0%} busy')
         self.rendering_job(_func)
 
 
@@ -846,6 +951,8 @@ class KeyframeFrame(tk.Frame):
         row += 2
         self.camera_label = tk.Label(self, text="Camera:")
         self.camera_label.grid(row=row, column=0, sticky="w")
+        self.auto_camera_button = tk.Button(self, text="Auto Camera", command=self.auto_camera_command)
+        self.auto_camera_button.grid(row=row, column=2)
         row += 1
         self.camera_frame = AffineTransformFrame(self)
         self.camera_frame.grid(row=row, column=0, columnspan=3, sticky="ew")
@@ -886,6 +993,21 @@ class KeyframeFrame(tk.Frame):
         self.vibrancy_box.grid(row=row+1, column=2)
 
         row += 2
+        self.symmetry_label = tk.Label(self, text="Symmetry:")
+        self.symmetry_label.grid(row=row, column=0)
+        self.symmetry_var = tk.IntVar(value=1)
+        self.symmetry_box = tk.Entry(self, textvariable=self.symmetry_var, validate='all', validatecommand=(SulfurGui.validate_int, '%P'))
+        self.symmetry_box.grid(row=row, column=1)
+        self.mirror_var = tk.BooleanVar(value=False)
+        self.mirror_box = tk.Checkbutton(
+            self,
+            text="Mirror",
+            variable=self.mirror_var,
+            command=lambda: self.master.render_preview_now(),
+        )
+        self.mirror_box.grid(row=row, column=2)
+
+        row += 1
         self.copy_frame = tk.Button(self, text="Copy Frame", command=self.copy_command)
         self.copy_frame.grid(row=row, column=0)
         self.paste_frame = tk.Button(
@@ -917,7 +1039,7 @@ class KeyframeFrame(tk.Frame):
     def paste_command(self):
         if self.clipboard is None:
             return
-        frame = render.RenderFrame.read_json(self.clipboard)
+        frame = frames.RenderFrame.read_json(self.clipboard)
         if self.n_colors != len(frame.palette) or self.n_transforms != len(frame.transforms):
             msg = f'Current frame has {self.n_colors} colors and {self.n_transforms} transforms.\n\
 Copied frame has {len(frame.palette)} colors and {len(frame.transforms)} transforms.\n\
@@ -946,6 +1068,8 @@ Please match these values, update, and try again.'
         self.frame.brightness = self.brightness_var.get()
         self.frame.gamma = self.gamma_var.get()
         self.frame.vibrancy = self.vibrancy_var.get()
+        self.frame.symmetry = max(1, int_from_var(self.symmetry_var))
+        self.frame.mirror = self.mirror_var.get()
         total_prob = sum(map(lambda tf: tf.probability, self.frame.transforms))
         if abs(total_prob) > 1e-9:
             for tf in self.frame.transforms:
@@ -973,6 +1097,8 @@ Please match these values, update, and try again.'
         self.brightness_var.set(frame.brightness)
         self.gamma_var.set(frame.gamma)
         self.vibrancy_var.set(frame.vibrancy)
+        self.symmetry_var.set(frame.symmetry)
+        self.mirror_var.set(frame.mirror)
         self.dropdown.config(
             values=[f"Transform #{i}" for i in range(self.n_transforms)]
         )
@@ -980,62 +1106,54 @@ Please match these values, update, and try again.'
         self.frame.transforms = frame.transforms
         self.tf_frame.load(self.frame.transforms[self.tf_num])
     
+    def auto_camera_command(self):
+        gui = self.master
+        if gui.renderer is None:
+            messagebox.showinfo(title='Auto Camera', message='The renderer is still starting, try again shortly.')
+            return
+        self.update()
+        aspect = max(1, int_from_var(gui.width_var)) / max(1, int_from_var(gui.height_var))
+        # A copy, as the pilot run happens off the Tk thread
+        frame = self.frame * 1.0
+
+        def _apply(camera):
+            self.frame.camera = camera
+            self.camera_frame.set_affine(camera)
+            gui.render_preview_now()
+
+        def _func():
+            try:
+                camera = framing.auto_camera(frame, aspect, renderer=gui.renderer)
+            except ValueError as e:
+                messagebox.showerror(title='Auto Camera failed', message=str(e))
+                return
+            gui.after(0, _apply, camera)
+        gui.rendering_job(_func)
+
     def randomize(self):
-        # TODO Separate randomization and mutation
-        # Randomize palette
-        speed = self.mut_var.get()
-        for i, rgb in enumerate(self.frame.palette):
-            rgb = np.asarray(rgb)[:3]
-            r, g, b = rgb + (np.random.random((3,)) * 255 - rgb) * speed
-            self.color_pickers[i].set_color((r, g, b))
-            self.frame.palette[i] = np.floor(np.array([r, g, b, 1]))
-        
-        # Transforms
-        for i, tf in enumerate(self.frame.transforms):
-            tf.probability += (np.random.random() - tf.probability) * speed
-            tf.affine += (np.random.random((6,)) * 2 - 1 - tf.affine) * speed
-            tf.color += (np.random.random() * (self.n_colors - 1) - tf.color) * speed
-            tf.color_speed += (np.random.random() - tf.color_speed) * speed
-            tf.weights = np.zeros((len(tf.weights),))
-            num_vars = np.random.randint(1, self.vars_var.get() + 1)
-            choices = np.random.choice(len(tf.weights), (num_vars,), replace=False)
-            for choice in choices:
-                tf.weights[choice] = np.random.random()
-            tf.params += (np.random.random((len(tf.params,))) * 2 - 1 - tf.params) * speed
-        
-        self.frame.normalize()
-        self.load(self.frame)
+        self._mutate(self.vars_var.get())
     
     def mutate(self):
-        # Randomize palette
-        speed = self.mut_var.get()
-        for i, rgb in enumerate(self.frame.palette):
-            rgb = np.asarray(rgb)[:3]
-            r, g, b = rgb + (np.random.random((3,)) * 255 - rgb) * speed
-            self.color_pickers[i].set_color((r, g, b))
-            self.frame.palette[i] = np.floor(np.array([r, g, b, 1]))
-        
-        # Transforms
-        for i, tf in enumerate(self.frame.transforms):
-            tf.probability += (np.random.random() - tf.probability) * speed
-            tf.affine += (np.random.random((6,)) * 2 - 1 - tf.affine) * speed
-            tf.color += (np.random.random() * (self.n_colors - 1) - tf.color) * speed
-            tf.color_speed += (np.random.random() - tf.color_speed) * speed
-            for j in range(len(tf.weights)):
-                if tf.weights[j]:
-                    tf.weights[j] += (np.random.random() - tf.weights[j]) * speed
-            tf.params += (np.random.random((len(tf.params,))) * 2 - 1 - tf.params) * speed
-        
-        self.frame.normalize()
+        self._mutate(None)
+    
+    def _mutate(self, max_variations):
+        layout = frames.FrameLayout.of(self.frame)
+        packed = layout.mutate(layout.pack(self.frame), self.mut_var.get(), max_variations=max_variations)
+        mutated = layout.unpack(packed)
+        self.frame.palette = mutated.palette
+        self.frame.transforms = mutated.transforms
         self.load(self.frame)
+        self.master.render_preview_now()
 
     def imp_command(self):
-        fpath = filedialog.askopenfilename(title='Import JSON', defaultextension='.json', filetypes=(('JSON', '*.json'), ('Plaintext', '.txt')))
+        fpath = filedialog.askopenfilename(title='Import JSON', defaultextension='.json', filetypes=FILETYPES)
         if not fpath:
             return
-        with open(fpath, 'r') as file:
-            s = file.read()
-        new_frame = render.RenderFrame.read_json(s)
+        if packfile.is_packfile(fpath):
+            new_frame = packfile.PackFile(fpath)[0]
+        else:
+            with open(fpath, 'r') as file:
+                new_frame = frames.RenderFrame.read_json(file.read())
         if len(new_frame.palette) != len(self.frame.palette) or len(new_frame.transforms) != len(self.frame.transforms):
             msg = f'Imported frame has {len(new_frame.palette)} colors and {len(new_frame.transforms)} transforms.\n\
 Current frame has {len(self.frame.palette)} colors and {len(self.frame.transforms)} transforms.\n\
@@ -1043,14 +1161,18 @@ Cannot import a frame when these values do not match. Please update them in the
             print(msg, file=sys.stderr)
             messagebox.showerror(title='Failed to import frame', message=msg)
             return
-        self.load(render.RenderFrame.read_json(s), assign=False)
+        self.load(new_frame, assign=False)
         self.update()
+        self.master.render_preview_now()
 
     def exp_command(self):
-        fpath = filedialog.asksaveasfilename(title='Export as JSON', defaultextension='.json', filetypes=(('JSON', '*.json'), ('Plaintext', '.txt')))
+        fpath = filedialog.asksaveasfilename(title='Export as JSON', defaultextension='.json', filetypes=FILETYPES)
         if not fpath:
             return
         self.update()
+        if fpath.endswith(packfile.EXTENSION):
+            packfile.write(fpath, [self.frame])
+            return
         s = self.frame.dump_json()
         with open(fpath, 'w') as file:
             file.write(s)
@@ -0,0 +1,123 @@
+"""
+Compact binary files of keyframes, loadable a keyframe at a time
+
+A pack file is laid out as
+    MAGIC                       8 bytes
+    version, header length      little-endian uint32 each
+    header                      UTF-8 JSON: the FrameLayout, keyframe count and metadata
+    padding                     to a multiple of 64 bytes
+    keyframes                   little-endian float64, one FrameLayout-packed row per keyframe
+Rows hold exactly the values a RenderFrame does, so conversion to and from JSON is lossless,
+and the rows are memory-mapped so that opening a file reads only its header.
+Version 1 rows lack the symmetry and mirror fields, and are read into memory with their defaults.
+"""
+
+import json
+import struct
+import typing
+
+import numpy as np
+
+from sulfurvision import variations
+from sulfurvision.frames import FrameLayout, RenderFrame
+from sulfurvision.timeline import SMOOTHSTEP, Timeline
+
+MAGIC = b"SULFPAK\0"
+VERSION = 2
+# Fields FrameLayout has gained since version 1, at the end of each row, with their defaults
+_V1_DEFAULTS = (1.0, 0.0)
+EXTENSION = ".sulf"
+
+_ALIGNMENT = 64
+_PREAMBLE = struct.Struct("<II")
+_DTYPE = np.dtype("<f8")
+
+
+def is_packfile(fpath: str) -> bool:
+    """Whether the file at fpath starts like a pack file, as opposed to JSON."""
+    with open(fpath, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def write(
+    fpath: str,
+    frames: typing.Sequence[RenderFrame],
+    metadata: typing.Optional[dict[str, typing.Any]] = None,
+):
+    """Write keyframes, all of the same shape, plus any JSON-serializable metadata."""
+    if not frames:
+        raise ValueError("Cannot write an empty sequence of keyframes")
+    layout = FrameLayout.of(frames[0])
+    values = np.empty((len(frames), layout.size), _DTYPE)
+    for row, frame in zip(values, frames):
+        layout.pack(frame, row)
+    header = json.dumps(
+        {
+            "layout": {
+                "n_transforms": layout.n_transforms,
+                "n_colors": layout.n_colors,
+                "n_weights": layout.n_weights,
+                "n_params": layout.n_params,
+                "color_size": layout.color_size,
+            },
+            "count": len(frames),
+            "metadata": metadata or {},
+        }
+    ).encode("utf-8")
+    offset = len(MAGIC) + _PREAMBLE.size + len(header)
+    padding = -offset % _ALIGNMENT
+    with open(fpath, "wb") as file:
+        file.write(MAGIC)
+        file.write(_PREAMBLE.pack(VERSION, len(header)))
+        file.write(header)
+        file.write(b"\0" * padding)
+        file.write(values.tobytes())
+
+
+class PackFile:
+    """An open pack file. Keyframes are unpacked only when indexed, and never alias the file."""
+
+    def __init__(self, fpath: str):
+        with open(fpath, "rb") as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{fpath} is not a pack file")
+            version, header_size = _PREAMBLE.unpack(file.read(_PREAMBLE.size))
+            if version > VERSION:
+                raise ValueError(f"{fpath} has unsupported version {version}")
+            header = json.loads(file.read(header_size).decode("utf-8"))
+        self.layout = FrameLayout(**header["layout"])
+        if (
+            self.layout.n_weights != len(variations.Variation.variations)
+            or self.layout.n_params != variations.Variation.param_counter
+        ):
+            raise ValueError(f"{fpath} was written with a different set of variations")
+        self.metadata: dict[str, typing.Any] = header["metadata"]
+        offset = len(MAGIC) + _PREAMBLE.size + header_size
+        offset += -offset % _ALIGNMENT
+        if version >= 2:
+            self.values = np.memmap(
+                fpath, _DTYPE, "r", offset, (header["count"], self.layout.size)
+            )
+            return
+        old_size = self.layout.size - len(_V1_DEFAULTS)
+        self.values = np.empty((header["count"], self.layout.size), _DTYPE)
+        self.values[:, :old_size] = np.memmap(
+            fpath, _DTYPE, "r", offset, (header["count"], old_size)
+        )
+        self.values[:, old_size:] = _V1_DEFAULTS
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, index: int) -> RenderFrame:
+        return self.layout.unpack(self.values[index])
+
+    def __iter__(self) -> typing.Iterator[RenderFrame]:
+        return (self[i] for i in range(len(self)))
+
+    def frames(self) -> list[RenderFrame]:
+        return list(self)
+
+    def timeline(self, interpolation: str = SMOOTHSTEP) -> Timeline:
+        """The keyframes compiled for interpolation straight from their packed rows."""
+        return Timeline.from_packed(self.layout, self.values, interpolation)
@@ -0,0 +1,380 @@
+"""
+Interactive previews, rendered on one persistent thread that follows the latest edit
+
+Requests arriving in quick succession are debounced, so only the last of a burst of edits is
+rendered, and a new request abandons the preview in flight between two chunks of iterations.
+Each preview is delivered several times: first after a coarse chunk sized to take about
+COARSE_SECONDS, then after each of a series of longer chunks, until every iteration has run.
+When even the skipped iterations of every particle would take longer than that, a sketch
+with fewer particles comes first, with done_iters of 0.
+
+Finished previews may be kept in a PreviewCache, keyed by frame_key, so that scrubbing
+back to a frame already previewed shows it again at once. A preview that differs from the
+last finished one only in its tonemapping is tonemapped from the histogram that one left.
+A worker given a record_bytes budget records the samples of its previews, and one that
+differs from the last finished one only in its camera, symmetry or palette is rebinned
+from them without running the chaos game.
+"""
+
+import collections
+import dataclasses
+import hashlib
+import sys
+import threading
+import time
+import typing
+
+import numpy as np
+from PIL import Image
+
+from sulfurvision import prng
+from sulfurvision.batch import RenderSettings
+from sulfurvision.frames import FrameLayout, RenderFrame
+
+# Seconds without a newer request before a preview starts
+DEFAULT_DEBOUNCE = 0.1
+COARSE_SECONDS = 0.03
+# Each chunk aims to take twice as long as the last, up to this
+MAX_CHUNK_SECONDS = 0.25
+# Assumed until a chunk has been timed on the device
+INITIAL_SAMPLES_PER_SECOND = 1e6
+DEFAULT_CACHE_BYTES = 64 << 20
+DEFAULT_RECORD_BYTES = 256 << 20
+
+
+@dataclasses.dataclass
+class Preview:
+    # Of the request this is a preview for, as returned by PreviewWorker.request
+    generation: int
+    image: Image.Image
+    done_iters: int
+    total_iters: int
+
+    @property
+    def finished(self) -> bool:
+        return self.done_iters >= self.total_iters
+
+
+def frame_key(frame: RenderFrame, settings: RenderSettings) -> str:
+    """A digest of everything about a frame and its settings that shows in a render,
+    including the generator and seed the worker gives its renderer.
+    The frame's time, which is only its place in an animation, is left out.
+    """
+    layout = FrameLayout.of(frame)
+    packed = layout.pack(frame)
+    packed[layout.time] = 0
+    digest = hashlib.sha1()
+    digest.update(
+        repr(
+            (
+                layout.n_transforms,
+                layout.n_colors,
+                layout.n_weights,
+                layout.n_params,
+                # Including the generator and seed
+                dataclasses.astuple(settings),
+            )
+        ).encode()
+    )
+    digest.update(np.ascontiguousarray(packed, np.float64).tobytes())
+    return digest.hexdigest()
+
+
+@dataclasses.dataclass
+class CachedPreview:
+    image: Image.Image
+    # The raw histogram the image was tonemapped from, if the cache keeps them
+    histogram: typing.Optional[np.ndarray] = None
+
+    @property
+    def nbytes(self) -> int:
+        image_bytes = self.image.width * self.image.height * len(self.image.getbands())
+        return image_bytes + (0 if self.histogram is None else self.histogram.nbytes)
+
+
+class PreviewCache:
+    """Finished previews by frame_key, evicting the least recently used once they
+    take more than max_bytes. Safe to use from several threads.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES, histograms: bool = False):
+        self.max_bytes = max_bytes
+        self.histograms = histograms
+        self.nbytes = 0
+        self._entries: collections.OrderedDict[str, CachedPreview] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> typing.Optional[CachedPreview]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, image: Image.Image, histogram: typing.Optional[np.ndarray] = None):
+        entry = CachedPreview(image, histogram if self.histograms else None)
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key).nbytes
+            # A preview larger than the whole cache is not kept
+            if entry.nbytes > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self.nbytes += entry.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+
+class PreviewWorker:
+    """Renders previews with a Renderer on a thread of its own, calling deliver with each
+    Preview from that thread. Anything else using the renderer must hold lock while it does,
+    and should cancel first, so as not to wait for a preview to finish.
+    With a cache, requests for previews it holds are delivered at once, from request.
+    With record_bytes, the renderer records that many bytes of samples of each preview.
+    """
+
+    def __init__(
+        self,
+        renderer,
+        deliver: typing.Callable[[Preview], None],
+        debounce: float = DEFAULT_DEBOUNCE,
+        cache: typing.Optional[PreviewCache] = None,
+        record_bytes: int = 0,
+    ):
+        self.renderer = renderer
+        self.deliver = deliver
+        self.debounce = debounce
+        self.cache = cache
+        self.lock = threading.Lock()
+        if record_bytes:
+            renderer.record(record_bytes)
+        # Measured throughput, carried over from one preview to the next to size coarse chunks
+        self.samples_per_second = INITIAL_SAMPLES_PER_SECOND
+        self._cond = threading.Condition()
+        self._pending: typing.Optional[
+            tuple[int, RenderFrame, RenderSettings, typing.Optional[str], float]
+        ] = None
+        self._generation = 0
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def request(self, frame: RenderFrame, settings: RenderSettings) -> int:
+        """Preview a normalized frame, replacing any preview pending or in flight.
+        Returns the generation its Previews carry.
+        """
+        key = None if self.cache is None else frame_key(frame, settings)
+        cached = None if key is None else self.cache.get(key)
+        with self._cond:
+            self._generation += 1
+            generation = self._generation
+            if cached is None:
+                self._pending = (generation, frame, settings, key, time.perf_counter())
+                self._cond.notify()
+            else:
+                self._pending = None
+        if cached is not None:
+            self.deliver(Preview(generation, cached.image, settings.iters, settings.iters))
+        return generation
+
+    def cancel(self):
+        """Drop the pending preview and abandon the one in flight after its current chunk."""
+        with self._cond:
+            self._generation += 1
+            self._pending = None
+
+    def stop(self):
+        with self._cond:
+            self._generation += 1
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _current(self, generation: int) -> bool:
+        return generation == self._generation
+
+    def _next(
+        self,
+    ) -> typing.Optional[tuple[int, RenderFrame, RenderSettings, typing.Optional[str], float]]:
+        with self._cond:
+            while not self._stopped:
+                if self._pending is None:
+                    self._cond.wait()
+                    continue
+                remaining = self._pending[4] + self.debounce - time.perf_counter()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                job, self._pending = self._pending, None
+                return job
+            return None
+
+    def _run(self):
+        while (job := self._next()) is not None:
+            generation, frame, settings, key, _ = job
+            try:
+                with self.lock:
+                    self._render(generation, frame, settings, key)
+            except Exception as e:
+                print(f"Preview failed: {e}", file=sys.stderr)
+
+    def _start(self, frame: RenderFrame, settings: RenderSettings, particles: int):
+        self.renderer.update_to_match(
+            settings.width,
+            settings.height,
+            settings.supersample,
+            particles,
+            len(frame.palette),
+            len(frame.transforms),
+        )
+        self.renderer.generator = settings.generator
+        self.renderer.seed = settings.seed
+        self.renderer.reset()
+        self.renderer.randomize_particles()
+
+    def _chunk(self, cameras, transforms, frame: RenderFrame, start: int, iters: int, skip: int):
+        began = time.perf_counter()
+        self.renderer.chaos_game_from(cameras, transforms, frame.palette, start, iters, skip)
+        self.samples_per_second = (
+            self.renderer.n_particles * iters / max(time.perf_counter() - began, 1e-6)
+        )
+
+    def _render(
+        self,
+        generation: int,
+        frame: RenderFrame,
+        settings: RenderSettings,
+        key: typing.Optional[str] = None,
+    ):
+        from sulfurvision.cl import krnl
+
+        # Packed once, rather than by every chunk
+        transforms = krnl.pack_transforms(frame.transforms)
+        if self._finished(frame, settings, transforms):
+            image = self.renderer.image(frame.vibrancy, frame.gamma, frame.brightness)
+            self._done(generation, image, settings, key)
+            return
+        if self._recorded(frame, settings, transforms):
+            renderer = self.renderer
+            # The renderer is only resized if the settings are; its samples are kept
+            renderer.update_to_match(
+                settings.width,
+                settings.height,
+                settings.supersample,
+                settings.particles,
+                len(frame.palette),
+                len(frame.transforms),
+            )
+            image = renderer.rebin_frame(frame)
+            renderer.histogram_fingerprint = renderer.fingerprint(
+                renderer.frame_cameras(frame),
+                transforms,
+                frame.palette,
+                settings.iters,
+                settings.skip,
+            )
+            self._done(generation, image, settings, key)
+            return
+        first = settings.skip + 1
+        sketch = round(COARSE_SECONDS * self.samples_per_second / first)
+        if sketch < settings.particles and first < settings.iters:
+            # Every particle has to get past the skipped iterations before anything is plotted,
+            # so when that takes too long a sketch with fewer particles is shown first.
+            # Drivers such as pocl build the kernel anew for each work size they see,
+            # so sketches stick to powers of two.
+            self._start(frame, settings, 1 << max(0, sketch.bit_length() - 1))
+            cameras = self.renderer.frame_cameras(frame)
+            self._chunk(cameras, transforms, frame, 0, first, settings.skip)
+            if not self._current(generation):
+                return
+            image = self.renderer.image(frame.vibrancy, frame.gamma, frame.brightness)
+            self.deliver(Preview(generation, image, 0, settings.iters))
+
+        self._start(frame, settings, settings.particles)
+        cameras = self.renderer.frame_cameras(frame)
+        done = 0
+        target = COARSE_SECONDS
+        while done < settings.iters:
+            if not self._current(generation):
+                return
+            iters = max(1, round(target * self.samples_per_second / settings.particles))
+            if not done:
+                iters = max(iters, first)
+            iters = min(iters, settings.iters - done)
+            self._chunk(cameras, transforms, frame, done, iters, settings.skip)
+            done += iters
+            if not self._current(generation):
+                return
+            if done == settings.iters:
+                self.renderer.histogram_fingerprint = self.renderer.fingerprint(
+                    cameras, transforms, frame.palette, settings.iters, settings.skip
+                )
+                if self.renderer.recorded_all():
+                    self.renderer.samples_fingerprint = self.renderer.fingerprint(
+                        None, transforms, None, settings.iters, settings.skip
+                    )
+                image = self.renderer.image(frame.vibrancy, frame.gamma, frame.brightness)
+                self._done(generation, image, settings, key)
+                return
+            image = self.renderer.image(frame.vibrancy, frame.gamma, frame.brightness)
+            self.deliver(Preview(generation, image, done, settings.iters))
+            target = min(target * 2, MAX_CHUNK_SECONDS)
+
+    def _same_generator(self, settings: RenderSettings) -> bool:
+        """Whether the renderer draws its random numbers as settings asks. LCG renderers move
+        their seed on as they go, and their fingerprints do not tell seeds apart anyway.
+        """
+        renderer = self.renderer
+        return renderer.generator == settings.generator and (
+            settings.generator != prng.PHILOX or renderer.seed == settings.seed
+        )
+
+    def _finished(self, frame: RenderFrame, settings: RenderSettings, transforms) -> bool:
+        """Whether the renderer's histogram holds a finished preview of the frame,
+        perhaps with other tonemapping.
+        """
+        renderer = self.renderer
+        if renderer.histogram_fingerprint is None or not self._same_generator(settings):
+            return False
+        # The fingerprint covers the renderer's size, which frame_cameras depends on
+        return renderer.histogram_fingerprint == renderer.fingerprint(
+            renderer.frame_cameras(frame),
+            transforms,
+            frame.palette,
+            settings.iters,
+            settings.skip,
+        )
+
+    def _recorded(self, frame: RenderFrame, settings: RenderSettings, transforms) -> bool:
+        """Whether the renderer holds every sample of a finished preview of the frame,
+        perhaps with another camera, symmetry or palette.
+        """
+        renderer = self.renderer
+        if renderer.samples_fingerprint is None or not self._same_generator(settings):
+            return False
+        # The fingerprint covers the number of particles, though not the renderer's size
+        return renderer.samples_fingerprint == renderer.fingerprint(
+            None, transforms, None, settings.iters, settings.skip
+        )
+
+    def _done(
+        self,
+        generation: int,
+        image: Image.Image,
+        settings: RenderSettings,
+        key: typing.Optional[str],
+    ):
+        if key is not None:
+            self.cache.put(
+                key, image, self.renderer.histogram.get() if self.cache.histograms else None
+            )
+        self.deliver(Preview(generation, image, settings.iters, settings.iters))
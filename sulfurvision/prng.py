@@ -1,3 +1,6 @@
+import numpy as np
+
+
 def xorshift32(seed: int) -> int:
     seed ^= (seed << 13) & 0xFFFFFFFF
     seed ^= (seed >> 17) & 0xFFFFFFFF
@@ -26,3 +29,43 @@ def rand_u32(seed: int) -> int:
 def rand_uniform(seed: int, scale: float = 1.0) -> tuple[int, float]:
     new_seed = rand_u32(seed)
     return new_seed, new_seed / 0x100000000 * scale
+
+
+# Generators the renderer can use for the chaos game, in the order of the device's PRNG_* constants
+LCG32 = "lcg32"
+PHILOX = "philox"
+GENERATORS = (LCG32, PHILOX)
+# Keys Philox renders, and the LCG renderer's own stream, unless another seed is given
+DEFAULT_SEED = 12345
+
+_PHILOX_M0 = 0xD2511F53
+_PHILOX_M1 = 0xCD9E8D57
+_PHILOX_W0 = 0x9E3779B9
+_PHILOX_W1 = 0xBB67AE85
+
+
+def philox4x32(counter, key, rounds: int = 10):
+    """The Philox4x32 counter-based generator of Salmon et al.
+    counter is 4 and key 2 unsigned 32-bit words, each an int or a numpy array,
+    and the result is 4 words of the same kind. Matches philox4x32_10 in util.cl.
+    """
+    c0, c1, c2, c3 = (np.asarray(word, np.uint64) for word in counter)
+    k0, k1 = (np.asarray(word, np.uint64) for word in key)
+    for i in range(rounds):
+        if i:
+            k0 = (k0 + _PHILOX_W0) & 0xFFFFFFFF
+            k1 = (k1 + _PHILOX_W1) & 0xFFFFFFFF
+        product0 = c0 * _PHILOX_M0
+        product1 = c2 * _PHILOX_M1
+        c0, c1, c2, c3 = (
+            (product1 >> 32) ^ c1 ^ k0,
+            product1 & 0xFFFFFFFF,
+            (product0 >> 32) ^ c3 ^ k1,
+            product0 & 0xFFFFFFFF,
+        )
+    return c0, c1, c2, c3
+
+
+def philox_uniform(counter, key) -> tuple:
+    """Four uniform values in [0, 1) for a counter and key."""
+    return tuple(word / 0x100000000 for word in philox4x32(counter, key))
@@ -0,0 +1,146 @@
+"""
+Animation projects as saved by the GUI, usable without Tk or OpenCL
+"""
+
+import dataclasses
+import functools
+import json
+import typing
+
+import numpy as np
+
+from sulfurvision import packfile
+from sulfurvision.timeline import SMOOTHSTEP, Timeline
+from sulfurvision.frames import RenderFrame
+
+
+@dataclasses.dataclass
+class Project:
+    """A sequence of keyframes plus the render settings stored alongside them.
+    Each keyframe's time is the delay since the previous keyframe.
+    """
+
+    frames: list[RenderFrame]
+    n_transforms: int
+    n_colors: int
+    width: int = 100
+    height: int = 100
+    seeds: int = 20
+    iters: int = 100
+    skip: int = 10
+    supersample: int = 1
+    rate: float = 20
+    interpolation: str = SMOOTHSTEP
+
+    @property
+    def duration(self) -> float:
+        return sum(map(lambda frame: frame.time, self.frames))
+
+    def keyframe_time(self, index: int) -> float:
+        """Absolute time at which the keyframe at index occurs."""
+        return sum(map(lambda frame: frame.time, self.frames[: index + 1]))
+
+    def pairs_for_splines(self) -> list[tuple[RenderFrame, float]]:
+        pairs = []
+        t = 0
+        for frame in self.frames:
+            t += frame.time
+            pairs.append((frame, t))
+        return pairs
+
+    @functools.cached_property
+    def timeline(self) -> Timeline:
+        """The keyframes compiled for interpolation. Built on first use, so a project's
+        keyframes should not be edited after frames have been taken from it.
+        """
+        return Timeline(self.frames, self.interpolation)
+
+    def frame_at(self, t: float) -> RenderFrame:
+        """Interpolate and normalize the frame at time t.
+        The returned frame never aliases one of the keyframes.
+        """
+        return self.timeline.frame_at(t)
+
+    def frames_at(self, times: typing.Sequence[float]) -> list[RenderFrame]:
+        """frame_at for many times at once."""
+        return self.timeline.frames(times)
+
+    def shutter_frames(self, t: float, shutter: float, n: int) -> list[RenderFrame]:
+        """Frames at n evenly spaced times across a shutter interval of length shutter centred on t,
+        for rendering t with motion blur. Returns just the frame at t if there is no interval.
+        """
+        if n <= 1 or shutter <= 0:
+            return [self.frame_at(t)]
+        return self.frames_at(t + shutter * ((np.arange(n) + 0.5) / n - 0.5))
+
+    def frame_times(self, rate: typing.Optional[float] = None) -> np.ndarray:
+        """The times of every frame of the animation, matching the GUI's animation schedule."""
+        rate = self.rate if rate is None else rate
+        if rate <= 0:
+            raise ValueError("Frame rate must be positive")
+        return np.arange(0, self.duration, 1 / rate)
+
+    def to_dict(self) -> dict[str, typing.Any]:
+        return {
+            "n_transforms": self.n_transforms,
+            "n_colors": self.n_colors,
+            "width": self.width,
+            "height": self.height,
+            "seeds": self.seeds,
+            "iters": self.iters,
+            "skip": self.skip,
+            "supersample": self.supersample,
+            "rate": self.rate,
+            "interpolation": self.interpolation,
+            "frames": [frame.to_dict() for frame in self.frames],
+        }
+
+    def dump_json(self) -> str:
+        return json.dumps(self.to_dict())
+
+    @staticmethod
+    def from_dict(d: dict[str, typing.Any]) -> "Project":
+        return Project(
+            list(map(RenderFrame.from_dict, d["frames"])),
+            d["n_transforms"],
+            d["n_colors"],
+            d["width"],
+            d["height"],
+            d["seeds"],
+            d["iters"],
+            d["skip"],
+            d["supersample"],
+            d["rate"],
+            d.get("interpolation", SMOOTHSTEP),
+        )
+
+    @staticmethod
+    def read_json(s: str) -> "Project":
+        return Project.from_dict(json.loads(s))
+
+    @staticmethod
+    def load(fpath: str) -> "Project":
+        """Load a project saved as JSON or as a pack file.
+        A pack file holding just keyframes loads with default settings.
+        """
+        if packfile.is_packfile(fpath):
+            pack = packfile.PackFile(fpath)
+            project = Project(
+                pack.frames(), pack.layout.n_transforms, pack.layout.n_colors, **pack.metadata
+            )
+            # Compile straight from the packed rows rather than packing the keyframes again
+            project.timeline = pack.timeline(project.interpolation)
+            return project
+        with open(fpath, "r") as file:
+            return Project.read_json(file.read())
+
+    def save(self, fpath: str):
+        """Save as a pack file if fpath ends with packfile.EXTENSION, otherwise as JSON."""
+        if fpath.endswith(packfile.EXTENSION):
+            settings = self.to_dict()
+            for key in ("frames", "n_transforms", "n_colors"):
+                del settings[key]
+            packfile.write(fpath, self.frames, settings)
+            return
+        with open(fpath, "w") as file:
+            file.write(self.dump_json())
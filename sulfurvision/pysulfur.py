@@ -11,6 +11,11 @@ import numpy as np
 
 from sulfurvision import prng, types, util, variations
 
+# As in defines.cl: particles this far out, or non-finite, are reseeded,
+# then not plotted for RESEED_WARMUP iterations
+ESCAPE_RADIUS = 1e10
+RESEED_WARMUP = 20
+
 
 def affine_transform(coord: types.Coord, affine: types.AffineTransform) -> types.Coord:
     """Apply an affine transform to a 2D coordinate and return the result."""
@@ -34,6 +39,31 @@ def affine_compose(first: types.AffineTransform, second: types.AffineTransform)
     )
 
 
+def symmetry_affines(symmetry: int = 1, mirror: bool = False) -> list[types.AffineTransform]:
+    """The symmetry-fold rotations about the origin, each followed by its reflection
+    across the y axis if mirror is set. The first is always the identity.
+    """
+    affines = []
+    for k in range(max(1, symmetry)):
+        angle = 2 * np.pi * k / max(1, symmetry)
+        cos, sin = np.cos(angle), np.sin(angle)
+        affines.append(np.array((cos, -sin, 0, sin, cos, 0)))
+        if mirror:
+            affines.append(np.array((-cos, sin, 0, sin, cos, 0)))
+    return affines
+
+
+def symmetric_cameras(
+    camera: types.AffineTransform, symmetry: int = 1, mirror: bool = False
+) -> np.ndarray:
+    """camera composed after each of symmetry_affines, shaped (copies, 6),
+    so that plotting a point through every row plots all of its symmetric copies.
+    """
+    return np.array(
+        [affine_compose(affine, camera) for affine in symmetry_affines(symmetry, mirror)]
+    )
+
+
 @dataclasses.dataclass
 class Event:
     """A logged event of a particle having a certain color at a certain coordinate."""
@@ -49,10 +79,22 @@ class State:
     coord: types.Coord
     seed: int
     color: float = 0
+    # Iterations left before a reseeded particle is plotted again
+    warmup: int = 0
 
     def log_event(self) -> Event:
         return Event(self.coord, self.color)
 
+    def escaped(self) -> bool:
+        """Whether the particle is non-finite, or so far out that it is not coming back."""
+        return not (abs(self.coord[0]) < ESCAPE_RADIUS and abs(self.coord[1]) < ESCAPE_RADIUS)
+
+    def reseed(self) -> "State":
+        """Start over from a fresh point drawn from this particle's own seed."""
+        seed, cx = prng.rand_uniform(self.seed)
+        seed, cy = prng.rand_uniform(seed)
+        return State(np.array((cx, cy)), seed, self.color, RESEED_WARMUP)
+
 
 @dataclasses.dataclass
 class Transform:
@@ -88,17 +130,18 @@ class Transform:
     def __mix_color(self, color: float) -> float:
         return util.lerp(color, self.color, self.color_speed)
 
+    def to_dict(self) -> dict[str, typing.Any]:
+        return {
+            "weights": list(self.weights),
+            "params": list(self.params),
+            "affine": list(self.affine),
+            "probability": self.probability,
+            "color": self.color,
+            "color_speed": self.color_speed,
+        }
+
     def dump_json(self) -> str:
-        return json.dumps(
-            {
-                "weights": list(self.weights),
-                "params": list(self.params),
-                "affine": list(self.affine),
-                "probability": self.probability,
-                "color": self.color,
-                "color_speed": self.color_speed,
-            }
-        )
+        return json.dumps(self.to_dict())
 
     @staticmethod
     def read_json(jsn: str) -> typing.Union[list["Transform"], "Transform"]:
@@ -170,6 +213,9 @@ class Flame:
     camera: types.AffineTransform = dataclasses.field(
         default_factory=lambda: types.IdentityAffine
     )
+    # Every point is plotted once per symmetry-fold rotation, and again mirrored if mirror is set
+    symmetry: int = 1
+    mirror: bool = False
     total_weight: float = dataclasses.field(init=False, default=0)
 
     def __post_init__(self):
@@ -195,15 +241,25 @@ class Flame:
         """Performs one iteration on each state in a list, and returns the list of logged events.
         Modifies states to the new states, but does not modify any State objects passed within the list.
         """
+        cameras = symmetric_cameras(self.camera, self.symmetry, self.mirror)
         for i, state in enumerate(states):
             new_state = self.iterate(state)
+            if new_state.escaped():
+                states[i] = new_state.reseed()
+                continue
             states[i] = new_state
-            coord = affine_transform(new_state.coord, self.camera)
-            if not (0 <= coord[0] < 1 and 0 <= coord[1] < 1) or grid is None:
+            if state.warmup > 0:
+                new_state.warmup = state.warmup - 1
+                continue
+            if grid is None:
                 continue
-            x, y = int(coord[0] * grid.shape[0]), int(coord[1] * grid.shape[1])
             color = self.palette(new_state.color)
-            grid[x, y] += color
+            for camera in cameras:
+                coord = affine_transform(new_state.coord, camera)
+                if not (0 <= coord[0] < 1 and 0 <= coord[1] < 1):
+                    continue
+                x, y = int(coord[0] * grid.shape[0]), int(coord[1] * grid.shape[1])
+                grid[x, y] += color
 
     def iterate_steps(
         self, initial_states: list[State], grid: types.ImageGrid, epochs: int
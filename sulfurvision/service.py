@@ -0,0 +1,365 @@
+"""
+Long-lived local render service, so that several tools can share a warm Renderer per device
+
+Clients connect over TCP on localhost and send one JSON object per line:
+    {"frame": <RenderFrame dict>, "settings": <RenderSettings dict>, "priority": 0}
+The service replies on the same connection with one JSON object per line:
+    {"status": "queued", "job": 1}
+    {"status": "progress", "job": 1, "done": 2000, "total": 10000}
+    {"status": "done", "job": 1, "seconds": 0.5, "image": <base64 PNG>}
+or {"status": "error", "message": "..."} if the request could not be rendered.
+
+Lower priority values run first, on whichever device is free. Jobs are rendered in chunks
+of iterations, and a job is suspended between chunks whenever a more urgent job is waiting
+and no device is free to take it. A suspended job may resume on another device.
+"""
+
+import argparse
+import asyncio
+import base64
+import concurrent.futures
+import dataclasses
+import heapq
+import io
+import itertools
+import json
+import sys
+import time
+import typing
+
+from sulfurvision.batch import RenderSettings
+from sulfurvision.frames import RenderFrame
+
+PRIORITY_PREVIEW = 0
+PRIORITY_FINAL = 10
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_CHUNK_ITERS = 2000
+
+
+@dataclasses.dataclass
+class Job:
+    """A queued render request and its progress."""
+
+    id: int
+    frame: RenderFrame
+    settings: RenderSettings
+    priority: int
+    chunk_iters: int
+    messages: asyncio.Queue
+    done_iters: int = 0
+    state: typing.Any = None
+    cancelled: bool = False
+    started: float = dataclasses.field(default_factory=time.perf_counter)
+
+    @property
+    def finished(self) -> bool:
+        return self.done_iters >= self.settings.iters
+
+
+class DeviceWorker:
+    """A Renderer on one device, and the thread all of that device's work happens on.
+    Without a device, the renderer uses the device that renderers share.
+    """
+
+    def __init__(self, device=None):
+        self.device = device
+        self.renderer = None
+        # The job being rendered, None while idle
+        self.job: typing.Optional[Job] = None
+        self.task: typing.Optional[asyncio.Task] = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    async def call(self, func, *args):
+        """Run func on this worker's thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def create_renderer(self):
+        from sulfurvision.cl import render
+
+        renderer = render.Renderer
+        if self.device is not None:
+            renderer = renderer.on_device(self.device)
+        self.renderer = renderer(1, 1, 1, 1, 1, 1)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def default_devices() -> list:
+    """Every OpenCL device, or [None] for the shared device when there is only one."""
+    from sulfurvision.cl import bootstrap
+
+    devices = bootstrap.all_devices()
+    return devices if len(devices) > 1 else [None]
+
+
+class RenderService:
+    """Schedules render jobs onto a Renderer per device, each on a thread of its own;
+    the event loop only schedules. devices defaults to default_devices().
+    """
+
+    def __init__(
+        self,
+        chunk_iters: int = DEFAULT_CHUNK_ITERS,
+        devices: typing.Optional[typing.Sequence] = None,
+    ):
+        self.chunk_iters = chunk_iters
+        self.devices = devices
+        self.workers: list[DeviceWorker] = []
+        self._heap: list[tuple[int, int, Job]] = []
+        # Jobs may be submitted before start, and wait for it
+        self._wakeup = asyncio.Event()
+        self._ids = itertools.count(1)
+
+    async def start(self):
+        """Build the kernel on every device and start their schedulers on the running event loop."""
+        devices = self.devices
+        if devices is None:
+            devices = await asyncio.get_running_loop().run_in_executor(None, default_devices)
+        workers = [DeviceWorker(device) for device in devices]
+        await asyncio.gather(*(worker.call(worker.create_renderer) for worker in workers))
+        for worker in workers:
+            worker.task = asyncio.create_task(self._run(worker))
+        self.workers = workers
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.task.cancel()
+            try:
+                await worker.task
+            except asyncio.CancelledError:
+                pass
+            worker.shutdown()
+        self.workers = []
+
+    def submit(
+        self,
+        frame: RenderFrame,
+        settings: RenderSettings,
+        priority: int = PRIORITY_FINAL,
+        chunk_iters: typing.Optional[int] = None,
+    ) -> Job:
+        """Queue a job. Its messages are delivered through job.messages, ending with done or error."""
+        frame = frame * 1.0
+        frame.normalize()
+        job = Job(
+            next(self._ids),
+            frame,
+            settings,
+            priority,
+            chunk_iters or self.chunk_iters,
+            asyncio.Queue(),
+        )
+        job.messages.put_nowait({"status": "queued", "job": job.id})
+        self._push(job)
+        return job
+
+    def _push(self, job: Job):
+        heapq.heappush(self._heap, (job.priority, job.id, job))
+        self._wakeup.set()
+
+    def _preempted(self, job: Job) -> bool:
+        """Whether a more urgent job is waiting, with every device busy."""
+        return (
+            bool(self._heap)
+            and self._heap[0][0] < job.priority
+            and all(worker.job is not None for worker in self.workers)
+        )
+
+    @staticmethod
+    def _prepare(renderer, job: Job):
+        """Size the renderer for a job, and either start it or restore its suspended state."""
+        settings = job.settings
+        renderer.update_to_match(
+            settings.width,
+            settings.height,
+            settings.supersample,
+            settings.particles,
+            len(job.frame.palette),
+            len(job.frame.transforms),
+        )
+        renderer.generator = settings.generator
+        renderer.seed = settings.seed
+        if job.state is None:
+            renderer.reset()
+            renderer.randomize_particles()
+        else:
+            renderer.load_state(job.state)
+            job.state = None
+
+    @staticmethod
+    def _chunk(renderer, job: Job):
+        settings = job.settings
+        iters = min(job.chunk_iters, settings.iters - job.done_iters)
+        renderer.chaos_game_from(
+            renderer.frame_cameras(job.frame),
+            job.frame.transforms,
+            job.frame.palette,
+            job.done_iters,
+            iters,
+            settings.skip,
+        )
+        job.done_iters += iters
+
+    @staticmethod
+    def _suspend(renderer, job: Job):
+        job.state = renderer.save_state()
+
+    @staticmethod
+    def _finish(renderer, job: Job) -> str:
+        img = renderer.image(job.frame.vibrancy, job.frame.gamma, job.frame.brightness)
+        buffer = io.BytesIO()
+        img.save(buffer, format="PNG")
+        return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+    async def _run(self, worker: DeviceWorker):
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            _, _, job = heapq.heappop(self._heap)
+            if job.cancelled:
+                continue
+            worker.job = job
+            try:
+                await self._run_job(worker, job)
+            except Exception as e:
+                # Only this job fails; the worker goes on to the next
+                job.messages.put_nowait({"status": "error", "job": job.id, "message": str(e)})
+            finally:
+                worker.job = None
+
+    async def _run_job(self, worker: DeviceWorker, job: Job):
+        await worker.call(self._prepare, worker.renderer, job)
+        while not job.finished:
+            await worker.call(self._chunk, worker.renderer, job)
+            job.messages.put_nowait(
+                {
+                    "status": "progress",
+                    "job": job.id,
+                    "done": job.done_iters,
+                    "total": job.settings.iters,
+                }
+            )
+            if job.cancelled:
+                return
+            if not job.finished and self._preempted(job):
+                await worker.call(self._suspend, worker.renderer, job)
+                self._push(job)
+                return
+        image = await worker.call(self._finish, worker.renderer, job)
+        job.messages.put_nowait(
+            {
+                "status": "done",
+                "job": job.id,
+                "seconds": time.perf_counter() - job.started,
+                "image": image,
+            }
+        )
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve requests from one connection, one JSON line each, streaming replies back."""
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    job = self.submit(
+                        RenderFrame.from_dict(request["frame"]),
+                        RenderSettings(**request["settings"]),
+                        request.get("priority", PRIORITY_FINAL),
+                        request.get("chunk_iters"),
+                    )
+                except (KeyError, IndexError, TypeError, ValueError) as e:
+                    await _send(writer, {"status": "error", "message": f"Bad request: {e}"})
+                    continue
+                try:
+                    while True:
+                        message = await job.messages.get()
+                        await _send(writer, message)
+                        if message["status"] in ("done", "error"):
+                            break
+                except ConnectionError:
+                    job.cancelled = True
+                    raise
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> asyncio.Server:
+        """Start listening. Pass port 0 to pick a free port, readable from the returned server."""
+        if not self.workers:
+            await self.start()
+        return await asyncio.start_server(self.handle_client, host, port)
+
+
+async def _send(writer: asyncio.StreamWriter, message: dict):
+    writer.write(json.dumps(message).encode("utf-8") + b"\n")
+    await writer.drain()
+
+
+async def request_render(
+    frame: RenderFrame,
+    settings: RenderSettings,
+    priority: int = PRIORITY_FINAL,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    chunk_iters: typing.Optional[int] = None,
+) -> typing.AsyncIterator[dict]:
+    """Send one request to a running service and yield each reply until it finishes."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        request = {
+            "frame": frame.to_dict(),
+            "settings": dataclasses.asdict(settings),
+            "priority": priority,
+        }
+        if chunk_iters is not None:
+            request["chunk_iters"] = chunk_iters
+        await _send(writer, request)
+        while line := await reader.readline():
+            message = json.loads(line)
+            yield message
+            if message["status"] in ("done", "error"):
+                break
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+def decode_image(message: dict):
+    """Return the PIL image carried by a done message."""
+    from PIL import Image
+
+    return Image.open(io.BytesIO(base64.b64decode(message["image"])))
+
+
+async def _serve_forever(host: str, port: int, chunk_iters: int):
+    service = RenderService(chunk_iters)
+    server = await service.serve(host, port)
+    print(f"Serving on {', '.join(str(s.getsockname()) for s in server.sockets)}")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv: typing.Optional[typing.Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="sulfurvision-serve", description="Run a local render service."
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--chunk-iters", type=int, default=DEFAULT_CHUNK_ITERS)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_serve_forever(args.host, args.port, args.chunk_iters))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+"""
+Destinations for the frames of an animation, written as they are produced
+
+Every sink splits writing a frame into two steps:
+    encode(img)                 pure and thread-safe, so it can run on a pool of encoders
+    write_encoded(index, data)  called once per frame, in order
+write(index, img) does both. Apart from WebP, sinks stream to disk and hold at most one frame;
+WebP holds compressed frames up to a limit, and rejects sequences that outgrow it.
+"""
+
+import fractions
+import io
+from os import path
+import os
+import struct
+import typing
+import zlib
+
+import numpy as np
+from PIL import Image
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Compressed frames a WebPSink holds before it gives up on the sequence
+DEFAULT_WEBP_BYTES = 256 << 20
+
+
+class FrameSink:
+    """Receives the frames of an animation in order, all of the same size."""
+
+    def encode(self, img: Image.Image) -> typing.Any:
+        return img
+
+    def write_encoded(self, index: int, data: typing.Any):
+        raise NotImplementedError
+
+    def write(self, index: int, img: Image.Image):
+        self.write_encoded(index, self.encode(img))
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class PngSequenceSink(FrameSink):
+    """One image file per frame, as the GUI has always written."""
+
+    def __init__(
+        self,
+        directory: str,
+        ext: str = "png",
+        filename: typing.Optional[typing.Callable[[int], str]] = None,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.ext = ext
+        self.filename = filename or (lambda index: f"frame_{index:06}.{ext}")
+
+    def encode(self, img: Image.Image) -> bytes:
+        buffer = io.BytesIO()
+        img.save(buffer, format=Image.registered_extensions()[f".{self.ext}"])
+        return buffer.getvalue()
+
+    def write_encoded(self, index: int, data: bytes):
+        with open(path.join(self.directory, self.filename(index)), "wb") as file:
+            file.write(data)
+
+
+class _StreamSink(FrameSink):
+    """A single output file that every frame is appended to."""
+
+    def __init__(self, fpath: str):
+        self.file = open(fpath, "wb")
+        self.size: typing.Optional[tuple[int, int]] = None
+
+    def _check_size(self, size: tuple[int, int]):
+        if self.size is None:
+            self.size = size
+            self._header()
+        elif self.size != size:
+            raise ValueError(f"Frame size changed from {self.size} to {size}")
+
+    def _header(self):
+        pass
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+class RawRGBSink(_StreamSink):
+    """Headerless packed RGB24 frames, e.g. for ffmpeg -f rawvideo -pix_fmt rgb24 -s WxH."""
+
+    def encode(self, img: Image.Image) -> tuple[tuple[int, int], bytes]:
+        return img.size, img.convert("RGB").tobytes()
+
+    def write_encoded(self, index: int, data: tuple[tuple[int, int], bytes]):
+        size, raw = data
+        self._check_size(size)
+        self.file.write(raw)
+
+
+class Y4MSink(_StreamSink):
+    """YUV4MPEG2 stream with full-resolution (4:4:4) chroma, readable by ffmpeg and most players.
+    Pillow's YCbCr is full range, which the header says, so players do not clip it.
+    """
+
+    def __init__(self, fpath: str, rate: float):
+        super().__init__(fpath)
+        self.rate = fractions.Fraction(rate).limit_denominator(1001)
+
+    def encode(self, img: Image.Image) -> tuple[tuple[int, int], bytes]:
+        ycbcr = np.asarray(img.convert("YCbCr"))
+        # Planar: all of Y, then all of Cb, then all of Cr
+        return img.size, np.ascontiguousarray(ycbcr.transpose(2, 0, 1)).tobytes()
+
+    def _header(self):
+        w, h = self.size
+        self.file.write(
+            f"YUV4MPEG2 W{w} H{h} F{self.rate.numerator}:{self.rate.denominator} "
+            "Ip A1:1 C444 XCOLORRANGE=FULL\n".encode("ascii")
+        )
+
+    def write_encoded(self, index: int, data: tuple[tuple[int, int], bytes]):
+        size, planes = data
+        self._check_size(size)
+        self.file.write(b"FRAME\n")
+        self.file.write(planes)
+
+
+def _png_chunks(data: bytes) -> typing.Iterator[tuple[bytes, bytes]]:
+    offset = len(_PNG_SIGNATURE)
+    while offset < len(data):
+        (length,) = struct.unpack(">I", data[offset : offset + 4])
+        kind = data[offset + 4 : offset + 8]
+        yield kind, data[offset + 8 : offset + 8 + length]
+        offset += 12 + length
+
+
+class APNGSink(_StreamSink):
+    """Animated PNG, streamed one frame at a time.
+    Each frame is deflated by Pillow as an ordinary PNG, and its image data is
+    re-wrapped as APNG frame chunks. The frame count is patched in on close.
+    """
+
+    def __init__(self, fpath: str, rate: float, loop: int = 0):
+        super().__init__(fpath)
+        delay = fractions.Fraction(1 / rate).limit_denominator(0xFFFF)
+        self.delay = (delay.numerator, delay.denominator)
+        self.loop = loop
+        self.sequence = 0
+        self.frames = 0
+        self.actl_offset = 0
+
+    def _chunk(self, kind: bytes, data: bytes):
+        self.file.write(struct.pack(">I", len(data)))
+        self.file.write(kind)
+        self.file.write(data)
+        self.file.write(struct.pack(">I", zlib.crc32(kind + data)))
+
+    def encode(self, img: Image.Image) -> tuple[tuple[int, int], bytes]:
+        buffer = io.BytesIO()
+        img.convert("RGB").save(buffer, format="PNG")
+        return img.size, buffer.getvalue()
+
+    def write_encoded(self, index: int, data: tuple[tuple[int, int], bytes]):
+        size, png = data
+        chunks = list(_png_chunks(png))
+        if self.size is None:
+            self.file.write(_PNG_SIGNATURE)
+            self._chunk(b"IHDR", dict(chunks)[b"IHDR"])
+            self.actl_offset = self.file.tell()
+            self._chunk(b"acTL", struct.pack(">II", 0, self.loop))
+        self._check_size(size)
+        w, h = size
+        self._chunk(
+            b"fcTL",
+            struct.pack(">IIIIIHHBB", self.sequence, w, h, 0, 0, *self.delay, 0, 0),
+        )
+        self.sequence += 1
+        for kind, chunk in chunks:
+            if kind != b"IDAT":
+                continue
+            if self.frames == 0:
+                self._chunk(b"IDAT", chunk)
+            else:
+                self._chunk(b"fdAT", struct.pack(">I", self.sequence) + chunk)
+                self.sequence += 1
+        self.frames += 1
+
+    def close(self):
+        if self.file.closed:
+            return
+        if self.frames:
+            self._chunk(b"IEND", b"")
+            self.file.seek(self.actl_offset)
+            self._chunk(b"acTL", struct.pack(">II", self.frames, self.loop))
+        super().close()
+
+
+class WebPSink(FrameSink):
+    """Animated WebP through Pillow.
+    Pillow can only encode a WebP animation from the whole sequence at once, so frames
+    are kept losslessly compressed in memory and only decoded while the file is written.
+    Memory is bounded by max_bytes of compressed frames: a sequence that needs more raises
+    ValueError and is dropped, and should be written as APNG or Y4M instead.
+    """
+
+    def __init__(
+        self,
+        fpath: str,
+        rate: float,
+        loop: int = 0,
+        max_bytes: int = DEFAULT_WEBP_BYTES,
+        **options,
+    ):
+        self.fpath = fpath
+        self.duration = 1000 / rate
+        self.loop = loop
+        self.max_bytes = max_bytes
+        self.options = options
+        self.frames: list[bytes] = []
+        self.nbytes = 0
+
+    def encode(self, img: Image.Image) -> bytes:
+        buffer = io.BytesIO()
+        img.convert("RGB").save(buffer, format="PNG", compress_level=1)
+        return buffer.getvalue()
+
+    def write_encoded(self, index: int, data: bytes):
+        if self.nbytes + len(data) > self.max_bytes:
+            self.frames = []
+            self.nbytes = 0
+            raise ValueError(
+                f"WebP animations are held in memory until closed, and this one needs more "
+                f"than {self.max_bytes} bytes; write .apng or .y4m instead"
+            )
+        self.frames.append(data)
+        self.nbytes += len(data)
+
+    def close(self):
+        if not self.frames:
+            return
+        images = [Image.open(io.BytesIO(data)) for data in self.frames]
+        images[0].save(
+            self.fpath,
+            format="WEBP",
+            save_all=True,
+            append_images=images[1:],
+            duration=self.duration,
+            loop=self.loop,
+            **self.options,
+        )
+        self.frames = []
+        self.nbytes = 0
+
+
+# File extensions that produce a single animation file rather than a directory of images
+STREAM_EXTENSIONS = (".y4m", ".rgb", ".apng", ".webp")
+
+
+def open_sink(
+    output: str,
+    rate: float,
+    ext: str = "png",
+    filename: typing.Optional[typing.Callable[[int], str]] = None,
+) -> FrameSink:
+    """Choose a sink from the output path's extension, defaulting to a directory of images."""
+    suffix = path.splitext(output)[1].lower()
+    if suffix == ".y4m":
+        return Y4MSink(output, rate)
+    if suffix == ".rgb":
+        return RawRGBSink(output)
+    if suffix == ".apng":
+        return APNGSink(output, rate)
+    if suffix == ".webp":
+        return WebPSink(output, rate)
+    return PngSequenceSink(output, ext, filename)
@@ -0,0 +1,152 @@
+"""
+Keyframes compiled once for interpolation at many times
+"""
+
+import typing
+
+import numpy as np
+
+from sulfurvision import util
+from sulfurvision.frames import FrameLayout, RenderFrame
+
+SMOOTHSTEP = "smoothstep"
+CATMULL_ROM = "catmull_rom"
+INTERPOLATIONS = (SMOOTHSTEP, CATMULL_ROM)
+
+
+def catmull_rom_weights(t: np.ndarray, times: np.ndarray) -> np.ndarray:
+    """Weights of the four control points of util.catmull_rom for each t,
+    given each t's four control times, shaped (N, 4).
+    The spline is linear in its values, so interpolating the unit vectors gives the weights.
+    """
+    t = np.asarray(t, dtype=np.float64)[:, None]
+    unit = np.eye(4)
+    return util.catmull_rom(unit, t, [times[:, i : i + 1] for i in range(4)])
+
+
+class Timeline:
+    """Every keyframe of an animation packed into one array, for interpolating any number
+    of frames at once. Each keyframe's time is the delay since the previous keyframe,
+    as in the GUI. With SMOOTHSTEP interpolation, frames match util.spline_step.
+    With CATMULL_ROM, the spline passes through every keyframe with continuous velocity,
+    and parameters that would overshoot their valid ranges are clamped.
+    """
+
+    def __init__(
+        self, keyframes: typing.Sequence[RenderFrame], interpolation: str = SMOOTHSTEP
+    ):
+        if not keyframes:
+            raise ValueError("Meaningless to interpolate empty sequence")
+        layout = FrameLayout.of(keyframes[0])
+        values = np.empty((len(keyframes), layout.size))
+        for row, frame in zip(values, keyframes):
+            layout.pack(frame, row)
+        self._compile(layout, values, interpolation)
+
+    @classmethod
+    def from_packed(
+        cls, layout: FrameLayout, values: np.ndarray, interpolation: str = SMOOTHSTEP
+    ) -> "Timeline":
+        """A timeline of keyframes already packed as the rows of values."""
+        if len(values) == 0:
+            raise ValueError("Meaningless to interpolate empty sequence")
+        timeline = cls.__new__(cls)
+        timeline._compile(layout, np.array(values, dtype=np.float64), interpolation)
+        return timeline
+
+    def _compile(self, layout: FrameLayout, values: np.ndarray, interpolation: str):
+        if interpolation not in INTERPOLATIONS:
+            raise ValueError(f"Unknown interpolation {interpolation!r}")
+        self.interpolation = interpolation
+        self.layout = layout
+        self.values = values
+        self.times = np.cumsum(values[:, layout.time], dtype=np.float64)
+        if interpolation == CATMULL_ROM and len(values) > 1:
+            self._compile_catmull_rom()
+
+    def _compile_catmull_rom(self):
+        # Phantom control points beyond each end, reflected through the end keyframes
+        times = np.concatenate(
+            [
+                [2 * self.times[0] - self.times[1]],
+                self.times,
+                [2 * self.times[-1] - self.times[-2]],
+            ]
+        )
+        values = np.concatenate(
+            [
+                [2 * self.values[0] - self.values[1]],
+                self.values,
+                [2 * self.values[-1] - self.values[-2]],
+            ]
+        )
+        n_segments = len(self.times) - 1
+        # Segment i runs from keyframe i to i + 1, controlled by keyframes i - 1 to i + 2
+        controls = np.arange(n_segments)[:, None] + np.arange(4)
+        self.segment_times = times[controls]
+        self.segment_values = values[controls]
+        # Coincident keyframes would divide by zero; such segments fall back to smoothstep
+        self.segment_smooth = np.all(np.diff(self.segment_times, axis=1) > 0, axis=1)
+
+    @property
+    def duration(self) -> float:
+        return float(self.times[-1])
+
+    def segment(self, t: float) -> int:
+        """Index of the keyframe at the start of the segment containing t, by binary search."""
+        return int(np.clip(np.searchsorted(self.times, t) - 1, 0, max(len(self.times) - 2, 0)))
+
+    def evaluate(self, times: typing.Union[float, typing.Sequence[float]]) -> np.ndarray:
+        """Packed, unnormalized frames at every time, shaped (len(times), layout.size)."""
+        times = np.atleast_1d(np.asarray(times, dtype=np.float64))
+        out = np.empty((len(times), self.layout.size))
+        if len(self.times) == 1:
+            out[:] = self.values[0]
+            return out
+        segments = np.clip(np.searchsorted(self.times, times) - 1, 0, len(self.times) - 2)
+        start = self.times[segments]
+        end = self.times[segments + 1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            frac = np.clip((times - start) / (end - start), 0, 1)
+        smooth = 3 * frac * frac - 2 * frac * frac * frac
+        a = self.values[segments]
+        b = self.values[segments + 1]
+        out[:] = a + (b - a) * smooth[:, None]
+        if self.interpolation == CATMULL_ROM:
+            spline = self.segment_smooth[segments]
+            if np.any(spline):
+                weights = catmull_rom_weights(
+                    times[spline], self.segment_times[segments[spline]]
+                )
+                out[spline] = np.einsum(
+                    "nk,nkd->nd", weights, self.segment_values[segments[spline]]
+                )
+                self._clamp(out)
+        # Symmetry is discrete, so it is held from the keyframe starting each segment
+        held = [self.layout.symmetry, self.layout.mirror]
+        out[:, held] = a[:, held]
+        out[times <= self.times[0]] = self.values[0]
+        out[times >= self.times[-1]] = self.values[-1]
+        return out
+
+    def _clamp(self, packed: np.ndarray):
+        layout = self.layout
+        rows = layout.transform_rows(packed)
+        rows[..., layout.probability] = np.maximum(rows[..., layout.probability], 0)
+        packed[..., layout.transforms] = rows.reshape(packed.shape[:-1] + (-1,))
+        packed[..., layout.palette] = np.clip(packed[..., layout.palette], 0, 255)
+        packed[..., layout.brightness] = np.maximum(packed[..., layout.brightness], 0)
+        packed[..., layout.gamma] = np.maximum(packed[..., layout.gamma], 1e-3)
+        packed[..., layout.vibrancy] = np.maximum(packed[..., layout.vibrancy], 0)
+
+    def frames(
+        self, times: typing.Sequence[float], normalize: bool = True
+    ) -> list[RenderFrame]:
+        """Frames at every time, none of which aliases a keyframe."""
+        packed = self.evaluate(times)
+        if normalize:
+            self.layout.normalize(packed)
+        return [self.layout.unpack(row) for row in packed]
+
+    def frame_at(self, t: float, normalize: bool = True) -> RenderFrame:
+        return self.frames([t], normalize)[0]
@@ -1,3 +1,4 @@
+import bisect
 import typing
 
 
@@ -34,14 +35,7 @@ def spline_step(
         return pairs[0][0]
     if t >= pairs[-1][1]:
         return pairs[-1][0]
-    times = [0.0] * len(pairs)
-    time = 0
-    t1 = len(pairs) - 1
-    for i, (_, dt) in enumerate(pairs):
-        time = dt
-        times[i] = time
-        if time >= t and i - 1 < t1:
-            t1 = i - 1
+    t1 = bisect.bisect_left(pairs, t, key=lambda pair: pair[1]) - 1
     if t1 < 0 or t1 >= len(pairs) - 1:  # Before sequence starts
         raise ValueError("This should not be possible")
     if t1 == 0 or t1 == len(pairs) - 2 or True: # TODO Debug: Gamma weirdness?
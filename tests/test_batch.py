@@ -0,0 +1,83 @@
+import json
+from os import path
+import tempfile
+
+import numpy as np
+
+from sulfurvision import batch, frames, pysulfur, types, variations
+from sulfurvision.project import Project
+
+
+def sierpinski_frame(time, offset):
+    transforms = [
+        pysulfur.Transform(
+            variations.Variation.as_weights({variations.variation_linear.name: 1}),
+            variations.Variation.as_params({}),
+            np.array([0.5, 0, dx, 0, 0.5, dy]),
+            1,
+            i,
+        )
+        for i, (dx, dy) in enumerate([(0, 0), (0.5, 0), (offset, 0.5)])
+    ]
+    palette = [
+        np.array([255, 0, 0, 1.0]),
+        np.array([0, 255, 0, 1.0]),
+        np.array([0, 0, 255, 1.0]),
+    ]
+    return frames.RenderFrame(transforms, palette, types.IdentityAffine, time)
+
+
+def sample_project():
+    return Project(
+        [sierpinski_frame(0, 0), sierpinski_frame(1, 0.5)],
+        3,
+        3,
+        width=32,
+        height=24,
+        seeds=64,
+        iters=50,
+        skip=5,
+        rate=4,
+    )
+
+
+def test_schedule():
+    project = sample_project()
+    assert batch.schedule(project, time=0.3) == [(-1, 0.3)]
+    assert [i for i, _ in batch.schedule(project)] == [0, 1, 2, 3]
+    assert batch.schedule(project, start=0.4, end=0.75) == [(2, 0.5), (3, 0.75)]
+
+
+def test_project_roundtrip():
+    project = sample_project()
+    copy = Project.read_json(project.dump_json())
+    assert copy.duration == project.duration
+    assert len(copy.frames) == 2
+    frame = copy.frame_at(0.5)
+    assert frame is not copy.frames[0] and frame is not copy.frames[1]
+
+
+def test_render_cli():
+    with tempfile.TemporaryDirectory() as tmp:
+        project_path = path.join(tmp, "project.json")
+        with open(project_path, "w") as file:
+            file.write(sample_project().dump_json())
+        out_dir = path.join(tmp, "out")
+        assert batch.main([project_path, "-o", out_dir, "--start", "0.5", "-q"]) == 0
+        assert path.exists(path.join(out_dir, "frame_000002.png"))
+        assert path.exists(path.join(out_dir, "frame_000003.png"))
+        assert not path.exists(path.join(out_dir, "frame_000001.png"))
+        with open(path.join(out_dir, "summary.json")) as file:
+            summary = json.load(file)
+        assert summary["frames"] == 2
+        assert summary["settings"]["width"] == 32
+
+
+def main():
+    test_schedule()
+    test_project_roundtrip()
+    test_render_cli()
+
+
+if __name__ == "__main__":
+    main()
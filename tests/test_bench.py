@@ -0,0 +1,42 @@
+import json
+from os import path
+import tempfile
+
+from sulfurvision import bench
+
+
+def test_quick_run_and_compare():
+    with tempfile.TemporaryDirectory() as dpath:
+        baseline_path = path.join(dpath, "baseline.json")
+        assert bench.main(["--quick", "-q", "-o", baseline_path]) == 0
+        with open(baseline_path, "r") as file:
+            baseline = json.load(file)
+        metrics = baseline["metrics"]
+        assert metrics["chaos_game.heavy.p256.samples_per_second"]["value"] > 0
+        assert metrics["frames.frames_per_second"]["value"] > 0
+        assert not metrics["build.cold.seconds"]["higher_is_better"]
+
+        # Ten times the throughput and a tenth of the time can only have been a regression
+        for metric in metrics.values():
+            metric["value"] *= 10 if metric["higher_is_better"] else 0.1
+        with open(baseline_path, "w") as file:
+            json.dump(baseline, file)
+        argv = ["--quick", "-q", "--only", "postprocess", "--baseline", baseline_path]
+        assert bench.main(argv) == 1
+
+
+def test_comparison_direction():
+    faster = bench.Comparison("x", 100, 120, True)
+    slower = bench.Comparison("y", 1.0, 1.5, False)
+    assert abs(faster.change - 0.2) < 1e-9
+    assert abs(slower.change + 1 / 3) < 1e-9
+    assert bench.regressions([faster, slower], 0.1) == [slower]
+
+
+def main():
+    test_quick_run_and_compare()
+    test_comparison_direction()
+
+
+if __name__ == "__main__":
+    main()
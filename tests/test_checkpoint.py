@@ -0,0 +1,93 @@
+from os import path
+import tempfile
+
+import numpy as np
+
+from sulfurvision import batch, checkpoint, prng
+from sulfurvision.batch import RenderSettings
+
+from tests.test_batch import sample_project
+
+
+def test_resume_and_merge():
+    project = sample_project()
+    with tempfile.TemporaryDirectory() as tmp:
+        first = path.join(tmp, "first")
+        # Interrupted after 20 of 60 iterations...
+        batch.render_checkpointed(
+            project, RenderSettings(32, 24, 2, 64, 20, 5), 0.5, first, verbose=False
+        )
+        partial = checkpoint.load(first)
+        assert partial.meta["iters_done"] == 20
+        assert partial.histogram.shape == (48, 64, 4)
+        partial_total = int(partial.histogram[..., 3].sum())
+        assert partial_total == 64 * 15  # Every sample of the gasket lands on canvas
+        # ...then resumed to completion
+        img = batch.render_checkpointed(
+            project, RenderSettings(32, 24, 2, 64, 60, 5), 0.5, first, 20, True, False
+        )
+        assert img.size == (32, 24)
+        resumed = checkpoint.load(first)
+        assert resumed.meta["iters_done"] == 60
+        assert int(resumed.histogram[..., 3].sum()) == 64 * 55
+
+        second = path.join(tmp, "second")
+        batch.render_checkpointed(
+            project, RenderSettings(32, 24, 2, 64, 60, 5), 0.5, second, verbose=False
+        )
+        merged = checkpoint.merge([first, second], path.join(tmp, "merged"))
+        expected = (
+            np.asarray(checkpoint.load(first).histogram, np.uint64)
+            + checkpoint.load(second).histogram
+        )
+        assert np.array_equal(merged.histogram, expected)
+        assert merged.particles is None
+        assert merged.samples == 2 * 60 * 64
+        assert checkpoint.tonemap(merged).size == (32, 24)
+
+
+def test_merge_saturates():
+    meta = {
+        "width": 1,
+        "height": 1,
+        "supersample": 1,
+        "n_particles": 1,
+        "iters_done": 1,
+        "iters": 1,
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        big = np.full(4, 3 << 30, np.uint32)
+        checkpoint.save(path.join(tmp, "a"), big, None, meta)
+        checkpoint.save(path.join(tmp, "b"), big, None, meta)
+        merged = checkpoint.merge(
+            [path.join(tmp, "a"), path.join(tmp, "b")], path.join(tmp, "c")
+        )
+        assert (merged.histogram == np.iinfo(np.uint32).max).all()
+
+
+def test_philox_seeds():
+    project = sample_project()
+    with tempfile.TemporaryDirectory() as tmp:
+        histograms = {}
+        for name, seed in (("a", 1), ("b", 2), ("c", 1)):
+            settings = RenderSettings(32, 24, 1, 64, 30, 5, generator=prng.PHILOX, seed=seed)
+            batch.render_checkpointed(project, settings, 0.5, path.join(tmp, name), verbose=False)
+            ckpt = checkpoint.load(path.join(tmp, name))
+            assert ckpt.meta["seed"] == seed and ckpt.meta["generator"] == prng.PHILOX
+            histograms[name] = ckpt.histogram
+        assert np.array_equal(histograms["a"], histograms["c"])
+        assert not np.array_equal(histograms["a"], histograms["b"])
+        merged = checkpoint.merge(
+            [path.join(tmp, "a"), path.join(tmp, "b")], path.join(tmp, "merged")
+        )
+        assert "seed" not in merged.meta
+
+
+def main():
+    test_resume_and_merge()
+    test_merge_saturates()
+    test_philox_seeds()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import json
+from os import path
+import tempfile
+import threading
+import types
+
+import pyopencl as cl
+import pytest
+
+from sulfurvision.cl import bootstrap
+
+
+def fake_device(platform: types.SimpleNamespace, name: str, kind=cl.device_type.CPU):
+    return types.SimpleNamespace(platform=platform, name=name, type=kind)
+
+
+POCL = types.SimpleNamespace(name="Portable Computing Language")
+VENDOR = types.SimpleNamespace(name="Vendor OpenCL")
+DEVICES = [
+    fake_device(POCL, "pthread-cpu"),
+    fake_device(VENDOR, "vendor-cpu"),
+    fake_device(VENDOR, "vendor-gpu", cl.device_type.GPU),
+]
+SPEEDS = {"pthread-cpu": 3.0, "vendor-cpu": 5.0, "vendor-gpu": 1.0}
+
+
+@pytest.fixture
+def environment(monkeypatch):
+    monkeypatch.delenv(bootstrap.DEVICE_ENV, raising=False)
+    monkeypatch.delenv("PYOPENCL_CTX", raising=False)
+    benchmarked = []
+
+    def benchmark(device):
+        benchmarked.append(device.name)
+        return SPEEDS[device.name]
+
+    monkeypatch.setattr(bootstrap, "benchmark_device", benchmark)
+    return benchmarked
+
+
+def test_find_device():
+    assert bootstrap.find_device(DEVICES, "0") is DEVICES[0]
+    assert bootstrap.find_device(DEVICES, "1:1") is DEVICES[2]
+    assert bootstrap.find_device(DEVICES, "GPU") is DEVICES[2]
+    assert bootstrap.find_device(DEVICES, "vendor opencl") is DEVICES[1]
+    with pytest.raises(ValueError):
+        bootstrap.find_device(DEVICES, "nothing")
+
+
+def test_fastest_device_cached(environment):
+    with tempfile.TemporaryDirectory() as tmp:
+        fpath = path.join(tmp, "cache", "devices.json")
+        assert bootstrap.select_device(DEVICES, fpath) is DEVICES[1]
+        assert sorted(environment) == sorted(SPEEDS)
+        with open(fpath) as file:
+            assert len(json.load(file)) == 1
+
+        environment.clear()
+        assert bootstrap.select_device(DEVICES, fpath) is DEVICES[1]
+        assert not environment
+        # A device going away invalidates the cache
+        assert bootstrap.select_device(DEVICES[::2], fpath) is DEVICES[0]
+        assert sorted(environment) == ["pthread-cpu", "vendor-gpu"]
+        environment.clear()
+        bootstrap.select_device(DEVICES[::2], fpath, refresh=True)
+        assert len(environment) == 2
+
+
+def test_failed_benchmarks(environment, monkeypatch):
+    def broken(device):
+        raise cl.Error("no compiler")
+
+    monkeypatch.setattr(bootstrap, "benchmark_device", broken)
+    with tempfile.TemporaryDirectory() as tmp:
+        # With nothing measured, GPUs come first
+        assert bootstrap.select_device(DEVICES, path.join(tmp, "devices.json")) is DEVICES[2]
+
+
+def test_override(environment, monkeypatch):
+    monkeypatch.setenv(bootstrap.DEVICE_ENV, "pthread")
+    with tempfile.TemporaryDirectory() as tmp:
+        fpath = path.join(tmp, "devices.json")
+        assert bootstrap.select_device(DEVICES, fpath) is DEVICES[0]
+        assert not environment and not path.exists(fpath)
+    monkeypatch.setenv(bootstrap.DEVICE_ENV, "missing")
+    with pytest.raises(ValueError):
+        bootstrap.select_device(DEVICES)
+
+
+def test_benchmark_device():
+    device = bootstrap.all_devices()[0]
+    assert bootstrap.benchmark_device(device) > 0
+
+
+def test_first_renderer_benchmarks_devices(monkeypatch):
+    from sulfurvision.cl import render
+
+    monkeypatch.delenv(bootstrap.DEVICE_ENV, raising=False)
+    monkeypatch.delenv("PYOPENCL_CTX", raising=False)
+    device = bootstrap.all_devices()[0]
+    # Two real devices and no cache, as the first Renderer on a machine with two would see
+    monkeypatch.setattr(bootstrap, "all_devices", lambda: [device, device])
+    for name in ("_ctx", "_device", "_queue", "_readback_queue", "_program", "_kernels"):
+        monkeypatch.setattr(render.Renderer, name, None)
+    with tempfile.TemporaryDirectory() as tmp:
+        monkeypatch.setenv(bootstrap.CACHE_ENV, tmp)
+        # The benchmarks build renderers while the shared ones are being set up
+        worker = threading.Thread(target=render.Renderer._init_cl, daemon=True)
+        worker.start()
+        worker.join(timeout=120)
+        assert not worker.is_alive(), "Setting up the first Renderer deadlocked"
+        assert render.Renderer._device is not None
+        assert path.exists(path.join(tmp, bootstrap.CACHE_FILE))
+
+
+def main():
+    test_find_device()
+    test_benchmark_device()
+
+
+if __name__ == "__main__":
+    main()
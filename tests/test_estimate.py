@@ -0,0 +1,87 @@
+import math
+from os import path
+import tempfile
+
+from sulfurvision import batch, estimate
+from sulfurvision.cl import bootstrap
+from tests.test_batch import sample_project, sierpinski_frame
+
+LIMITS = bootstrap.DeviceLimits("test", 1 << 30, 1 << 28, 1 << 16, 8)
+
+
+def test_footprint():
+    needs = estimate.footprint(100, 50, 2, 1000, 3, pixel_buffers=2)
+    assert needs.histogram == 100 * 50 * 16 * 4
+    assert needs.pixels == 2 * 100 * 50 * 16
+    assert needs.particles == 1000 * estimate.PARTICLE_BYTES
+    assert needs.largest == needs.histogram
+    assert needs.device > needs.histogram + needs.pixels + needs.particles
+
+
+def test_particle_bytes_match_device():
+    from sulfurvision.cl import krnl, render
+
+    render.Renderer._init_cl()
+    assert krnl.cl_types[krnl.particle_type_key].itemsize == estimate.PARTICLE_BYTES
+
+
+def test_recommendations():
+    frame = sierpinski_frame(0, 0.25)
+    frame.normalize()
+    small = estimate.estimate(
+        frame, 640, 480, 2, 10000, 100, calibrate_device=False, limits=LIMITS
+    )
+    assert small.fits and not small.recommendations and small.error is None
+    assert small.max_supersample == 2
+    assert math.isnan(small.seconds)
+
+    # At 4x supersampling a 4096x4096 histogram takes 4 GiB, but allocations hold 256 MiB
+    big = estimate.estimate(
+        frame, 4096, 4096, 4, 10000, 100, calibrate_device=False, limits=LIMITS
+    )
+    assert not big.fits and big.max_supersample == 1
+    assert big.error.startswith("Exceeds device memory: its 4096 MiB largest buffer")
+    assert big.recommendations == ["Lower supersampling to 1"]
+
+    crowded = estimate.estimate(
+        frame, 64, 64, 1, 1 << 26, 100, calibrate_device=False, limits=LIMITS
+    )
+    assert not crowded.fits and crowded.max_supersample == 0
+    assert crowded.error.startswith("Exceeds device memory")
+    most = int(crowded.recommendations[-1].split()[-2])
+    assert estimate.fits(LIMITS, estimate.footprint(64, 64, 1, most, 3))
+
+
+def test_calibrated_times():
+    frame = sierpinski_frame(0, 0.25)
+    frame.normalize()
+    calibration = estimate.calibrate(frame, 4096)
+    assert calibration.samples_per_second > 0 and calibration.seconds_per_cell > 0
+    prediction = estimate.estimate(frame, 64, 64, 1, 4096, 200, 3, calibration=calibration)
+    chaos = 4096 * 200 / calibration.samples_per_second
+    assert prediction.seconds_per_frame > chaos
+    assert prediction.seconds == 3 * prediction.seconds_per_frame
+
+
+def test_batch_estimate():
+    project = sample_project()
+    with tempfile.TemporaryDirectory() as tmp:
+        project_path = path.join(tmp, "project.json")
+        with open(project_path, "w") as file:
+            file.write(project.dump_json())
+        out_dir = path.join(tmp, "out")
+        assert batch.main([project_path, "-o", out_dir, "--estimate", "-q"]) == 0
+        # Nothing is rendered
+        assert not path.exists(out_dir)
+
+
+def main():
+    test_footprint()
+    test_particle_bytes_match_device()
+    test_recommendations()
+    test_calibrated_times()
+    test_batch_estimate()
+
+
+if __name__ == "__main__":
+    main()
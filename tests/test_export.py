@@ -0,0 +1,48 @@
+import numpy as np
+
+from sulfurvision import export, sinks
+from tests.test_batch import sample_project
+
+
+class ListSink(sinks.FrameSink):
+    def __init__(self):
+        self.frames = []
+
+    def write_encoded(self, index, data):
+        self.frames.append((index, np.asarray(data)))
+
+
+def test_pipelined_matches_serial():
+    from sulfurvision.cl import render
+
+    project = sample_project()
+    times = list(enumerate(project.frame_times()))
+    renderer = render.Renderer(
+        project.width, project.height, 2, project.seeds, project.n_colors, project.n_transforms
+    )
+
+    np.random.seed(7)
+    serial = [
+        np.asarray(renderer.render_frame(project.frame_at(t), project.iters, project.skip))
+        for _, t in times
+    ]
+
+    np.random.seed(7)
+    sink = ListSink()
+    stats = export.AnimationExporter(renderer, sink, encoders=2).export(
+        ((i, t, project.frame_at(t)) for i, t in times), project.iters, project.skip
+    )
+    assert [index for index, _ in sink.frames] == [i for i, _ in times]
+    for expected, (_, actual) in zip(serial, sink.frames):
+        assert np.array_equal(expected, actual)
+    assert len(stats.timings) == len(times)
+    assert 0 < stats.device_seconds <= stats.wall_seconds
+    assert 0 < stats.device_utilisation <= 1
+
+
+def main():
+    test_pipelined_matches_serial()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import os
+from os import path
+import subprocess
+import sys
+import tempfile
+
+from sulfurvision import farm
+from sulfurvision.batch import RenderSettings
+
+from tests.test_batch import sample_project
+
+
+def make_farm(root, lease_seconds=farm.DEFAULT_LEASE_SECONDS):
+    settings = RenderSettings(32, 24, 1, 64, 50, 5, seed=7)
+    config = farm.FarmConfig(settings, 8, "png", lease_seconds)
+    return farm.Farm.create(root, sample_project(), config)
+
+
+def test_claims_and_stale_requeue():
+    with tempfile.TemporaryDirectory() as tmp:
+        shared = make_farm(tmp, lease_seconds=30)
+        assert shared.counts() == {farm.TODO: 8, farm.CLAIMED: 0, farm.DONE: 0}
+        assert farm.Farm(tmp).config.settings.seed == 7
+        first = shared.claim("a")
+        second = shared.claim("b")
+        assert (first, second) == (0, 1)
+        assert shared.requeue_stale() == []
+        # Worker "a" dies and stops sending heartbeats
+        os.utime(path.join(tmp, farm.CLAIMED, "000000"), (0, 0))
+        assert shared.requeue_stale() == [0]
+        assert shared.claim("c") == 0
+        shared.complete(1)
+        assert shared.counts() == {farm.TODO: 6, farm.CLAIMED: 1, farm.DONE: 1}
+
+
+def test_claim_requeued_before_written():
+    with tempfile.TemporaryDirectory() as tmp:
+        shared = make_farm(tmp)
+        rename = os.rename
+
+        def requeued_at_once(src, dst):
+            rename(src, dst)
+            if path.basename(dst) == "000000" and path.dirname(dst).endswith(farm.CLAIMED):
+                # A stale sweep moves the claim back before its worker writes to it
+                rename(dst, src)
+
+        farm.os.rename = requeued_at_once
+        try:
+            assert shared.claim("a") == 1
+        finally:
+            farm.os.rename = rename
+        assert not path.exists(path.join(tmp, farm.CLAIMED, "000000"))
+        assert path.exists(path.join(tmp, farm.TODO, "000000"))
+
+
+def test_local_workers():
+    with tempfile.TemporaryDirectory() as tmp:
+        make_farm(tmp)
+        workers = [
+            subprocess.Popen(
+                [sys.executable, "-m", "sulfurvision.farm", "work", tmp, "-q"],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            for _ in range(2)
+        ]
+        for worker in workers:
+            assert worker.wait(timeout=300) == 0
+        shared = farm.Farm(tmp)
+        assert shared.counts() == {farm.TODO: 0, farm.CLAIMED: 0, farm.DONE: 8}
+        assert sorted(os.listdir(path.join(tmp, farm.FRAMES))) == [
+            f"frame_{i:06}.png" for i in range(8)
+        ]
+
+
+def main():
+    test_claims_and_stale_requeue()
+    test_claim_requeued_before_written()
+    test_local_workers()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import subprocess
+import sys
+
+import numpy as np
+
+from sulfurvision import frames, pysulfur, types, variations
+
+
+def sample_frame():
+    transform = pysulfur.Transform(
+        variations.Variation.as_weights({variations.variation_julia.name: 1}),
+        variations.Variation.as_params({}),
+        np.array([0.5, 0, 0.1, 0, 0.5, -0.2]),
+        1,
+        0.5,
+    )
+    return frames.RenderFrame(
+        [transform, transform],
+        [np.array([255, 0, 0, 1.0]), np.array([0, 0, 255, 1.0])],
+        types.IdentityAffine,
+        1.5,
+    )
+
+
+def test_no_heavy_imports():
+    code = "import sys, sulfurvision.frames; print('pyopencl' in sys.modules, 'PIL' in sys.modules)"
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert out.split() == ["False", "False"], out
+
+
+def test_json_roundtrip():
+    frame = sample_frame()
+    copy = frames.RenderFrame.read_json(frame.dump_json())
+    assert len(copy.transforms) == 2
+    assert np.allclose(copy.transforms[0].affine, frame.transforms[0].affine)
+    assert np.allclose(copy.palette, frame.palette)
+    assert copy.time == frame.time
+
+
+def test_packed_roundtrip():
+    frame = sample_frame()
+    frame.transforms[1] = frame.transforms[1] * 1.0
+    frame.transforms[1].params[:] = np.arange(len(frame.transforms[1].params))
+    packed = frame.pack()
+    layout = frames.FrameLayout.of(frame)
+    assert packed.shape == (layout.size,)
+    copy = layout.unpack(packed)
+    assert np.array_equal(copy.pack(), packed)
+    assert np.array_equal(frames.RenderFrame.read_json(copy.dump_json()).pack(), packed)
+
+
+def test_symmetry_fields():
+    frame = sample_frame()
+    d = frame.to_dict()
+    del d["symmetry"], d["mirror"]
+    old = frames.RenderFrame.from_dict(d)
+    assert (old.symmetry, old.mirror) == (1, False)
+    assert len(old.cameras()) == 1 and np.allclose(old.cameras()[0], frame.camera)
+
+    frame.symmetry, frame.mirror = 5, True
+    copy = frames.RenderFrame.read_json(frame.dump_json())
+    assert (copy.symmetry, copy.mirror) == (5, True)
+    copy = frames.FrameLayout.of(frame).unpack(frame.pack())
+    assert (copy.symmetry, copy.mirror) == (5, True)
+    assert len(copy.cameras()) == 10
+    # Arithmetic keeps the symmetry rather than scaling it
+    assert (frame * 0.5 + frame * 0.5).symmetry == 5
+
+
+def test_packed_mutate():
+    frame = sample_frame()
+    frame.transforms[1] = frame.transforms[1] * 1.0
+    frame.normalize()
+    layout = frames.FrameLayout.of(frame)
+    packed = frame.pack()
+    assert np.array_equal(layout.mutate(packed, 0, np.random.default_rng(1)), packed)
+    mutated = layout.mutate(packed, 0.5, np.random.default_rng(1))
+    rows = layout.transform_rows(mutated)
+    # Only variations already in use move
+    active = layout.transform_rows(packed)[:, layout.weights] != 0
+    assert np.all(rows[:, layout.weights][~active] == 0)
+    assert np.isclose(rows[:, layout.probability].sum(), 1)
+    randomized = layout.transform_rows(
+        layout.mutate(packed, 0.5, np.random.default_rng(2), max_variations=3)
+    )
+    n_active = np.count_nonzero(randomized[:, layout.weights], axis=1)
+    assert np.all((n_active >= 1) & (n_active <= 3))
+    assert np.allclose(layout.lerp(packed, mutated, 0.25), packed + (mutated - packed) / 4)
+
+
+def test_pack_transforms_from():
+    from sulfurvision.cl import krnl, render
+
+    frame = sample_frame()
+    frame.normalize()
+    render.Renderer(8, 8, 1, 8, len(frame.palette), len(frame.transforms))
+    layout = frames.FrameLayout.of(frame)
+    expected = krnl.pack_transforms(frame.transforms)
+    for actual, field in zip(krnl.pack_transforms_from(layout, frame.pack()), expected):
+        assert np.array_equal(actual, field)
+    stacked = krnl.pack_transforms_from(layout, np.stack([frame.pack(), frame.pack()]))
+    concatenated = krnl.PackedTransforms.concatenate([expected, expected])
+    for actual, field in zip(stacked, concatenated):
+        assert np.array_equal(actual, field)
+
+
+def test_sparse_transforms():
+    from sulfurvision.cl import krnl, render
+
+    frame = sample_frame()
+    render.Renderer(8, 8, 1, 8, len(frame.palette), len(frame.transforms))
+    pdj = variations.Variation.variations_map[variations.variation_pdj.name]
+    weights = variations.Variation.as_weights(
+        {variations.variation_linear.name: 1, variations.variation_pdj.name: 2}
+    )
+    params = variations.Variation.as_params({variations.variation_pdj.name: [1, 2, 3, 4]})
+    frame.transforms[1] = pysulfur.Transform(weights, params, types.IdentityAffine, 1, 1)
+    packed = krnl.pack_transforms(frame.transforms)
+    assert list(packed.transforms["entries"]) == [0, 1]
+    assert list(packed.transforms["n_entries"]) == [1, 2]
+    assert list(packed.entries["id"]) == [
+        variations.Variation.variations_map[variations.variation_julia.name],
+        variations.Variation.variations_map[variations.variation_linear.name],
+        pdj,
+    ]
+    assert np.allclose(packed.entries["weight"], [1, 1 / 3, 2 / 3])
+    entry = packed.entries[2]
+    assert list(packed.params[entry["params"] : entry["params"] + 4]) == [1, 2, 3, 4]
+    doubled = krnl.PackedTransforms.concatenate([packed, packed])
+    assert list(doubled.transforms["entries"]) == [0, 1, 3, 4]
+    assert doubled.entries["params"][5] == entry["params"] + len(packed.params)
+
+
+def main():
+    test_no_heavy_imports()
+    test_json_roundtrip()
+    test_packed_roundtrip()
+    test_symmetry_fields()
+    test_packed_mutate()
+    test_pack_transforms_from()
+    test_sparse_transforms()
+
+
+if __name__ == "__main__":
+    main()
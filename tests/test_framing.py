@@ -0,0 +1,68 @@
+import json
+from os import path
+import tempfile
+
+import numpy as np
+
+from sulfurvision import batch, framing, pysulfur
+from tests.test_batch import sample_project, sierpinski_frame
+
+
+def test_fit_camera():
+    rng = np.random.default_rng(0)
+    points = rng.random((10000, 2)) * [4, 2] + [-1, 3]
+    # Strays far out are ignored, and non-finite ones dropped
+    points[:20] = 1e6
+    points[20] = np.nan
+    camera = framing.fit_camera(points, aspect=2, coverage=0.99, margin=0)
+    mapped = np.stack([pysulfur.affine_transform(p, camera) for p in points[21:]])
+    inside = np.all((mapped >= 0) & (mapped < 1), axis=1)
+    assert 0.97 < inside.mean() <= 0.99
+    # A 4 by 2 box at aspect 2 needs no padding
+    assert np.isclose(camera[0] * 2, camera[4], rtol=0.05)
+
+    # Widened to fit a square
+    square = framing.fit_camera(points, aspect=1, margin=0)
+    assert np.isclose(square[0], square[4])
+
+
+def test_auto_camera():
+    frame = sierpinski_frame(0, 0.5)
+    frame.camera = np.array([3.0, 0, 1, 0, 3, 1])
+    before = frame.camera.copy()
+    for device in (True, False):
+        camera = framing.auto_camera(frame, device=device)
+        # The gasket spans the unit square, which the camera maps to about itself
+        assert np.allclose(camera, [1, 0, 0, 0, 1, 0], atol=0.1), camera
+    assert np.array_equal(frame.camera, before)
+
+    frame.symmetry = 2
+    camera = framing.auto_camera(frame)
+    # The half-turn doubles the extent about the origin
+    assert np.allclose(camera, [0.5, 0, 0.5, 0, 0.5, 0.5], atol=0.05), camera
+
+
+def test_auto_camera_cli():
+    project = sample_project()
+    for frame in project.frames:
+        frame.camera = np.array([1.0, 0, 5, 0, 1, 0])
+    with tempfile.TemporaryDirectory() as tmp:
+        project_path = path.join(tmp, "project.json")
+        with open(project_path, "w") as file:
+            file.write(project.dump_json())
+        out_dir = path.join(tmp, "out")
+        assert batch.main([project_path, "-o", out_dir, "--auto-camera", "--stats", "-q"]) == 0
+        with open(path.join(out_dir, "summary.json")) as file:
+            summary = json.load(file)
+        assert summary["wasteful_frames"] == []
+        assert summary["stats"]["efficiency"] > 0.9
+
+
+def main():
+    test_fit_camera()
+    test_auto_camera()
+    test_auto_camera_cli()
+
+
+if __name__ == "__main__":
+    main()
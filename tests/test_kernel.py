@@ -6,12 +6,13 @@ from pyopencl import cltypes
 
 from sulfurvision import prng, pysulfur, variations
 from sulfurvision.cl import bootstrap, krnl
+from sulfurvision.cl.render import STATS_TRANSFORMS
 
 def rand_seed(base):
     base, x = prng.rand_uniform(base)
     base, y = prng.rand_uniform(base)
     base, color = prng.rand_uniform(base)
-    return (cltypes.make_float2(x, y), base, color)
+    return (cltypes.make_float2(x, y), base, color, 0)
 
 def test_render(w, h, supersample, q, kernels, transforms, name, palette, histogram, array, n_seeds = 1000, gamma = 1, vibrancy = 0, brightness = 1, mode = 1):
     dev_transforms = krnl.transform_to_cl(transforms, q)
@@ -21,18 +22,31 @@ def test_render(w, h, supersample, q, kernels, transforms, name, palette, histog
     histogram.fill(np.float32(0))
     array.fill(np.float32(0))
     flame_kernel, pool_kernel, rowmax_kernel, tone_kernel = kernels
+    n_transforms = len(transforms)
     flame_kernel(q, (n_seeds,), None,
         particles.data,
         histogram.data,
-        dev_transforms.data,
+        *dev_transforms.args,
         palette.data,
         camera.data,
         np.uint32(1000),
         np.uint32(10),
         img_size.data,
+        np.uint32(n_transforms),
         np.uint32(3),
-        np.uint32(3),
-        np.uint32(supersample)
+        np.uint32(supersample),
+        np.uint32(1),
+        np.uint32(1),
+        np.uint32(1),
+        np.uint32(0),
+        cltypes.make_uint2(0, 0),
+        np.uint32(0),
+        clarray.zeros(q, 2 * (STATS_TRANSFORMS + n_transforms), np.uint32).data,
+        cl.LocalMemory(4 * (STATS_TRANSFORMS + n_transforms)),
+        np.uint32(0),
+        clarray.zeros(q, 1, np.float32).data,
+        clarray.zeros(q, 1, np.uint32).data,
+        np.uint32(0)
         ).wait()
     if supersample > 1:
         pool_kernel(q, (n_seeds,), None,
@@ -0,0 +1,60 @@
+import numpy as np
+
+from tests.test_batch import sample_project, sierpinski_frame
+
+
+def test_shutter_frames():
+    project = sample_project()
+    assert len(project.shutter_frames(0.5, 0, 4)) == 1
+    frames = project.shutter_frames(0.5, 0.25, 4)
+    assert len(frames) == 4
+    # Centred on t, so the middle two straddle the unblurred frame symmetrically
+    offsets = [frame.transforms[2].affine[2] for frame in frames]
+    assert offsets == sorted(offsets)
+
+
+def test_subframes_accumulate():
+    from sulfurvision.cl import render
+
+    frame = sierpinski_frame(0, 0.25)
+    frame.normalize()
+    renderer = render.Renderer(64, 32, 1, 256, len(frame.palette), len(frame.transforms))
+    left = np.array([0.5, 0, 0, 0, 1, 0])
+    right = np.array([0.5, 0, 0.5, 0, 1, 0])
+
+    def halves(subframes):
+        renderer.reset()
+        renderer.randomize_particles()
+        renderer.chaos_game(
+            renderer.histogram_camera(left),
+            frame.transforms,
+            frame.palette,
+            200,
+            10,
+            subframes,
+            blur_batch=4,
+        )
+        alpha = renderer.histogram.get().reshape(32, 64, 4)[:, :, 3]
+        return int(alpha[:, :32].sum()), int(alpha[:, 32:].sum())
+
+    sharp_left, sharp_right = halves(())
+    assert sharp_left > 0 and sharp_right == 0
+    blurred_left, blurred_right = halves(
+        [
+            (renderer.histogram_camera(left), frame.transforms),
+            (renderer.histogram_camera(right), frame.transforms),
+        ]
+    )
+    assert abs(blurred_left - blurred_right) < 0.1 * (blurred_left + blurred_right)
+    # Blurring costs no extra samples
+    assert abs(blurred_left + blurred_right - sharp_left) < 0.02 * sharp_left
+    assert renderer.max_subframes() >= 2
+
+
+def main():
+    test_shutter_frames()
+    test_subframes_accumulate()
+
+
+if __name__ == "__main__":
+    main()
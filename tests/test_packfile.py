@@ -0,0 +1,92 @@
+import json
+from os import path
+import tempfile
+
+import numpy as np
+
+from sulfurvision import packfile
+from sulfurvision.frames import FrameLayout
+from sulfurvision.project import Project
+from sulfurvision.timeline import CATMULL_ROM
+from tests.test_batch import sample_project
+
+
+def test_project_roundtrip():
+    project = sample_project()
+    project.interpolation = CATMULL_ROM
+    params = project.frames[1].transforms[0].params
+    params[:] = np.linspace(-1, 1, len(params))
+    with tempfile.TemporaryDirectory() as dpath:
+        fpath = path.join(dpath, "project" + packfile.EXTENSION)
+        project.save(fpath)
+        assert packfile.is_packfile(fpath)
+        copy = Project.load(fpath)
+        # Lossless, down to the JSON
+        assert json.loads(copy.dump_json()) == json.loads(project.dump_json())
+        times = [0.3, 0.7]
+        assert np.array_equal(copy.timeline.evaluate(times), project.timeline.evaluate(times))
+        del copy
+
+        json_path = path.join(dpath, "project.json")
+        project.save(json_path)
+        assert not packfile.is_packfile(json_path)
+        assert Project.load(json_path).dump_json() == project.dump_json()
+
+
+def test_lazy_keyframes():
+    project = sample_project()
+    with tempfile.TemporaryDirectory() as dpath:
+        fpath = path.join(dpath, "flames" + packfile.EXTENSION)
+        packfile.write(fpath, project.frames)
+        pack = packfile.PackFile(fpath)
+        assert len(pack) == 2 and pack.metadata == {}
+        frame = pack[1]
+        assert frame.to_dict() == project.frames[1].to_dict()
+        frame.transforms[0].affine[0] = 100
+        assert pack.values[1, 0] != 100
+        # Keyframes alone load as a project with default settings
+        assert Project.load(fpath).n_transforms == project.n_transforms
+        del pack
+
+
+def test_version_1_upgraded():
+    project = sample_project()
+    project.frames[1].symmetry = 4
+    with tempfile.TemporaryDirectory() as dpath:
+        fpath = path.join(dpath, "old" + packfile.EXTENSION)
+        # Written as version 1 did, without the symmetry fields
+        layout = FrameLayout.of(project.frames[0])
+        header = json.dumps(
+            {
+                "layout": {
+                    "n_transforms": layout.n_transforms,
+                    "n_colors": layout.n_colors,
+                    "n_weights": layout.n_weights,
+                    "n_params": layout.n_params,
+                    "color_size": layout.color_size,
+                },
+                "count": 2,
+                "metadata": {},
+            }
+        ).encode("utf-8")
+        offset = len(packfile.MAGIC) + packfile._PREAMBLE.size + len(header)
+        rows = np.stack([frame.pack()[: layout.symmetry] for frame in project.frames])
+        with open(fpath, "wb") as file:
+            file.write(packfile.MAGIC)
+            file.write(packfile._PREAMBLE.pack(1, len(header)))
+            file.write(header)
+            file.write(b"\0" * (-offset % 64))
+            file.write(rows.tobytes())
+        old = packfile.PackFile(fpath)
+        assert [frame.symmetry for frame in old] == [1, 1]
+        assert old[1].to_dict() | {"symmetry": 4} == project.frames[1].to_dict()
+
+
+def main():
+    test_project_roundtrip()
+    test_lazy_keyframes()
+    test_version_1_upgraded()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import queue
+import time
+
+import numpy as np
+from PIL import Image
+
+from sulfurvision import preview, prng
+from sulfurvision.batch import RenderSettings
+from tests.test_batch import sierpinski_frame
+
+
+def make_worker(debounce=0.05, cache=None, record_bytes=0):
+    from sulfurvision.cl import render
+
+    delivered = queue.Queue()
+    renderer = render.Renderer(1, 1, 1, 1, 1, 1)
+    worker = preview.PreviewWorker(renderer, delivered.put, debounce, cache, record_bytes)
+    return worker, delivered
+
+
+def wait_finished(delivered, generation, timeout=30):
+    previews = []
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            previews.append(delivered.get(timeout=0.1))
+        except queue.Empty:
+            continue
+        if previews[-1].generation == generation and previews[-1].finished:
+            return previews
+    raise AssertionError("Preview never finished")
+
+
+def test_progressive_preview():
+    worker, delivered = make_worker()
+    frame = sierpinski_frame(0, 0.25)
+    frame.normalize()
+    settings = RenderSettings(64, 48, 1, 2000, 3000, 10)
+    try:
+        generation = worker.request(frame, settings)
+        previews = wait_finished(delivered, generation)
+    finally:
+        worker.stop()
+    assert all(p.generation == generation for p in previews)
+    # Refined over several chunks, each covering more iterations than the last
+    assert len(previews) > 1
+    done = [p.done_iters for p in previews]
+    assert done == sorted(done) and done[-1] == 3000
+    assert all(d > settings.skip for d in done if d)
+    assert previews[-1].image.size == (64, 48)
+    assert all(np.asarray(p.image).any() for p in previews)
+
+
+def test_debounce_and_cancel():
+    worker, delivered = make_worker(debounce=0.2)
+    frame = sierpinski_frame(0, 0.25)
+    frame.normalize()
+    settings = RenderSettings(32, 32, 1, 500, 100000, 10)
+    try:
+        # Only the last of a burst of requests is rendered
+        for _ in range(5):
+            last = worker.request(frame, settings)
+        first = delivered.get(timeout=30)
+        assert first.generation == last
+        # A newer request abandons the one in flight
+        short = RenderSettings(32, 32, 1, 500, 200, 10)
+        newest = worker.request(frame, short)
+        previews = wait_finished(delivered, newest)
+        assert not any(p.generation == last and p.finished for p in previews)
+    finally:
+        worker.stop()
+
+
+def test_frame_key():
+    frame = sierpinski_frame(0, 0.25)
+    frame.normalize()
+    settings = RenderSettings(32, 32, 1, 500, 200, 10)
+    key = preview.frame_key(frame, settings)
+    # Where a frame sits in an animation does not change how it looks
+    moved = sierpinski_frame(0, 0.25)
+    moved.time = 7
+    moved.normalize()
+    assert preview.frame_key(moved, settings) == key
+    assert preview.frame_key(sierpinski_frame(0, 0.3), settings) != key
+    assert preview.frame_key(frame, RenderSettings(32, 32, 1, 500, 201, 10)) != key
+    # Another seed or generator draws other noise, so makes another preview
+    philox = RenderSettings(32, 32, 1, 500, 200, 10, generator=prng.PHILOX)
+    reseeded = RenderSettings(32, 32, 1, 500, 200, 10, generator=prng.PHILOX, seed=1)
+    assert len({key, preview.frame_key(frame, philox), preview.frame_key(frame, reseeded)}) == 3
+    frame.gamma += 0.1
+    assert preview.frame_key(frame, settings) != key
+
+
+def test_cache_evicts_least_recent():
+    image = Image.new("RGB", (10, 10))
+    cache = preview.PreviewCache(max_bytes=3 * 300)
+    for key in "abc":
+        cache.put(key, image)
+    assert cache.nbytes == 900
+    assert cache.get("a") is not None
+    cache.put("d", image)
+    assert len(cache) == 3 and cache.get("b") is None
+    assert all(cache.get(key) is not None for key in "acd")
+    cache.put("huge", Image.new("RGB", (100, 100)))
+    assert cache.get("huge") is None and cache.nbytes == 900
+
+    with_histograms = preview.PreviewCache(max_bytes=1000, histograms=True)
+    with_histograms.put("a", image, np.zeros(100, np.uint32))
+    assert with_histograms.nbytes == 700
+    assert with_histograms.get("a").histogram is not None
+
+
+def test_cached_previews_instant():
+    cache = preview.PreviewCache()
+    worker, delivered = make_worker(cache=cache)
+    frame = sierpinski_frame(0, 0.25)
+    frame.normalize()
+    settings = RenderSettings(32, 32, 1, 500, 300, 10)
+    try:
+        previews = wait_finished(delivered, worker.request(frame, settings))
+        assert len(cache) == 1
+        again = worker.request(frame, settings)
+        # Delivered by request itself, without waiting for the debounce
+        hit = delivered.get_nowait()
+        assert hit.generation == again and hit.finished
+        assert hit.image is previews[-1].image
+    finally:
+        worker.stop()
+
+
+def test_preview_rebinned():
+    from sulfurvision.cl import render
+
+    worker, delivered = make_worker(0.01, record_bytes=1 << 22)
+    renderer = worker.renderer
+    frame = sierpinski_frame(0, 0.25)
+    frame.normalize()
+    settings = RenderSettings(32, 32, 1, 256, 300, 10, generator=prng.PHILOX)
+    games = []
+    chaos_game_from = renderer.chaos_game_from
+    renderer.chaos_game_from = lambda *args: games.append(1) or chaos_game_from(*args)
+    try:
+        wait_finished(delivered, worker.request(frame, settings))
+        assert renderer.samples_fingerprint is not None
+        played = len(games)
+        frame.camera = frame.camera * np.array([2, 1, -0.25, 1, 2, -0.5])
+        frame.palette = frame.palette[::-1].copy()
+        previews = wait_finished(delivered, worker.request(frame, settings))
+        assert len(games) == played and len(previews) == 1
+    finally:
+        worker.stop()
+    fresh = render.Renderer(32, 32, 1, 256, 3, 3, generator=prng.PHILOX)
+    assert np.array_equal(
+        np.asarray(previews[0].image), np.asarray(fresh.render_frame(frame, 300, 10))
+    )
+
+
+def main():
+    test_progressive_preview()
+    test_debounce_and_cancel()
+    test_frame_key()
+    test_cache_evicts_least_recent()
+    test_cached_previews_instant()
+    test_preview_rebinned()
+
+
+if __name__ == "__main__":
+    main()
+
@@ -0,0 +1,82 @@
+from os import path
+
+import numpy as np
+
+from sulfurvision import prng
+from tests.test_batch import sierpinski_frame
+
+
+def test_philox_known_answers():
+    # From the Random123 known-answer tests
+    assert [int(word) for word in prng.philox4x32((0, 0, 0, 0), (0, 0))] == [
+        0x6627E8D5, 0xE169C58D, 0xBC57AC4C, 0x9B00DBD8
+    ]
+    counter = (0x243F6A88, 0x85A308D3, 0x13198A2E, 0x03707344)
+    assert [int(word) for word in prng.philox4x32(counter, (0xA4093822, 0x299F31D0))] == [
+        0xD16CFE09, 0x94FDCCEB, 0x5001E420, 0x24126EA1
+    ]
+
+
+def test_philox_matches_device():
+    import pyopencl as cl
+    import pyopencl.array as clarray
+    from pyopencl import cltypes
+
+    from sulfurvision.cl import render
+
+    render.Renderer._init_cl()
+    folder = path.join(path.dirname(prng.__file__), "cl")
+    srcs = []
+    for name in ("defines.cl", "util.cl"):
+        with open(path.join(folder, name), "r") as file:
+            srcs.append(file.read())
+    srcs.append(
+        """
+        __kernel void philox_test(__global uint4* out, const uint2 key, const uint iteration) {
+            uint id = get_global_id(0);
+            out[id] = philox4x32_10((uint4)(iteration, id, 0, 0), key);
+        }
+        """
+    )
+    program = cl.Program(render.Renderer._ctx, "\n".join(srcs)).build()
+    q = render.Renderer._queue
+    out = clarray.empty(q, 1000, cltypes.uint4)
+    key = (12345, 0xDEADBEEF)
+    program.philox_test(q, (1000,), None, out.data, cltypes.make_uint2(*key), np.uint32(77)).wait()
+    device = out.get()
+    host = prng.philox4x32((77, np.arange(1000), 0, 0), key)
+    for word, field in zip(host, "xyzw"):
+        assert np.array_equal(device[field], word)
+
+
+def test_philox_launches_are_stateless():
+    from sulfurvision.cl import render
+
+    frame = sierpinski_frame(0, 0.25)
+    frame.normalize()
+    renderer = render.Renderer(32, 32, 1, 64, 3, 3, generator=prng.PHILOX)
+    camera = renderer.histogram_camera(frame.camera)
+
+    def run(stream, splits):
+        renderer.reset()
+        renderer.stream = stream
+        renderer.randomize_particles()
+        done = 0
+        for iters in splits:
+            renderer.chaos_game_from(camera, frame.transforms, frame.palette, done, iters, 10)
+            done += iters
+        return renderer.histogram.get()
+
+    whole = run(3, [200])
+    assert np.array_equal(whole, run(3, [50, 120, 30]))
+    assert not np.array_equal(whole, run(4, [200]))
+
+
+def main():
+    test_philox_known_answers()
+    test_philox_matches_device()
+    test_philox_launches_are_stateless()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import json
+from os import path
+import tempfile
+
+import numpy as np
+
+from sulfurvision import batch
+from sulfurvision.cl import profiling
+from tests.test_batch import sample_project, sierpinski_frame
+
+
+def test_profiled_render():
+    from sulfurvision.cl import render
+
+    frame = sierpinski_frame(0, 0.25)
+    frame.normalize()
+    plain = render.Renderer(32, 32, 2, 64, 3, 3)
+    assert plain.profiler is None
+    profiled = render.Renderer(32, 32, 2, 64, 3, 3, profile=True)
+    assert profiled.profiler.last() is None
+
+    def run(renderer):
+        np.random.seed(7)
+        renderer.seed = 12345
+        camera = renderer.histogram_camera(frame.camera)
+        return np.asarray(renderer.render(camera, frame.transforms, frame.palette, 200, 10))
+
+    for _ in range(3):
+        # Profiling changes nothing about the result
+        assert np.array_equal(run(plain), run(profiled))
+
+    last = profiled.profiler.last()
+    for stage in (profiling.CHAOS_GAME, profiling.RESOLVE, profiling.TONEMAP, profiling.READBACK):
+        assert last[stage] > 0
+    assert last["total"] >= last[profiling.CHAOS_GAME]
+    stats = profiled.profiler.aggregates()
+    assert stats[profiling.CHAOS_GAME].count == 3
+    assert stats["total"].minimum <= stats["total"].mean <= stats["total"].maximum
+
+
+def test_unread_renders_bounded():
+    profiler = profiling.Profiler(window=2)
+    for render in range(10):
+        profiler.record(render, profiling.CHAOS_GAME, object())
+        profiler.record(render, profiling.READBACK, object())
+    # Renders nobody asked the timings of keep only the last window's events
+    assert [render for render, _ in profiler._complete] == [8, 9]
+
+
+def test_profile_cli():
+    with tempfile.TemporaryDirectory() as tmp:
+        project_path = path.join(tmp, "project.json")
+        with open(project_path, "w") as file:
+            file.write(sample_project().dump_json())
+        out_dir = path.join(tmp, "out")
+        assert batch.main([project_path, "-o", out_dir, "--profile", "-q"]) == 0
+        with open(path.join(out_dir, "summary.json")) as file:
+            summary = json.load(file)
+        # Overlapping frames are each attributed their own tonemap and readback
+        assert summary["stages"][profiling.READBACK]["count"] == summary["frames"]
+        assert summary["stages"][profiling.CHAOS_GAME]["mean"] > 0
+
+
+def main():
+    test_profiled_render()
+    test_unread_renders_bounded()
+    test_profile_cli()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import numpy as np
+
+from sulfurvision import pysulfur, variations
+from tests.test_batch import sierpinski_frame
+
+
+def unstable_frame():
+    """The Sierpinski gasket plus a rarely chosen transform that flings particles far out,
+    so that twice in a row sends them past the escape radius.
+    """
+    frame = sierpinski_frame(0, 0.25)
+    frame.transforms.append(
+        pysulfur.Transform(
+            variations.Variation.as_weights({variations.variation_linear.name: 1}),
+            variations.Variation.as_params({}),
+            np.array([1e6, 0, 0, 0, 1e6, 0]),
+            0.5,
+            0,
+        )
+    )
+    frame.normalize()
+    return frame
+
+
+def test_device_reseeds_escaped_particles():
+    from sulfurvision.cl import render
+
+    frame = unstable_frame()
+    renderer = render.Renderer(32, 32, 1, 1000, 3, 4, stats=True)
+    camera = renderer.histogram_camera(frame.camera)
+    renderer.render(camera, frame.transforms, frame.palette, 500, 20)
+    stats = renderer.last_stats
+    assert stats.reseeded > 0
+    assert stats.nonfinite <= stats.reseeded
+    assert 0 < stats.warmup <= pysulfur.RESEED_WARMUP * stats.reseeded
+    assert stats.samples == 1000 * 480
+    assert stats.plotted > 0
+    xy = renderer.particles.get()["xy"]
+    assert np.all(np.abs(xy["x"]) < pysulfur.ESCAPE_RADIUS)
+    assert np.all(np.abs(xy["y"]) < pysulfur.ESCAPE_RADIUS)
+
+
+def test_cpu_reseeds_escaped_particles():
+    frame = unstable_frame()
+    flame = pysulfur.Flame(frame.transforms, lambda color: np.ones(3))
+    states = [pysulfur.State(np.array((0.5, 0.5)), seed) for seed in range(50)]
+    grid = np.zeros((16, 16, 3))
+    reseeded = 0
+    for _ in range(200):
+        flame.iterate_step(states, grid)
+        reseeded += sum(state.warmup == pysulfur.RESEED_WARMUP for state in states)
+        assert not any(state.escaped() for state in states)
+    assert reseeded > 0
+    assert grid.sum() > 0
+
+
+def main():
+    test_device_reseeds_escaped_particles()
+    test_cpu_reseeds_escaped_particles()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import queue
+
+import numpy as np
+
+from sulfurvision import prng, preview
+from sulfurvision.batch import RenderSettings
+from tests.test_batch import sierpinski_frame
+
+
+def counting_renderer(*args, **kwargs):
+    from sulfurvision.cl import render
+
+    renderer = render.Renderer(*args, **kwargs)
+    renderer.games = 0
+    enqueue = renderer.enqueue_chaos_game
+
+    def enqueue_counted(*args, **kwargs):
+        renderer.games += 1
+        return enqueue(*args, **kwargs)
+
+    renderer.enqueue_chaos_game = enqueue_counted
+    return renderer
+
+
+def test_tonemap_only_rerender():
+    from sulfurvision.cl import render
+
+    frame = sierpinski_frame(0, 0.25)
+    frame.normalize()
+    renderer = counting_renderer(32, 32, 2, 500, 3, 3, generator=prng.PHILOX)
+    first = np.asarray(renderer.render_frame(frame, 200, 10, reuse=True))
+    assert renderer.games == 1 and renderer.histogram_fingerprint is not None
+
+    frame.gamma, frame.brightness = 0.5, 40
+    brighter = np.asarray(renderer.render_frame(frame, 200, 10, reuse=True))
+    assert renderer.games == 1
+    assert not np.array_equal(first, brighter)
+    fresh = render.Renderer(32, 32, 2, 500, 3, 3, generator=prng.PHILOX)
+    assert np.array_equal(brighter, np.asarray(fresh.render_frame(frame, 200, 10)))
+
+    # Anything else about the render runs the chaos game again
+    frame.palette[0] = np.array([10, 20, 30, 1.0])
+    renderer.render_frame(frame, 200, 10, reuse=True)
+    assert renderer.games == 2
+    renderer.render_frame(frame, 201, 10, reuse=True)
+    assert renderer.games == 3
+    renderer.stream = 1
+    renderer.render_frame(frame, 201, 10, reuse=True)
+    assert renderer.games == 4
+    # As does not asking for reuse, or anything else touching the histogram
+    renderer.render_frame(frame, 201, 10)
+    assert renderer.games == 5
+    renderer.reset()
+    assert renderer.histogram_fingerprint is None
+    renderer.render_frame(frame, 201, 10, reuse=True)
+    assert renderer.games == 6
+    renderer.update_to_match(16, 16, 2, 500, 3, 3)
+    assert renderer.histogram_fingerprint is None
+
+
+def test_preview_retonemapped():
+    delivered = queue.Queue()
+    renderer = counting_renderer(1, 1, 1, 1, 1, 1)
+    worker = preview.PreviewWorker(renderer, delivered.put, 0.01)
+    frame = sierpinski_frame(0, 0.25)
+    frame.normalize()
+    settings = RenderSettings(32, 32, 1, 500, 300, 10, generator=prng.PHILOX)
+    try:
+        generation = worker.request(frame, settings)
+        while not (last := delivered.get(timeout=30)).finished:
+            pass
+        assert last.generation == generation
+        games = renderer.games
+        retoned = frame * 1.0
+        retoned.gamma = 0.4
+        generation = worker.request(retoned, settings)
+        tweaked = delivered.get(timeout=30)
+        assert tweaked.generation == generation and tweaked.finished
+        assert renderer.games == games
+        assert not np.array_equal(np.asarray(tweaked.image), np.asarray(last.image))
+    finally:
+        worker.stop()
+
+
+def main():
+    test_tonemap_only_rerender()
+    test_preview_retonemapped()
+
+
+if __name__ == "__main__":
+    main()
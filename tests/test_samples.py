@@ -0,0 +1,93 @@
+from os import path
+import tempfile
+
+import numpy as np
+
+from sulfurvision import prng
+from tests.test_batch import sierpinski_frame
+from tests.test_reuse import counting_renderer
+
+
+def reframed(frame):
+    frame.camera = frame.camera * np.array([2, 1, -0.25, 1, 2, -0.5])
+    frame.palette = frame.palette[::-1].copy()
+    frame.symmetry = 3
+    return frame
+
+
+def test_rebin_matches_render():
+    from sulfurvision.cl import render
+
+    frame = sierpinski_frame(0, 0.25)
+    frame.normalize()
+    renderer = counting_renderer(32, 32, 2, 512, 3, 3, generator=prng.PHILOX)
+    renderer.record(1 << 22)
+    renderer.render_frame(frame, 200, 10)
+    assert renderer.recorded_all() and renderer.samples_fingerprint is not None
+    assert 0 < renderer.read_sample_count() <= 512 * 190
+
+    frame = reframed(frame)
+    rebinned = np.asarray(renderer.rebin_frame(frame))
+    fresh = render.Renderer(32, 32, 2, 512, 3, 3, generator=prng.PHILOX)
+    assert np.array_equal(rebinned, np.asarray(fresh.render_frame(frame, 200, 10)))
+    assert np.array_equal(renderer.histogram.get(), fresh.histogram.get())
+
+    # render with reuse rebins rather than running the chaos game
+    games = renderer.games
+    frame.vibrancy = 0.5
+    reused = np.asarray(renderer.render_frame(frame, 200, 10, reuse=True))
+    assert renderer.games == games
+    assert np.array_equal(reused, np.asarray(fresh.render_frame(frame, 200, 10)))
+    renderer.render_frame(frame, 201, 10, reuse=True)
+    assert renderer.games == games + 1
+
+
+def test_samples_overflow():
+    frame = sierpinski_frame(0, 0.25)
+    frame.normalize()
+    renderer = counting_renderer(16, 16, 1, 512, 3, 3, generator=prng.PHILOX)
+    renderer.record(1000 * 3 * 4)
+    renderer.render_frame(frame, 100, 10)
+    assert renderer.sample_capacity == 1000
+    assert renderer.read_sample_count() > 1000
+    assert not renderer.recorded_all() and renderer.samples_fingerprint is None
+    assert renderer.get_samples().shape == (1000, 3)
+    games = renderer.games
+    renderer.render_frame(reframed(frame), 100, 10, reuse=True)
+    assert renderer.games == games + 1
+
+    # A budget too small for one sample stops recording
+    renderer.record(0)
+    renderer.render_frame(frame, 100, 10)
+    assert not renderer.recorded_all()
+
+
+def test_save_load_samples():
+    from sulfurvision.cl import render
+
+    frame = sierpinski_frame(0, 0.25)
+    frame.normalize()
+    renderer = render.Renderer(32, 32, 1, 256, 3, 3, generator=prng.PHILOX)
+    renderer.record(1 << 20)
+    renderer.render_frame(frame, 50, 5)
+    samples = renderer.get_samples()
+    frame = reframed(frame)
+    expected = np.asarray(renderer.rebin_frame(frame))
+    other = render.Renderer(32, 32, 1, 16, 3, 3)
+    with tempfile.TemporaryDirectory() as tmp:
+        fpath = path.join(tmp, "samples.npy")
+        renderer.save_samples(fpath)
+        other.load_samples(fpath)
+    assert other.sample_capacity >= len(samples)
+    assert np.array_equal(other.get_samples(), samples)
+    assert np.array_equal(np.asarray(other.rebin_frame(frame)), expected)
+
+
+def main():
+    test_rebin_matches_render()
+    test_samples_overflow()
+    test_save_load_samples()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import asyncio
+
+from sulfurvision import service
+from sulfurvision.batch import RenderSettings
+
+from tests.test_batch import sierpinski_frame
+
+
+async def collect(messages, order, name, started=None):
+    async for message in messages:
+        if started is not None and message["status"] == "progress":
+            started.set()
+        if message["status"] in ("done", "error"):
+            order.append(name)
+            return message
+
+
+async def preempt_final_with_preview():
+    render_service = service.RenderService()
+    server = await render_service.serve(port=0)
+    port = server.sockets[0].getsockname()[1]
+    frame = sierpinski_frame(0, 0)
+    order = []
+    started = asyncio.Event()
+    try:
+        final = asyncio.create_task(
+            collect(
+                service.request_render(
+                    frame,
+                    RenderSettings(64, 64, 2, 256, 4000, 10),
+                    service.PRIORITY_FINAL,
+                    port=port,
+                    chunk_iters=50,
+                ),
+                order,
+                "final",
+                started,
+            )
+        )
+        await started.wait()
+        preview = await collect(
+            service.request_render(
+                frame,
+                RenderSettings(16, 16, 1, 64, 100, 10),
+                service.PRIORITY_PREVIEW,
+                port=port,
+            ),
+            order,
+            "preview",
+        )
+        final = await final
+    finally:
+        server.close()
+        await server.wait_closed()
+        await render_service.stop()
+    return order, preview, final
+
+
+def test_preview_preempts_final():
+    order, preview, final = asyncio.run(preempt_final_with_preview())
+    assert order == ["preview", "final"]
+    assert preview["status"] == "done" and final["status"] == "done"
+    assert service.decode_image(preview).size == (16, 16)
+    assert service.decode_image(final).size == (64, 64)
+
+
+async def until_finished(job):
+    while True:
+        message = await job.messages.get()
+        if message["status"] in ("done", "error"):
+            return message
+
+
+async def bad_job_then_good(devices=None):
+    render_service = service.RenderService(devices=devices)
+    bad_frame = sierpinski_frame(0, 0)
+    bad_frame.palette = bad_frame.palette[:0]
+    settings = RenderSettings(16, 16, 1, 64, 100, 10)
+    # Submitted before the service starts, they wait for it
+    bad = render_service.submit(bad_frame, settings, service.PRIORITY_PREVIEW)
+    good = render_service.submit(sierpinski_frame(0, 0), settings)
+    await render_service.start()
+    try:
+        return await until_finished(bad), await until_finished(good), len(render_service.workers)
+    finally:
+        await render_service.stop()
+
+
+def test_failed_job_leaves_service_running():
+    bad, good, _ = asyncio.run(bad_job_then_good())
+    assert bad["status"] == "error" and good["status"] == "done"
+    assert service.decode_image(good).size == (16, 16)
+
+
+def test_worker_per_device():
+    from sulfurvision.cl import bootstrap
+
+    device = bootstrap.all_devices()[0]
+    bad, good, workers = asyncio.run(bad_job_then_good([device, device]))
+    assert workers == 2
+    assert bad["status"] == "error" and good["status"] == "done"
+
+
+def main():
+    test_preview_preempts_final()
+    test_failed_job_leaves_service_running()
+    test_worker_per_device()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+from os import path
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+from sulfurvision import batch, sinks
+from tests.test_batch import sample_project
+
+
+def gradient_frames(n, w=8, h=6):
+    frames = []
+    for i in range(n):
+        arr = np.zeros((h, w, 3), np.uint8)
+        arr[..., 0] = np.arange(w) * 30
+        arr[..., 1] = np.arange(h)[:, None] * 40
+        arr[..., 2] = i * 50
+        frames.append(Image.fromarray(arr))
+    return frames
+
+
+def test_apng_roundtrip():
+    frames = gradient_frames(3)
+    with tempfile.TemporaryDirectory() as tmp:
+        fpath = path.join(tmp, "anim.apng")
+        with sinks.open_sink(fpath, 10) as sink:
+            for i, img in enumerate(frames):
+                sink.write(i, img)
+        with Image.open(fpath) as img:
+            assert img.n_frames == 3
+            for i, expected in enumerate(frames):
+                img.seek(i)
+                assert img.info["duration"] == 100
+                assert np.array_equal(np.asarray(img.convert("RGB")), np.asarray(expected))
+
+
+def test_y4m_and_raw():
+    frames = gradient_frames(2)
+    with tempfile.TemporaryDirectory() as tmp:
+        y4m_path = path.join(tmp, "anim.y4m")
+        raw_path = path.join(tmp, "anim.rgb")
+        with sinks.open_sink(y4m_path, 24) as y4m, sinks.open_sink(raw_path, 24) as raw:
+            for i, img in enumerate(frames):
+                y4m.write(i, img)
+                raw.write(i, img)
+        with open(y4m_path, "rb") as file:
+            data = file.read()
+        header, _, body = data.partition(b"\n")
+        assert header == b"YUV4MPEG2 W8 H6 F24:1 Ip A1:1 C444 XCOLORRANGE=FULL"
+        assert body.count(b"FRAME\n") == 2
+        assert len(body) == 2 * (len(b"FRAME\n") + 8 * 6 * 3)
+        assert path.getsize(raw_path) == 2 * 8 * 6 * 3
+
+
+def test_webp_limit():
+    frames = gradient_frames(3)
+    with tempfile.TemporaryDirectory() as tmp:
+        fpath = path.join(tmp, "anim.webp")
+        with sinks.WebPSink(fpath, 10, lossless=True) as sink:
+            for i, img in enumerate(frames):
+                sink.write(i, img)
+        with Image.open(fpath) as img:
+            assert img.n_frames == 3
+        # Room for about two of the three frames
+        limit = 2 * len(sink.encode(frames[0]))
+        sink = sinks.WebPSink(path.join(tmp, "long.webp"), 10, max_bytes=limit)
+        try:
+            for i, img in enumerate(frames):
+                sink.write(i, img)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("A WebP sequence outgrew its limit")
+        assert not sink.frames
+
+
+def test_render_cli_to_animation():
+    with tempfile.TemporaryDirectory() as tmp:
+        project_path = path.join(tmp, "project.json")
+        with open(project_path, "w") as file:
+            file.write(sample_project().dump_json())
+        out_path = path.join(tmp, "anim.apng")
+        assert batch.main([project_path, "-o", out_path, "-q"]) == 0
+        with Image.open(out_path) as img:
+            assert img.n_frames == 4
+            assert img.size == (32, 24)
+        assert path.exists(path.join(tmp, "anim.summary.json"))
+
+
+def main():
+    test_apng_roundtrip()
+    test_y4m_and_raw()
+    test_webp_limit()
+    test_render_cli_to_animation()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import json
+from os import path
+import tempfile
+
+import numpy as np
+
+from sulfurvision import batch
+from tests.test_batch import sample_project, sierpinski_frame
+
+
+def test_sample_counters():
+    from sulfurvision.cl import render
+
+    frame = sierpinski_frame(0, 0.25)
+    frame.normalize()
+    plain = render.Renderer(32, 32, 2, 1000, 3, 3)
+    counted = render.Renderer(32, 32, 2, 1000, 3, 3, stats=True)
+
+    def run(renderer, camera):
+        np.random.seed(7)
+        renderer.seed = 12345
+        camera = renderer.histogram_camera(camera)
+        return np.asarray(renderer.render(camera, frame.transforms, frame.palette, 200, 10))
+
+    # Counting changes nothing about the result
+    assert np.array_equal(run(plain, frame.camera), run(counted, frame.camera))
+    stats = counted.last_stats
+    assert stats.samples == 1000 * 190 and stats.plotted == stats.samples
+    assert stats.efficiency == 1
+    assert stats.selections.sum() == 1000 * 200
+    # The transforms are equally likely
+    assert np.all(np.abs(stats.selections / stats.selections.sum() - 1 / 3) < 0.01)
+
+    # Half the attractor is off to the right of the canvas
+    run(counted, np.array([1, 0, 0.5, 0, 1, 0]))
+    stats = counted.last_stats
+    assert 0.2 < stats.off_canvas / stats.samples < 0.8
+    assert stats.plotted + stats.off_canvas == 1000 * 190 and stats.nonfinite == 0
+    assert plain.last_stats is None
+
+
+def test_wasteful_frames_flagged():
+    project = sample_project()
+    project.frames[1].camera = np.array([1.0, 0, 5, 0, 1, 0])
+    with tempfile.TemporaryDirectory() as tmp:
+        project_path = path.join(tmp, "project.json")
+        with open(project_path, "w") as file:
+            file.write(project.dump_json())
+        out_dir = path.join(tmp, "out")
+        assert batch.main([project_path, "-o", out_dir, "--stats", "-q"]) == 0
+        with open(path.join(out_dir, "summary.json")) as file:
+            summary = json.load(file)
+        efficiencies = [timing["stats"]["efficiency"] for timing in summary["timings"]]
+        assert efficiencies[0] == 1 and efficiencies[-1] == 0
+        assert summary["wasteful_frames"][-1] == summary["timings"][-1]["index"]
+        assert 0 < summary["stats"]["efficiency"] < 1
+
+
+def main():
+    test_sample_counters()
+    test_wasteful_frames_flagged()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import numpy as np
+
+from sulfurvision import pysulfur
+from tests.test_batch import sierpinski_frame
+
+# Maps [-1, 1] squared onto the unit square, so that the gasket and its rotations all fit
+CENTERED = np.array([0.5, 0, 0.5, 0, 0.5, 0.5])
+
+
+def test_symmetry_affines():
+    affines = pysulfur.symmetry_affines(3, mirror=True)
+    assert len(affines) == 6
+    assert np.allclose(affines[0], [1, 0, 0, 0, 1, 0])
+    point = np.array([1.0, 0.0])
+    images = [pysulfur.affine_transform(point, affine) for affine in affines]
+    # Rotations by thirds of a turn, each followed by its reflection across the y axis
+    assert np.allclose(images[2], [-0.5, np.sqrt(3) / 2])
+    assert np.allclose(images[1], [-1, 0]) and np.allclose(images[3], [0.5, np.sqrt(3) / 2])
+
+
+def test_device_symmetry():
+    from sulfurvision.cl import render
+
+    frame = sierpinski_frame(0, 0.25)
+    frame.camera = CENTERED
+    frame.normalize()
+    renderer = render.Renderer(32, 32, 1, 1000, 3, 3, stats=True)
+    np.random.seed(5)
+    renderer.render_frame(frame, 200, 10)
+    single = renderer.histogram.get().reshape(32, 32, 4)
+    stats = renderer.last_stats
+
+    frame.symmetry = 2
+    np.random.seed(5)
+    renderer.seed = 12345
+    renderer.render_frame(frame, 200, 10)
+    double = renderer.histogram.get().reshape(32, 32, 4)
+    # Every point is plotted twice, for the cost of once
+    assert renderer.last_stats.samples == stats.samples
+    assert double[..., 3].sum() == 2 * single[..., 3].sum()
+    # The gasket sits in the top-right quarter; its half-turn lands in the bottom-left one
+    assert single[:16, :16, 3].sum() == 0 and double[:16, :16, 3].sum() > 0
+
+    frame.mirror = True
+    renderer.render_frame(frame, 200, 10)
+    assert renderer.histogram.get()[3::4].sum() == 4 * single[..., 3].sum()
+
+
+def test_cpu_symmetry():
+    frame = sierpinski_frame(0, 0.25)
+    frame.normalize()
+    counts = []
+    for symmetry in (1, 4):
+        flame = pysulfur.Flame(frame.transforms, lambda color: np.ones(1), CENTERED, symmetry)
+        grid = np.zeros((16, 16, 1))
+        states = [pysulfur.State(np.array((0.5, 0.5)), seed) for seed in range(20)]
+        flame.iterate_steps(states, grid, 50)
+        counts.append(grid)
+    assert counts[1].sum() == 4 * counts[0].sum()
+    assert counts[0][:8, :8].sum() == 0 and counts[1][:8, :8].sum() > 0
+
+
+def main():
+    test_symmetry_affines()
+    test_device_symmetry()
+    test_cpu_symmetry()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import numpy as np
+
+from sulfurvision import timeline, util
+from sulfurvision.frames import FrameLayout
+from tests.test_batch import sierpinski_frame
+
+
+def keyframes():
+    offsets = [0, 0.5, 0.1, 0.9, 0.3]
+    frames = [sierpinski_frame(0.5 * (i > 0), offset) for i, offset in enumerate(offsets)]
+    for i, frame in enumerate(frames):
+        frame.brightness = 10 + i
+        frame.transforms[1].probability = 1 + i
+    return frames
+
+
+def test_smoothstep_matches_spline_step():
+    frames = keyframes()
+    layout = FrameLayout.of(frames[0])
+    compiled = timeline.Timeline(frames)
+    pairs = []
+    t = 0
+    for frame in frames:
+        t += frame.time
+        pairs.append((frame, t))
+    times = np.linspace(-0.5, 2.5, 37)
+    packed = compiled.evaluate(times)
+    for t, row in zip(times, packed):
+        expected = layout.pack(util.spline_step(pairs, t))
+        assert np.allclose(row, expected)
+    for t, frame in zip(times, compiled.frames(times)):
+        expected = util.spline_step(pairs, t) * 1.0
+        expected.normalize()
+        assert np.allclose(layout.pack(frame), layout.pack(expected))
+        assert all(frame.transforms[0] is not key.transforms[0] for key in frames)
+
+
+def test_catmull_rom():
+    frames = keyframes()
+    layout = FrameLayout.of(frames[0])
+    compiled = timeline.Timeline(frames, timeline.CATMULL_ROM)
+    # Passes through every keyframe
+    for key, row in zip(frames, compiled.evaluate(compiled.times)):
+        assert np.allclose(row, layout.pack(key))
+    # Interior segments match util.catmull_rom on the neighbouring keyframes
+    t = 1.2
+    i = compiled.segment(t)
+    values = [layout.pack(frames[j]) for j in range(i - 1, i + 3)]
+    expected = util.catmull_rom(values, t, compiled.times[i - 1 : i + 3])
+    assert np.allclose(compiled.evaluate(t)[0], expected)
+    weights = timeline.catmull_rom_weights(
+        np.linspace(0, 2, 9), np.tile([-0.5, 0, 0.5, 1], (9, 1))
+    )
+    assert np.allclose(weights.sum(axis=1), 1)
+    # Overshoot is clamped
+    assert np.all(compiled.evaluate(np.linspace(0, 2, 101))[:, layout.brightness] >= 0)
+
+
+def test_layout_roundtrip():
+    frame = keyframes()[2]
+    layout = FrameLayout.of(frame)
+    copy = layout.unpack(layout.pack(frame))
+    assert np.array_equal(layout.pack(copy), layout.pack(frame))
+    assert copy.transforms[0].weights is not frame.transforms[0].weights
+
+
+def test_symmetry_held():
+    a, b = keyframes()[:2]
+    a.symmetry, b.symmetry, b.mirror = 3, 6, True
+    compiled = timeline.Timeline([a, b], timeline.CATMULL_ROM)
+    end = compiled.times[-1]
+    mid = compiled.frames([end * 0.5, end * 0.99, end])
+    assert [(frame.symmetry, frame.mirror) for frame in mid] == [(3, False), (3, False), (6, True)]
+
+
+def main():
+    test_smoothstep_matches_spline_step()
+    test_catmull_rom()
+    test_layout_roundtrip()
+    test_symmetry_held()
+
+
+if __name__ == "__main__":
+    main()